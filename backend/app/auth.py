@@ -1,6 +1,13 @@
+import asyncio
 import hashlib
+import logging
 import os
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -8,6 +15,8 @@ import bcrypt
 from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import update
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session, select
 
 from app.database import (
@@ -16,9 +25,12 @@ from app.database import (
     create_auth_session,
     engine,
     get_auth_session_by_token_hash,
+    read_engine,
     update_auth_session,
 )
 
+logger = logging.getLogger(__name__)
+
 # 配置
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-keep-it-secret")
 ALGORITHM = "HS256"
@@ -26,15 +38,103 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "3000
 AUTH_SESSION_COOKIE_NAME = os.getenv("AUTH_SESSION_COOKIE_NAME", "wegolibrary_session")
 AUTH_SESSION_TTL_SECONDS = int(os.getenv("AUTH_SESSION_TTL_SECONDS", str(30 * 24 * 60 * 60)))
 AUTH_SESSION_SAMESITE = os.getenv("AUTH_SESSION_SAMESITE", "lax").lower()
+# 滑动续期最小间隔：距上次写入 last_used_at 不足该秒数的请求不再写库
+AUTH_SESSION_REFRESH_INTERVAL_SECONDS = max(0, int(os.getenv("AUTH_SESSION_REFRESH_INTERVAL_SECONDS", "300")))
+# 已解析身份的缓存：条目有效期与容量上限（0 表示关闭缓存）。
+# 命中时不查询数据库：在其他 worker 上撤销登录会话、删除用户或修改管理员权限，
+# 最迟 AUTH_CACHE_TTL_SECONDS 秒后在本 worker 生效（本 worker 内的撤销与删除立即生效）
+AUTH_CACHE_TTL_SECONDS = max(0.0, float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60")))
+AUTH_CACHE_MAX_ENTRIES = max(0, int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000")))
+
+# bcrypt 成本因子；调整后已有哈希会在用户下次登录成功时按新成本重算
+BCRYPT_ROUNDS = min(31, max(4, int(os.getenv("BCRYPT_ROUNDS", "12"))))
+# 专用哈希线程数（bcrypt 计算期间释放 GIL），与 FastAPI 共享线程池隔离
+BCRYPT_WORKERS = max(1, int(os.getenv("BCRYPT_WORKERS", "2")))
+# 除正在计算的任务外最多排队的哈希任务数，超出直接返回 503
+BCRYPT_MAX_PENDING = max(0, int(os.getenv("BCRYPT_MAX_PENDING", "32")))
+BCRYPT_RETRY_AFTER_SECONDS = 2
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 
+@dataclass
+class _CachedIdentity:
+    user_id: int
+    # User 行的列值快照，命中时据此构造用户对象而不查询数据库
+    user_fields: dict
+    cached_at: float
+    # 登录会话（Cookie）专用字段；Bearer 令牌为 None
+    auth_session_id: Optional[int] = None
+    expires_at: Optional[datetime] = None
+    last_used_at: Optional[datetime] = None
+
+
+class _IdentityCache:
+    """令牌 -> 已解析身份的 LRU 缓存，条目超过 TTL 后回源数据库重新校验。"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _CachedIdentity]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_CachedIdentity]:
+        with self._lock:
+            identity = self._entries.get(key)
+            if identity is None:
+                return None
+            if time.monotonic() - identity.cached_at >= self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return identity
+
+    def put(self, key: str, identity: _CachedIdentity) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = identity
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in [key for key, identity in self._entries.items() if identity.user_id == user_id]:
+                del self._entries[key]
+
+
+_identity_cache = _IdentityCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+
+
+def _session_cache_key(token_hash: str) -> str:
+    return f"session:{token_hash}"
+
+
+def _bearer_cache_key(token: str) -> str:
+    return f"bearer:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+
+def forget_user_identities(user_id: int) -> None:
+    """用户被删除或需强制下线时清除其全部缓存身份"""
+    _identity_cache.discard_user(user_id)
+
+
 def get_session():
     with Session(engine) as session:
         yield session
 
 
+def get_read_session():
+    """只读 Session（GET 路由使用，走独立的只读连接池）"""
+    with Session(read_engine) as session:
+        yield session
+
+
 def verify_password(plain_password, hashed_password):
     if isinstance(plain_password, str):
         plain_password = plain_password.encode("utf-8")
@@ -46,7 +146,87 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     if isinstance(password, str):
         password = password.encode("utf-8")
-    return bcrypt.hashpw(password, bcrypt.gensalt()).decode("utf-8")
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """哈希的成本因子与当前 BCRYPT_ROUNDS 不一致时需要重算"""
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+
+class _PasswordHasher:
+    """
+    登录/注册的 bcrypt 计算放到独立的小线程池里，并限制排队长度：
+    登录高峰时多出的请求快速失败（503 + Retry-After），不占用处理其他接口的线程。
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._workers, thread_name_prefix="bcrypt"
+                    )
+        return self._executor
+
+    async def run(self, fn, *args, reject: bool = True):
+        """在哈希线程池中执行 fn；队列已满时 reject=True 抛 503，否则返回 None"""
+        if not self._slots.acquire(blocking=False):
+            if not reject:
+                return None
+            logger.warning("Password hashing queue is full, rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="登录请求过多，请稍后重试",
+                headers={"Retry-After": str(BCRYPT_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_password_hasher = _PasswordHasher(BCRYPT_WORKERS, BCRYPT_MAX_PENDING)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password) -> str:
+    return await _password_hasher.run(get_password_hash, password)
+
+
+async def rehash_password_if_needed(plain_password, hashed_password: str) -> Optional[str]:
+    """
+    成本因子变化后返回按新成本重算的哈希；无需重算或哈希队列繁忙时返回 None，
+    留待下次登录再尝试。
+    """
+    if not password_needs_rehash(hashed_password):
+        return None
+    return await _password_hasher.run(get_password_hash, plain_password, reject=False)
+
+
+def shutdown_password_hasher() -> None:
+    _password_hasher.shutdown()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -118,7 +298,9 @@ def revoke_auth_session_token(session: Session, raw_token: Optional[str]) -> boo
     if not raw_token:
         return False
 
-    auth_session = get_auth_session_by_token_hash(session, hash_auth_session_token(raw_token))
+    token_hash = hash_auth_session_token(raw_token)
+    _identity_cache.discard(_session_cache_key(token_hash))
+    auth_session = get_auth_session_by_token_hash(session, token_hash)
     if not auth_session or auth_session.revoked_at is not None:
         return False
 
@@ -127,7 +309,30 @@ def revoke_auth_session_token(session: Session, raw_token: Optional[str]) -> boo
     return True
 
 
+def _user_fields(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def _cached_user(identity: _CachedIdentity) -> User:
+    """
+    由快照构造脱离 Session 的用户对象（每个请求一份，互不影响）。
+    需要最新可变字段的路由（如授权链接解析）应按主键重新读取；
+    修改后 session.add 即按主键更新，只写入改动过的列。
+    """
+    user = User(**identity.user_fields)
+    make_transient_to_detached(user)
+    return user
+
+
 def _get_user_from_bearer_token(session: Session, token: str) -> Optional[User]:
+    cache_key = _bearer_cache_key(token)
+    identity = _identity_cache.get(cache_key)
+    if identity is not None:
+        if identity.expires_at is not None and identity.expires_at <= datetime.utcnow():
+            _identity_cache.discard(cache_key)
+            return None
+        return _cached_user(identity)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: Optional[str] = payload.get("sub")
@@ -136,7 +341,16 @@ def _get_user_from_bearer_token(session: Session, token: str) -> Optional[User]:
     except JWTError:
         return None
 
-    return session.exec(select(User).where(User.username == username)).first()
+    user = session.exec(select(User).where(User.username == username)).first()
+    if user is not None:
+        exp = payload.get("exp")
+        _identity_cache.put(cache_key, _CachedIdentity(
+            user_id=user.id,
+            user_fields=_user_fields(user),
+            cached_at=time.monotonic(),
+            expires_at=datetime.utcfromtimestamp(exp) if isinstance(exp, (int, float)) else None,
+        ))
+    return user
 
 
 def _get_user_from_auth_session(
@@ -163,18 +377,65 @@ def _get_user_from_auth_session(
     return user, auth_session
 
 
+def _refresh_due(last_used_at: Optional[datetime], now: datetime) -> bool:
+    return last_used_at is None or (now - last_used_at).total_seconds() >= AUTH_SESSION_REFRESH_INTERVAL_SECONDS
+
+
 def _refresh_auth_session(
     session: Session,
-    auth_session: AuthSession,
+    identity: _CachedIdentity,
     response: Response,
     request: Request,
     raw_token: str,
-):
+) -> bool:
+    """
+    滑动续期：距上次写入超过 AUTH_SESSION_REFRESH_INTERVAL_SECONDS 才更新 last_used_at/expires_at
+    并重发 Cookie，只读轮询不再每次写库。会话已被撤销（未更新任何行）时作废缓存并返回 False。
+    """
     now = datetime.now()
-    auth_session.last_used_at = now
-    auth_session.expires_at = _build_auth_session_expiry(now)
-    update_auth_session(session, auth_session)
+    if not _refresh_due(identity.last_used_at, now):
+        return True
+    expires_at = _build_auth_session_expiry(now)
+    result = session.execute(
+        update(AuthSession)
+        .where(AuthSession.id == identity.auth_session_id, AuthSession.revoked_at.is_(None))
+        .values(last_used_at=now, expires_at=expires_at)
+    )
+    session.commit()
+    if not result.rowcount:
+        _identity_cache.discard(_session_cache_key(hash_auth_session_token(raw_token)))
+        return False
+    identity.last_used_at = now
+    identity.expires_at = expires_at
     set_auth_session_cookie(response, raw_token, request)
+    return True
+
+
+def _resolve_auth_session(
+    session: Session,
+    raw_token: str,
+) -> tuple[Optional[User], Optional[_CachedIdentity]]:
+    token_hash = hash_auth_session_token(raw_token)
+    cache_key = _session_cache_key(token_hash)
+    identity = _identity_cache.get(cache_key)
+    if identity is not None:
+        if identity.expires_at is not None and identity.expires_at > datetime.now():
+            return _cached_user(identity), identity
+        _identity_cache.discard(cache_key)
+
+    user, auth_session = _get_user_from_auth_session(session, raw_token)
+    if user is None or auth_session is None:
+        return None, None
+    identity = _CachedIdentity(
+        user_id=user.id,
+        user_fields=_user_fields(user),
+        cached_at=time.monotonic(),
+        auth_session_id=auth_session.id,
+        expires_at=auth_session.expires_at,
+        last_used_at=auth_session.last_used_at,
+    )
+    _identity_cache.put(cache_key, identity)
+    return user, identity
 
 
 async def get_current_user(
@@ -192,10 +453,10 @@ async def get_current_user(
 
     session_token = request.cookies.get(AUTH_SESSION_COOKIE_NAME)
     if session_token:
-        user, auth_session = _get_user_from_auth_session(session, session_token)
-        if user is not None and auth_session is not None:
-            _refresh_auth_session(session, auth_session, response, request, session_token)
-            return user
+        user, identity = _resolve_auth_session(session, session_token)
+        if user is not None and identity is not None:
+            if _refresh_auth_session(session, identity, response, request, session_token):
+                return user
         clear_auth_session_cookie(response)
 
     raise credentials_exception
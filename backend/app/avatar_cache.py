@@ -0,0 +1,435 @@
+"""微信头像代理缓存：内存 + 磁盘两级 LRU，按上游 ETag/Last-Modified 重新验证，同一 URL 的并发未命中只回源一次。"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+from app.core import get_async_client
+
+logger = logging.getLogger(__name__)
+
+# 磁盘缓存目录（相对路径基于工作目录，与默认数据库同在 data/ 下）
+AVATAR_CACHE_DIR = os.getenv("AVATAR_CACHE_DIR", "data/avatar_cache")
+# 内存 / 磁盘缓存容量上限（字节）
+AVATAR_MEMORY_CACHE_BYTES = max(0, int(os.getenv("AVATAR_MEMORY_CACHE_BYTES", str(16 * 1024 * 1024))))
+AVATAR_DISK_CACHE_BYTES = max(0, int(os.getenv("AVATAR_DISK_CACHE_BYTES", str(256 * 1024 * 1024))))
+# 单张头像大小上限，超出视为异常响应
+AVATAR_MAX_BYTES = max(1, int(os.getenv("AVATAR_MAX_BYTES", str(2 * 1024 * 1024))))
+# 缓存新鲜期（秒）：期内直接命中，过期后带条件请求回源验证
+AVATAR_FRESH_SECONDS = max(0, int(os.getenv("AVATAR_FRESH_SECONDS", "3600")))
+# 从磁盘读出头像时每块的大小
+_CHUNK_SIZE = 64 * 1024
+
+_UPSTREAM_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 18_7 like Mac OS X) "
+        "AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 "
+        "MicroMessenger/8.0.67(0x18004239) NetType/WIFI Language/zh_CN"
+    ),
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+}
+
+
+class AvatarFetchError(Exception):
+    """上游头像获取失败且没有可用的旧缓存"""
+
+
+@dataclass
+class AvatarEntry:
+    key: str
+    content_type: str
+    size: int
+    # 返回给浏览器的 ETag（内容哈希），与上游校验值无关
+    etag: str
+    fetched_at: float
+    upstream_etag: Optional[str] = None
+    upstream_last_modified: Optional[str] = None
+    body: Optional[bytes] = field(default=None, repr=False)
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - self.fetched_at < AVATAR_FRESH_SECONDS
+
+    def meta(self) -> dict:
+        data = asdict(self)
+        data.pop("body")
+        return data
+
+
+def _cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class AvatarBody:
+    """
+    一次头像读取的响应内容，chunks 逐块产出图片数据。
+    etag 为内容哈希；边回源边返回时内容尚未下载完，etag 为 None。
+    不发送 chunks（如返回 304）时须调用 aclose 释放已打开的文件。
+    """
+    content_type: str
+    etag: Optional[str]
+    chunks: AsyncIterator[bytes]
+    _close: Optional[Callable[[], None]] = None
+
+    async def aclose(self) -> None:
+        await self.chunks.aclose()
+        if self._close is not None:
+            self._close()
+
+
+class AvatarCache:
+    def __init__(
+        self,
+        directory: str = AVATAR_CACHE_DIR,
+        memory_bytes: int = AVATAR_MEMORY_CACHE_BYTES,
+        disk_bytes: int = AVATAR_DISK_CACHE_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.memory_limit = memory_bytes
+        self.disk_limit = disk_bytes
+        self._memory: "OrderedDict[str, AvatarEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, AvatarEntry]" = OrderedDict()
+        self._disk_loaded = False
+        self._disk_loading: Optional[asyncio.Future] = None
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    # ---------- 磁盘层 ----------
+    # 文件读写与目录扫描在线程中执行；索引 _disk 只在事件循环中修改。
+    # 缓存目录可能被多个 worker 共用，容量按目录实际内容统一淘汰，各 worker 的索引只是元数据缓存，
+    # 文件可能随时被其他 worker 删除，读取时需处理文件缺失。
+
+    def body_path(self, key: str) -> Path:
+        return self.directory / f"{key}.img"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _scan_disk(self) -> list[AvatarEntry]:
+        """扫描缓存目录，按修改时间从旧到新返回条目（线程中执行）"""
+        if self.disk_limit <= 0 or not self.directory.is_dir():
+            return []
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            try:
+                data = json.loads(meta_path.read_text(encoding="utf-8"))
+                entry = AvatarEntry(**data)
+                if not self.body_path(entry.key).is_file():
+                    meta_path.unlink(missing_ok=True)
+                    continue
+                entries.append((meta_path.stat().st_mtime, entry))
+            except (OSError, ValueError, TypeError):
+                logger.warning(f"Dropping unreadable avatar cache entry {meta_path.name}")
+                meta_path.unlink(missing_ok=True)
+        return [entry for _mtime, entry in sorted(entries, key=lambda item: item[0])]
+
+    async def _ensure_disk_index(self) -> None:
+        """首次使用时扫描缓存目录，按修改时间恢复 LRU 顺序；并发调用共享同一次扫描"""
+        if self._disk_loaded:
+            return
+        if self._disk_loading is None:
+            self._disk_loading = asyncio.ensure_future(asyncio.to_thread(self._scan_disk))
+        try:
+            entries = await asyncio.shield(self._disk_loading)
+        except OSError as exc:
+            logger.warning(f"Avatar disk cache scan failed: {exc}")
+            entries = []
+        if self._disk_loaded:
+            return
+        self._disk_loaded = True
+        for entry in entries:
+            self._disk.setdefault(entry.key, entry)
+
+    def _open_tmp(self, key: str):
+        """打开回源时边下载边写入的临时文件（线程中执行）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.body_path(key).with_suffix(f".img.{os.getpid()}.tmp")
+        return tmp, open(tmp, "wb")
+
+    def _write_meta(self, entry: AvatarEntry) -> None:
+        tmp = self._meta_path(entry.key).with_suffix(f".json.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry.meta()), encoding="utf-8")
+        os.replace(tmp, self._meta_path(entry.key))
+
+    def _commit_files(self, entry: AvatarEntry, tmp: Path) -> None:
+        """下载完成：临时文件替换为正式文件后再写元数据，避免读到半截文件（线程中执行）"""
+        os.replace(tmp, self.body_path(entry.key))
+        self._write_meta(entry)
+
+    def _touch_files(self, entry: AvatarEntry) -> bool:
+        """重新验证通过：刷新图片文件的修改时间推迟其淘汰，并更新元数据（线程中执行）"""
+        try:
+            os.utime(self.body_path(entry.key))
+        except FileNotFoundError:
+            return False
+        self._write_meta(entry)
+        return True
+
+    def _trim_disk(self) -> list[str]:
+        """按目录中的实际文件（含其他 worker 写入的）从最旧的开始删除，直到不超过容量；返回被删除的 key（线程中执行）"""
+        files = []
+        for body_path in self.directory.glob("*.img"):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, body_path.stem))
+        total = sum(size for _mtime, size, _key in files)
+        evicted = []
+        for _mtime, size, key in sorted(files):
+            if total <= self.disk_limit:
+                break
+            self.body_path(key).unlink(missing_ok=True)
+            self._meta_path(key).unlink(missing_ok=True)
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def _index_disk(self, entry: AvatarEntry) -> None:
+        self._disk.pop(entry.key, None)
+        self._disk[entry.key] = AvatarEntry(**entry.meta())
+
+    async def _open_disk(self, entry: AvatarEntry) -> Optional[AvatarBody]:
+        """打开磁盘层条目的图片文件；文件已被淘汰时移出索引并返回 None。打开后即使被删除也能读完"""
+        try:
+            handle = await asyncio.to_thread(open, self.body_path(entry.key), "rb")
+        except OSError:
+            self._disk.pop(entry.key, None)
+            return None
+        return AvatarBody(entry.content_type, entry.etag, self._file_chunks(entry, handle), handle.close)
+
+    async def _file_chunks(self, entry: AvatarEntry, handle) -> AsyncIterator[bytes]:
+        """逐块读出图片；能放进内存层的读完后顺带放入内存层"""
+        keep = entry.size <= self.memory_limit
+        chunks = []
+        try:
+            while True:
+                chunk = await asyncio.to_thread(handle.read, _CHUNK_SIZE)
+                if not chunk:
+                    break
+                if keep:
+                    chunks.append(chunk)
+                yield chunk
+        finally:
+            handle.close()
+        if keep:
+            self._remember(replace(entry, body=b"".join(chunks)))
+
+    # ---------- 内存层 ----------
+
+    def _remember(self, entry: AvatarEntry) -> None:
+        if entry.body is None or entry.size > self.memory_limit:
+            return
+        previous = self._memory.pop(entry.key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.size
+        self._memory[entry.key] = entry
+        self._memory_bytes += entry.size
+        while self._memory and self._memory_bytes > self.memory_limit:
+            _key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    def _lookup(self, key: str) -> Optional[AvatarEntry]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            return entry
+        entry = self._disk.get(key)
+        if entry is not None:
+            self._disk.move_to_end(key)
+        return entry
+
+    # ---------- 回源 ----------
+
+    async def open(self, url: str) -> AvatarBody:
+        """
+        返回 URL 对应头像的响应内容：新鲜则直接从内存或磁盘读出，否则回源（带条件请求）。
+        发起回源的请求边下载边返回，同时写入缓存文件；同一 URL 的并发请求等待这次回源完成后从缓存读取。
+        调用方超时取消或客户端断开不会中断回源本身。
+        """
+        key = _cache_key(url)
+        await self._ensure_disk_index()
+        # 磁盘文件可能刚被（其他 worker）淘汰，此时条目已移出索引，再查找一次会转为回源
+        for _attempt in range(3):
+            entry = self._lookup(key)
+            if entry is not None and entry.is_fresh():
+                body = await self._open_entry(entry)
+                if body is not None:
+                    return body
+                continue
+
+            fill = self._inflight.get(key)
+            if fill is not None:
+                entry = await asyncio.shield(fill)
+                body = await self._open_entry(entry)
+                if body is not None:
+                    return body
+                continue
+
+            queue: asyncio.Queue = asyncio.Queue()
+            fill = asyncio.ensure_future(self._refresh(url, key, entry, queue))
+            self._inflight[key] = fill
+            fill.add_done_callback(lambda done: self._finish_refresh(key, done, queue))
+            content_type = await queue.get()
+            if content_type is not None:
+                return AvatarBody(content_type, None, self._stream_chunks(fill, queue))
+            # 没有新内容（上游 304 或回源失败退回旧缓存）：从缓存读取；回源失败且无旧缓存时抛出 AvatarFetchError
+            entry = await asyncio.shield(fill)
+            body = await self._open_entry(entry)
+            if body is not None:
+                return body
+        raise AvatarFetchError("头像获取失败")
+
+    async def _open_entry(self, entry: AvatarEntry) -> Optional[AvatarBody]:
+        if entry.body is not None:
+            return AvatarBody(entry.content_type, entry.etag, _single_chunk(entry.body))
+        return await self._open_disk(entry)
+
+    async def _stream_chunks(self, fill: asyncio.Future, queue: asyncio.Queue) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        # 下载中途失败（如超过大小上限）时中断响应，避免客户端把不完整的图片当作成功
+        if not fill.cancelled() and fill.exception() is not None:
+            raise fill.exception()
+
+    def _finish_refresh(self, key: str, task: asyncio.Task, queue: asyncio.Queue) -> None:
+        self._inflight.pop(key, None)
+        queue.put_nowait(None)
+        # 所有等待方都已超时离开时，取走异常以免事件循环报告 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    async def _refresh(
+        self,
+        url: str,
+        key: str,
+        stale: Optional[AvatarEntry],
+        queue: asyncio.Queue,
+    ) -> AvatarEntry:
+        """
+        回源：上游返回新内容时先把 content-type 放入 queue，随后逐块放入数据，结束由 _finish_refresh 放入 None；
+        同时边下载边写入临时文件，完成后替换为缓存文件。
+        """
+        headers = dict(_UPSTREAM_HEADERS)
+        if stale is not None:
+            if stale.upstream_etag:
+                headers["If-None-Match"] = stale.upstream_etag
+            if stale.upstream_last_modified:
+                headers["If-Modified-Since"] = stale.upstream_last_modified
+
+        streaming = False
+        tmp: Optional[Path] = None
+        handle = None
+        try:
+            async with get_async_client().stream("GET", url, headers=headers, timeout=15) as upstream:
+                if upstream.status_code == 304 and stale is not None:
+                    stale.fetched_at = time.time()
+                    await self._revalidated(stale)
+                    return stale
+                upstream.raise_for_status()
+                content_type = upstream.headers.get("content-type") or "application/octet-stream"
+                if not content_type.startswith("image/"):
+                    raise AvatarFetchError("头像响应不是图片")
+                if self.disk_limit > 0:
+                    try:
+                        tmp, handle = await asyncio.to_thread(self._open_tmp, key)
+                    except OSError as exc:
+                        logger.warning(f"Avatar disk cache write failed: {exc}")
+                digest = hashlib.sha1()
+                chunks = []
+                received = 0
+                async for chunk in upstream.aiter_bytes():
+                    received += len(chunk)
+                    if received > AVATAR_MAX_BYTES:
+                        raise AvatarFetchError("头像过大")
+                    if not streaming:
+                        streaming = True
+                        queue.put_nowait(content_type)
+                    queue.put_nowait(chunk)
+                    digest.update(chunk)
+                    if received <= self.memory_limit:
+                        chunks.append(chunk)
+                    if handle is not None:
+                        try:
+                            await asyncio.to_thread(handle.write, chunk)
+                        except OSError as exc:
+                            logger.warning(f"Avatar disk cache write failed: {exc}")
+                            await asyncio.to_thread(_discard, tmp, handle)
+                            tmp = handle = None
+                if not streaming:
+                    queue.put_nowait(content_type)
+                upstream_etag = upstream.headers.get("etag")
+                upstream_last_modified = upstream.headers.get("last-modified")
+        except Exception as exc:
+            if handle is not None:
+                await asyncio.to_thread(_discard, tmp, handle)
+            if stale is not None and not streaming:
+                logger.warning(f"Avatar refresh failed, serving stale copy: {exc}")
+                return stale
+            if isinstance(exc, AvatarFetchError):
+                raise
+            raise AvatarFetchError("头像获取失败") from exc
+
+        entry = AvatarEntry(
+            key=key,
+            content_type=content_type,
+            size=received,
+            etag=f'"{digest.hexdigest()[:20]}"',
+            fetched_at=time.time(),
+            upstream_etag=upstream_etag,
+            upstream_last_modified=upstream_last_modified,
+            body=b"".join(chunks) if received <= self.memory_limit else None,
+        )
+        self._remember(entry)
+        if handle is not None:
+            await self._store_disk(entry, tmp, handle)
+        return entry
+
+    async def _revalidated(self, entry: AvatarEntry) -> None:
+        try:
+            if await asyncio.to_thread(self._touch_files, entry):
+                self._index_disk(entry)
+        except OSError as exc:
+            logger.warning(f"Avatar disk cache write failed: {exc}")
+
+    async def _store_disk(self, entry: AvatarEntry, tmp: Path, handle) -> None:
+        try:
+            await asyncio.to_thread(handle.close)
+            if entry.size > self.disk_limit:
+                await asyncio.to_thread(_discard, tmp, handle)
+                return
+            await asyncio.to_thread(self._commit_files, entry, tmp)
+            self._index_disk(entry)
+            evicted = await asyncio.to_thread(self._trim_disk)
+        except OSError as exc:
+            logger.warning(f"Avatar disk cache write failed: {exc}")
+            await asyncio.to_thread(_discard, tmp, handle)
+            return
+        for key in evicted:
+            self._disk.pop(key, None)
+
+
+async def _single_chunk(body: bytes) -> AsyncIterator[bytes]:
+    yield body
+
+
+def _discard(tmp: Optional[Path], handle) -> None:
+    handle.close()
+    if tmp is not None:
+        tmp.unlink(missing_ok=True)
+
+
+avatar_cache = AvatarCache()
@@ -1,20 +1,146 @@
 import requests
+import httpx
+import asyncio
 import json
+import os
 import time
 import random
 import logging
 import base64
+import threading
+import weakref
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, Mapping, Union
 from Crypto.Cipher import PKCS1_v1_5 as Cipher_pksc1_v1_5
 from Crypto.PublicKey import RSA
 
+from app.http_pool import POOL_IDLE_SECONDS, get_traceint_http
 from app.traceint_client import normalize_checkin_session_id
+from app.retry_policy import CHECKIN_RETRY, KEEPALIVE_RETRY, is_connect_error, is_transient_error
+from app.upstream_governor import is_upstream_failure, traceint_governor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 异步客户端连接池上限（单个事件循环内所有用户共享）
+ASYNC_MAX_CONNECTIONS = max(1, int(os.getenv("TRACEINT_ASYNC_MAX_CONNECTIONS", "100")))
+ASYNC_MAX_KEEPALIVE = max(1, int(os.getenv("TRACEINT_ASYNC_MAX_KEEPALIVE", "20")))
+# 签到方式：classic 每次先请求 getTime 再签到；prearmed 用已知的服务器时钟偏移预先生成载荷，
+# 到点只发一次 sign.html（没有可用的偏移样本时自动退回 classic）
+CHECKIN_MODE = os.getenv("CHECKIN_MODE", "classic").strip().lower()
+# 服务器时钟偏移样本的有效期
+SERVER_CLOCK_MAX_AGE_SEC = max(1.0, float(os.getenv("TRACEINT_CLOCK_MAX_AGE_SEC", "1800")))
+
+
+class ServerClock:
+    """根据 getTime.html 的响应跟踪 Traceint 服务器与本机的时钟偏移。"""
+
+    def __init__(self, max_age_sec: float = SERVER_CLOCK_MAX_AGE_SEC):
+        self.max_age_sec = max_age_sec
+        self._lock = threading.Lock()
+        self._offset: Optional[float] = None
+        self._scale = 1
+        self._rtt: Optional[float] = None
+        self._observed_at: Optional[float] = None
+
+    def observe(self, text: str, sent_at: float, received_at: float) -> bool:
+        """记录一次 getTime 响应；sent_at / received_at 为本机 time.time()。"""
+        raw = (text or "").strip()
+        if not raw.isdigit():
+            return False
+        # 13 位为毫秒时间戳，10 位为秒
+        scale = 1000 if len(raw) >= 13 else 1
+        rtt = max(0.0, received_at - sent_at)
+        offset = int(raw) / scale - (sent_at + received_at) / 2
+        now = time.monotonic()
+        with self._lock:
+            fresh = self._observed_at is not None and now - self._observed_at <= self.max_age_sec
+            # 往返时间越短，偏移估计越准；旧样本仍新鲜时只接受 RTT 相近或更优的样本
+            if fresh and self._rtt is not None and rtt > self._rtt * 1.5 + 0.05:
+                return False
+            self._offset = offset
+            self._scale = scale
+            self._rtt = rtt
+            self._observed_at = now
+        return True
+
+    def is_fresh(self) -> bool:
+        with self._lock:
+            return self._observed_at is not None and time.monotonic() - self._observed_at <= self.max_age_sec
+
+    def estimate(self, at: Optional[float] = None) -> Optional[str]:
+        """估算本机时间 at 对应的服务器时间戳（与 getTime 响应同格式）；无可用样本返回 None。"""
+        if not self.is_fresh():
+            return None
+        at = time.time() if at is None else at
+        with self._lock:
+            return str(int((at + self._offset) * self._scale))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "offset_sec": self._offset,
+                "rtt_ms": self._rtt * 1000 if self._rtt is not None else None,
+                "age_sec": time.monotonic() - self._observed_at if self._observed_at else None,
+            }
+
+
+SERVER_CLOCK = ServerClock()
+
+# 最近的签到耗时样本（毫秒），按 classic / prearmed 分开统计便于对比
+_CHECKIN_LATENCY_SAMPLES: dict[str, deque] = {
+    "classic": deque(maxlen=200),
+    "prearmed": deque(maxlen=200),
+}
+
+
+def record_checkin_latency(mode: str, latency_ms: float) -> None:
+    _CHECKIN_LATENCY_SAMPLES.setdefault(mode, deque(maxlen=200)).append(latency_ms)
+    logger.info(f"Check-in latency mode={mode}: {latency_ms:.0f} ms")
+
+
+def checkin_latency_summary() -> dict[str, dict]:
+    """各签到方式的耗时统计（样本数、平均值、p50、p95，单位毫秒）"""
+    summary: dict[str, dict] = {}
+    for mode, samples in _CHECKIN_LATENCY_SAMPLES.items():
+        values = sorted(samples)
+        if not values:
+            continue
+        summary[mode] = {
+            "count": len(values),
+            "avg_ms": sum(values) / len(values),
+            "p50_ms": values[len(values) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+        }
+    return summary
+
+
+@dataclass
+class PreparedSignIn:
+    """预先生成的签到载荷：到点后只需一次 sign.html POST。"""
+    payload: dict
+    target_time: float
+    clock_source: str
+    prepared_at: float
+
+
+@lru_cache(maxsize=1)
+def _public_key() -> RSA.RsaKey:
+    key = '-----BEGIN PUBLIC KEY-----\n' + WegolibCore.PUBLIC_KEY_STR + '\n-----END PUBLIC KEY-----'
+    return RSA.importKey(key)
+
+
+def _sign_retryable(step: str, exc: BaseException) -> bool:
+    """getTime 失败可以重试；sign.html 只在请求确定没有发出时重试，避免重复提交签到"""
+    if step == "getTime":
+        return is_transient_error(exc)
+    return is_connect_error(exc)
+
+
 class WegolibCore:
     PUBLIC_KEY_STR = 'MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA0dmmkW4xPa+HhBTyaa0dgAb0fVZRS67jK4y15BQthjJ/ZuUZQmrbGqhG7rwnxfm7g+nFH9zEyRU5KLX3ty9jpNrPjyg7FBF9OvBDYHEt83b77W3mfBjpmoTJOt27E7RZ4InHqJQjqSEo4bw1PDz2OBmtlNIlXMu0VA8I0Bh39hBBnm0oouRV7FdqEzAp8nsF7a3VuBYpx9xek+cRVip0pMXI1AXM6bmyWWNzV0oikQW4ZIbutgDziTMeW28zl/hRbW9Ht34w0sWYyxumuLr1qweW3qnxycn3zn47weFYe6nJp71z+lgVtNTGtowNPPqBLXqusvwf+uNhSy1wKQFpUwIDAQAB'
     
@@ -37,8 +163,8 @@ class WegolibCore:
             'Referer': self.MINIPROGRAM_REFERER,
             'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 18_7 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 MicroMessenger/8.0.67(0x18004239) NetType/WIFI Language/zh_CN',
         }
-        self.session = requests.Session()
-        self.session.headers.update(self._base_headers)
+        # 所有请求复用进程级共享连接池，避免每次调用重新握手 TCP/TLS
+        self.http = get_traceint_http()
 
     def _extract_wechat_sess_id(self) -> Optional[str]:
         for part in self.session_id.split(';'):
@@ -60,11 +186,11 @@ class WegolibCore:
             headers['Cookie'] = self.session_id
         return headers
 
-    def _update_cookie(self, new_cookies: requests.cookies.RequestsCookieJar):
+    def _update_cookie(self, new_cookies: Union[requests.cookies.RequestsCookieJar, Mapping[str, str]]):
         """Update internal session ID from response cookies"""
         if not new_cookies:
             return
-            
+
         current_dict: dict[str, str] = {}
         if self.session_id:
             for part in self.session_id.split(';'):
@@ -73,7 +199,10 @@ class WegolibCore:
                     if k != 'Authorization':
                         current_dict[k] = v
         
-        new_dict = new_cookies.get_dict()
+        if hasattr(new_cookies, 'get_dict'):
+            new_dict = new_cookies.get_dict()
+        else:
+            new_dict = dict(new_cookies)
         for key, value in new_dict.items():
             if key != 'Authorization':
                 current_dict[key] = value
@@ -89,9 +218,10 @@ class WegolibCore:
             
         return self.session_id
 
-    def keep_alive(self) -> dict:
+    def keep_alive(self, delay: bool = True) -> dict:
         """
         Execute keep-alive logic using devices.html
+        delay=False 时跳过模拟的随机延迟（用户等待中的在线校验使用）。
         """
         result = {
             "success": False,
@@ -106,31 +236,22 @@ class WegolibCore:
                 return result
 
             # Simulate delay
-            time.sleep(random.uniform(0.5, 1.5))
+            if delay:
+                time.sleep(random.uniform(0.5, 1.5))
             
             # Post to devices.html（仅带 wechatSESS_ID Cookie，与 FuckLib 一致）
-            r = requests.post(
-                self.DEVICES_URL,
-                data={'t': sess_id_val},
-                headers=self._wxapp_headers(with_cookie=True),
-                timeout=10,
-            )
-            r.raise_for_status()
-            
-            # Update cookie
-            old_session_id = self.session_id
-            new_cookie = self._update_cookie(r.cookies)
-            if new_cookie and new_cookie != old_session_id:
-                result["new_session_id"] = new_cookie
-
-            data = r.json()
-            if data.get('code') == 0:
-                result["success"] = True
-                result["message"] = "Session renewed successfully"
-                logger.info("Keep-alive success")
-            else:
-                result["message"] = f"Server returned error: {data}"
-                logger.warning(f"Keep-alive failed: {data}")
+            def _post_devices(remaining: float) -> requests.Response:
+                r = self.http.post(
+                    self.DEVICES_URL,
+                    data={'t': sess_id_val},
+                    headers=self._wxapp_headers(with_cookie=True),
+                    timeout=min(10, remaining),
+                )
+                r.raise_for_status()
+                return r
+
+            r = KEEPALIVE_RETRY.call(_post_devices)
+            self._apply_keep_alive_response(result, r.cookies, r.json())
 
         except Exception as e:
             result["message"] = f"Request failed: {str(e)}"
@@ -138,76 +259,377 @@ class WegolibCore:
             
         return result
 
+    def _apply_keep_alive_response(self, result: dict, cookies, data: dict) -> None:
+        # Update cookie
+        old_session_id = self.session_id
+        new_cookie = self._update_cookie(cookies)
+        if new_cookie and new_cookie != old_session_id:
+            result["new_session_id"] = new_cookie
+
+        if data.get('code') == 0:
+            result["success"] = True
+            result["message"] = "Session renewed successfully"
+            logger.info("Keep-alive success")
+        else:
+            result["message"] = f"Server returned error: {data}"
+            logger.warning(f"Keep-alive failed: {data}")
+
     def _encrypt(self, password: str) -> str:
-        key = '-----BEGIN PUBLIC KEY-----\n' + self.PUBLIC_KEY_STR + '\n-----END PUBLIC KEY-----'
-        rsakey = RSA.importKey(key)
-        cipher = Cipher_pksc1_v1_5.new(rsakey)
+        # 公钥只解析一次；cipher 对象很轻量，按次创建以保证线程安全
+        cipher = Cipher_pksc1_v1_5.new(_public_key())
         cipher_text = base64.b64encode(cipher.encrypt(password.encode()))
         return cipher_text.decode()
 
-    def sign_in(self, major: int, minor: int) -> dict:
+    def sign_in(self, major: int, minor: int, prearmed: Optional[bool] = None) -> dict:
         """
         Execute Bluetooth check-in
+        prearmed=None 时按 CHECKIN_MODE 选择方式；结果中的 latency_ms 为本次签到关键路径耗时。
         """
+        if prearmed is None:
+            prearmed = CHECKIN_MODE == "prearmed"
+        if prearmed:
+            started = time.monotonic()
+            try:
+                prepared = self.prepare_sign_in(major, minor)
+            except Exception as e:
+                logger.error(f"Sign-in exception: {e}")
+                return {"success": False, "message": f"签到异常: {str(e)}"}
+            if prepared is None:
+                return {"success": False, "message": "Invalid Cookie: wechatSESS_ID not found"}
+            # 载荷由时钟偏移生成时关键路径只有 sign.html；刚请求过 getTime 则其往返也计入
+            return self.submit_sign_in(
+                prepared,
+                started=None if prepared.clock_source == "offset" else started,
+            )
+
         result = {
             "success": False,
             "message": ""
         }
         
+        started = time.monotonic()
         try:
             sign_headers = self._wxapp_headers(with_cookie=False)
+            stage = {"step": ""}
+
+            def _attempt(remaining: float) -> Optional[requests.Response]:
+                # 1. Get Time（签到接口不传 Cookie，凭据走 POST body 的 t 字段）
+                stage["step"] = "getTime"
+                timestamp = self._fetch_server_time(min(10, remaining))
 
-            # 1. Get Time（签到接口不传 Cookie，凭据走 POST body 的 t 字段）
-            r_time = requests.get(self.GET_TIME_URL, headers=sign_headers, timeout=10)
-            r_time.raise_for_status()
-            timestamp = r_time.text
+                # 2-3. Encrypt Time & Prepare Data
+                payload = self._build_sign_payload(timestamp, major, minor)
+                if payload is None:
+                    return None
+
+                # 4. Post Sign
+                stage["step"] = "sign"
+                return self.http.post(self.SIGN_URL, data=payload, headers=sign_headers, timeout=min(15, remaining))
+
+            r = CHECKIN_RETRY.call(_attempt, retryable=lambda exc: _sign_retryable(stage["step"], exc))
+            if r is None:
+                result["message"] = "Invalid Cookie: wechatSESS_ID not found"
+                return result
             
-            # 2. Encrypt Time
-            password = self._encrypt(timestamp)
+            try:
+                data = r.json()
+            except:
+                data = {"msg": r.text, "code": r.status_code}
+            self._apply_sign_response(result, data)
+                
+        except Exception as e:
+            result["message"] = f"签到异常: {str(e)}"
+            logger.error(f"Sign-in exception: {e}")
             
-            # 3. Prepare Data
+        self._finish_latency(result, "classic", started)
+        return result
+
+    def _fetch_server_time(self, timeout: float = 10) -> str:
+        """请求 getTime.html，并顺带更新服务器时钟偏移样本"""
+        sent_at = time.time()
+        r_time = self.http.get(self.GET_TIME_URL, headers=self._wxapp_headers(with_cookie=False), timeout=timeout)
+        r_time.raise_for_status()
+        SERVER_CLOCK.observe(r_time.text, sent_at, time.time())
+        return r_time.text
+
+    def refresh_server_clock(self) -> bool:
+        """请求一次 getTime.html 更新服务器时钟偏移样本"""
+        self._fetch_server_time()
+        return SERVER_CLOCK.is_fresh()
+
+    def prepare_sign_in(self, major: int, minor: int, at: Optional[float] = None) -> Optional[PreparedSignIn]:
+        """
+        预先生成签到载荷。at 为计划签到的本机时间（time.time()），默认立即。
+        有新鲜的时钟偏移样本时不发任何请求；否则先请求一次 getTime。
+        """
+        target = time.time() if at is None else at
+        timestamp = SERVER_CLOCK.estimate(target)
+        clock_source = "offset"
+        if timestamp is None:
+            raw = CHECKIN_RETRY.call(lambda remaining: self._fetch_server_time(min(10, remaining)))
+            timestamp = SERVER_CLOCK.estimate(target) if at is not None else None
+            clock_source = "getTime"
+            if timestamp is None:
+                # 立即签到或响应无法解析为时间戳时，直接使用服务器原文
+                timestamp = raw
+        payload = self._build_sign_payload(timestamp, major, minor)
+        if payload is None:
+            return None
+        return PreparedSignIn(
+            payload=payload,
+            target_time=target,
+            clock_source=clock_source,
+            prepared_at=time.time(),
+        )
+
+    def submit_sign_in(self, prepared: PreparedSignIn, started: Optional[float] = None) -> dict:
+        """发送预先生成的签到载荷（只有一次 sign.html POST）"""
+        result = {
+            "success": False,
+            "message": ""
+        }
+        started = time.monotonic() if started is None else started
+        try:
+            # 载荷已按计划时间加密，只在请求确定未发出时重试
+            r = CHECKIN_RETRY.call(
+                lambda remaining: self.http.post(
+                    self.SIGN_URL,
+                    data=prepared.payload,
+                    headers=self._wxapp_headers(with_cookie=False),
+                    timeout=min(15, remaining),
+                ),
+                retryable=is_connect_error,
+            )
+            try:
+                data = r.json()
+            except ValueError:
+                data = {"msg": r.text, "code": r.status_code}
+            self._apply_sign_response(result, data)
+        except Exception as e:
+            result["message"] = f"签到异常: {str(e)}"
+            logger.error(f"Sign-in exception: {e}")
+
+        mode = "prearmed" if prepared.clock_source == "offset" else "classic"
+        self._finish_latency(result, mode, started)
+        return result
+
+    @staticmethod
+    def _finish_latency(result: dict, mode: str, started: float) -> None:
+        latency_ms = (time.monotonic() - started) * 1000
+        result["latency_ms"] = round(latency_ms, 1)
+        record_checkin_latency(mode, latency_ms)
+
+    def _build_sign_payload(self, timestamp: str, major: int, minor: int) -> Optional[dict]:
+        password = self._encrypt(timestamp)
+
+        sess_id_val = self._extract_wechat_sess_id()
+        if not sess_id_val:
+            return None
+
+        device_info = [{
+            "minor": int(minor),
+            "rssi": -random.randint(60, 80),
+            "major": int(major),
+            "proximity": 2,
+            "accuracy": random.uniform(1.0, 5.0),
+            "uuid": "fda50693-a4e2-4fb1-afcf-c6eb07647825"
+        }]
+        
+        return {
+            't': sess_id_val,
+            'devices': json.dumps(device_info),
+            'pass': password
+        }
+
+    @staticmethod
+    def _apply_sign_response(result: dict, data: dict) -> None:
+        code = data.get('code')
+        msg = data.get('msg') or data.get('message') or str(data)
+        
+        if str(code) in ['0', '200']:
+            result["success"] = True
+            final_msg = msg
+            if final_msg == "扫码成功":
+                final_msg = "到馆验证成功"
+            result["message"] = f"签到成功：{final_msg}"
+        else:
+            result["message"] = f"签到失败: {msg}"
+
+
+# 每个事件循环一个共享的 AsyncClient（httpx 连接池不能跨事件循环使用）
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+class _GovernedTransport(httpx.AsyncBaseTransport):
+    """异步请求同样经过进程级出站限速与熔断（与同步连接池共用同一组令牌桶和熔断器）"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        permit = await traceint_governor.acquire_async(str(request.url))
+        # None 表示没有得到上游结果（本地取消、路由截止时间、客户端断开等），不计入熔断统计
+        ok: Optional[bool] = None
+        try:
+            response = await self._transport.handle_async_request(request)
+            ok = not is_upstream_failure(response.status_code)
+            return response
+        except httpx.TransportError:
+            ok = False
+            raise
+        finally:
+            # 取消（CancelledError 不是 Exception）同样要归还半开探测名额，否则熔断器会一直停在半开状态
+            if permit:
+                if ok is None:
+                    permit.cancel()
+                else:
+                    permit.finish(ok)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def new_async_client(max_connections: Optional[int] = None) -> httpx.AsyncClient:
+    """创建 Traceint 异步客户端；调用方负责关闭。"""
+    limits = httpx.Limits(
+        max_connections=max_connections or ASYNC_MAX_CONNECTIONS,
+        max_keepalive_connections=ASYNC_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_IDLE_SECONDS or None,
+    )
+    return httpx.AsyncClient(
+        transport=_GovernedTransport(httpx.AsyncHTTPTransport(limits=limits)),
+        timeout=httpx.Timeout(15.0, connect=10.0),
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取当前事件循环共享的 AsyncClient（FastAPI 路由使用）。"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = new_async_client()
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client() -> None:
+    """关闭当前事件循环的共享 AsyncClient（应用关闭时调用）。"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+class AsyncWegolibCore(WegolibCore):
+    """
+    WegolibCore 的 asyncio 版本：devices.html / getTime.html / sign.html 流程相同，
+    返回的结果字典与同步版本一致，单个事件循环即可承载大量并发会话。
+    """
+
+    def __init__(self, session_id: str, client: Optional[httpx.AsyncClient] = None):
+        super().__init__(session_id)
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_async_client()
+
+    async def keep_alive(self, delay: bool = True) -> dict:
+        """
+        Execute keep-alive logic using devices.html
+        delay=False 时跳过模拟的随机延迟（用户等待中的在线校验使用）。
+        """
+        result = {
+            "success": False,
+            "message": "",
+            "new_session_id": None
+        }
+        
+        try:
             sess_id_val = self._extract_wechat_sess_id()
             if not sess_id_val:
                 result["message"] = "Invalid Cookie: wechatSESS_ID not found"
                 return result
 
-            device_info = [{
-                "minor": int(minor),
-                "rssi": -random.randint(60, 80),
-                "major": int(major),
-                "proximity": 2,
-                "accuracy": random.uniform(1.0, 5.0),
-                "uuid": "fda50693-a4e2-4fb1-afcf-c6eb07647825"
-            }]
-            
-            payload = {
-                't': sess_id_val,
-                'devices': json.dumps(device_info),
-                'pass': password
-            }
+            # Simulate delay
+            if delay:
+                await asyncio.sleep(random.uniform(0.5, 1.5))
+
+            async def _post_devices(remaining: float) -> httpx.Response:
+                r = await self.client.post(
+                    self.DEVICES_URL,
+                    data={'t': sess_id_val},
+                    headers=self._wxapp_headers(with_cookie=True),
+                    timeout=min(10, remaining),
+                )
+                r.raise_for_status()
+                return r
+
+            r = await KEEPALIVE_RETRY.acall(_post_devices)
+            self._apply_keep_alive_response(result, r.cookies, r.json())
+
+        except Exception as e:
+            result["message"] = f"Request failed: {str(e)}"
+            logger.error(f"Keep-alive exception: {e}")
             
-            # 4. Post Sign
-            r = requests.post(self.SIGN_URL, data=payload, headers=sign_headers, timeout=15)
+        return result
+
+    async def sign_in(self, major: int, minor: int, prearmed: Optional[bool] = None) -> dict:
+        """
+        Execute Bluetooth check-in
+        prearmed 模式下有新鲜的时钟偏移样本时跳过 getTime，只发一次 sign.html。
+        """
+        if prearmed is None:
+            prearmed = CHECKIN_MODE == "prearmed"
+
+        result = {
+            "success": False,
+            "message": ""
+        }
+        
+        started = time.monotonic()
+        mode = "classic"
+        try:
+            sign_headers = self._wxapp_headers(with_cookie=False)
+            stage = {"step": ""}
+
+            async def _attempt(remaining: float) -> Optional[httpx.Response]:
+                nonlocal mode
+                timestamp = SERVER_CLOCK.estimate() if prearmed else None
+                if timestamp is not None:
+                    mode = "prearmed"
+                else:
+                    mode = "classic"
+                    stage["step"] = "getTime"
+                    sent_at = time.time()
+                    r_time = await self.client.get(self.GET_TIME_URL, headers=sign_headers, timeout=min(10, remaining))
+                    r_time.raise_for_status()
+                    SERVER_CLOCK.observe(r_time.text, sent_at, time.time())
+                    timestamp = r_time.text
+
+                payload = self._build_sign_payload(timestamp, major, minor)
+                if payload is None:
+                    return None
+
+                stage["step"] = "sign"
+                return await self.client.post(
+                    self.SIGN_URL, data=payload, headers=sign_headers, timeout=min(15, remaining)
+                )
+
+            r = await CHECKIN_RETRY.acall(_attempt, retryable=lambda exc: _sign_retryable(stage["step"], exc))
+            if r is None:
+                result["message"] = "Invalid Cookie: wechatSESS_ID not found"
+                return result
             
             try:
                 data = r.json()
-            except:
+            except ValueError:
                 data = {"msg": r.text, "code": r.status_code}
-                
-            code = data.get('code')
-            msg = data.get('msg') or data.get('message') or str(data)
-            
-            if str(code) in ['0', '200']:
-                result["success"] = True
-                final_msg = msg
-                if final_msg == "扫码成功":
-                    final_msg = "到馆验证成功"
-                result["message"] = f"签到成功：{final_msg}"
-            else:
-                result["message"] = f"签到失败: {msg}"
+            self._apply_sign_response(result, data)
                 
         except Exception as e:
             result["message"] = f"签到异常: {str(e)}"
             logger.error(f"Sign-in exception: {e}")
             
+        self._finish_latency(result, mode, started)
         return result
@@ -1,9 +1,14 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import base64
+import json
 import os
+import threading
+import time
 from pathlib import Path
 from sqlmodel import Field, SQLModel, create_engine, Session, select
-from datetime import datetime
-from sqlalchemy import inspect, text
+from datetime import datetime, timedelta
+from sqlalchemy import Index, and_, case, delete, event, false, func, true, insert, inspect, or_, text, update
+from sqlalchemy.exc import IntegrityError
 
 # ============ 数据模型 ============
 
@@ -31,7 +36,7 @@ class Config(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     # user_id 保留用于兼容或作为非关联的标识，但在新系统中主要使用 owner_id
     user_id: str = Field(index=True, default="legacy") 
-    owner_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    owner_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
     session_id: str
     major: int
     minor: int
@@ -42,6 +47,8 @@ class Config(SQLModel, table=True):
     last_log: Optional[str] = None
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
     auto_checkin_expire_at: Optional[datetime] = None
+    # 下一次自动签到的计划时间，重启后据此恢复每个用户原有的签到节奏
+    next_checkin_at: Optional[datetime] = None
     # 微信个人资料快照（粘贴授权链接时一次性写入，不做动态刷新）
     wechat_nick: Optional[str] = None
     wechat_avatar: Optional[str] = None
@@ -51,6 +58,8 @@ class Config(SQLModel, table=True):
     wechat_area_name: Optional[str] = None
     traceint_user_id: Optional[int] = None
     wechat_profile_at: Optional[datetime] = None
+    # 每次写入递增的版本号，跨 worker 的读侧缓存（如 /api/status 快照）据此判断是否需要重建
+    version: int = Field(default=0)
 
 class Announcement(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -60,6 +69,52 @@ class Announcement(SQLModel, table=True):
     updated_at: Optional[datetime] = Field(default_factory=datetime.now)
     published_at: Optional[datetime] = None
 
+class SchedulerLease(SQLModel, table=True):
+    """多进程部署时的全局维护任务租约：持有者需在 expires_at 前续期，过期后其他进程可接管。"""
+    name: str = Field(primary_key=True)
+    holder: str
+    expires_at: datetime
+    renewed_at: datetime = Field(default_factory=datetime.now)
+
+class WorkerMember(SQLModel, table=True):
+    """后台任务分区的成员表：每个 worker 定期心跳，过期未续的成员不再参与分区。"""
+    holder: str = Field(primary_key=True)
+    started_at: datetime = Field(default_factory=datetime.now)
+    heartbeat_at: datetime = Field(default_factory=datetime.now)
+    expires_at: datetime = Field(index=True)
+
+class RateLimitBucket(SQLModel, table=True):
+    """令牌桶限流状态，供多个进程共享；updated_at 为 Unix 时间戳（秒）。"""
+    key: str = Field(primary_key=True)
+    tokens: float
+    updated_at: float = Field(index=True)
+
+class ActivityEvent(SQLModel, table=True):
+    """保活/签到事件历史（仅追加）；按 (owner_id, created_at) 建索引，超出保留期由压缩任务清理。"""
+    __table_args__ = (
+        Index("ix_activityevent_owner_created", "owner_id", "created_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int
+    kind: str  # keepalive | checkin
+    success: bool = Field(default=False)
+    message: str = Field(default="")
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+class LocationPresetStat(SQLModel, table=True):
+    """位置预设聚合：每个 (学校, 区域, major, minor) 的配置数量，随配置保存/删除增量维护。"""
+    __table_args__ = (
+        Index("ux_locationpresetstat_key", "school", "area_name", "venue_major", "venue_minor", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    school: str
+    area_name: str = Field(default="")
+    venue_major: int
+    venue_minor: int
+    config_count: int = Field(default=0)
+
 # ============ 数据库连接 ============
 
 def _get_sqlite_url() -> str:
@@ -81,7 +136,65 @@ def _get_sqlite_url() -> str:
     return f"sqlite:///{path.as_posix()}"
 
 
-engine = create_engine(_get_sqlite_url(), connect_args={"check_same_thread": False})
+# SQLite 存储配置：wal（默认）启用 WAL 与下列 PRAGMA；legacy 保持 SQLite 默认的回滚日志模式
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal").strip().lower()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+# 负数表示以 KiB 为单位
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# 只读连接池大小（GET 路由使用）
+SQLITE_READ_POOL_SIZE = max(1, int(os.getenv("SQLITE_READ_POOL_SIZE", "10")))
+
+_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _sqlite_pragmas(profile: str, read_only: bool) -> list[str]:
+    pragmas = [f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}"]
+    if profile == "wal":
+        if not read_only:
+            # journal_mode 持久化在数据库文件中，由写连接设置即可
+            pragmas.append("PRAGMA journal_mode=WAL")
+        if SQLITE_SYNCHRONOUS in _SYNCHRONOUS_LEVELS:
+            pragmas.append(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        pragmas.append(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        pragmas.append(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def create_storage_engine(url: str, *, read_only: bool = False, profile: str = SQLITE_PROFILE):
+    """按存储配置创建引擎；非 SQLite 数据库直接使用默认参数。"""
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+
+    kwargs: dict = {"connect_args": {"check_same_thread": False}}
+    if read_only and ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+        kwargs["pool_size"] = SQLITE_READ_POOL_SIZE
+    new_engine = create_engine(url, **kwargs)
+    pragmas = _sqlite_pragmas(profile, read_only)
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return new_engine
+
+
+_database_url = _get_sqlite_url()
+engine = create_storage_engine(_database_url)
+# GET 路由使用的只读连接池：WAL 模式下读取不会被调度任务的写事务阻塞
+read_engine = (
+    create_storage_engine(_database_url, read_only=True)
+    if _database_url.startswith("sqlite")
+    else engine
+)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
@@ -120,11 +233,24 @@ def create_db_and_tables():
                 if "owner_id" not in columns:
                     print("Migrating: Adding owner_id column to config table")
                     conn.execute(text("ALTER TABLE config ADD COLUMN owner_id INTEGER REFERENCES user(id)"))
+
+                config_indexes = {index["name"] for index in inspector.get_indexes("config")}
+                if "ix_config_owner_id" not in config_indexes:
+                    print("Migrating: Adding ix_config_owner_id index to config table")
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_config_owner_id ON config (owner_id)"))
                 
                 if "auto_checkin_expire_at" not in columns:
                     print("Migrating: Adding auto_checkin_expire_at column to config table")
                     conn.execute(text("ALTER TABLE config ADD COLUMN auto_checkin_expire_at DATETIME"))
 
+                if "next_checkin_at" not in columns:
+                    print("Migrating: Adding next_checkin_at column to config table")
+                    conn.execute(text("ALTER TABLE config ADD COLUMN next_checkin_at DATETIME"))
+
+                if "version" not in columns:
+                    print("Migrating: Adding version column to config table")
+                    conn.execute(text("ALTER TABLE config ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+
                 profile_columns = {
                     "wechat_nick": "VARCHAR",
                     "wechat_avatar": "VARCHAR",
@@ -146,6 +272,13 @@ def create_db_and_tables():
     except Exception as e:
         print(f"Migration warning: {e}")
 
+    # 位置预设聚合每次启动全量重建一次，兼容旧库并纠正可能的计数漂移
+    try:
+        with Session(engine) as session:
+            rebuild_location_preset_stats(session)
+    except Exception as e:
+        print(f"Location preset rebuild warning: {e}")
+
 # ============ 用户相关操作 ============
 
 def get_user_by_username(session: Session, username: str) -> Optional[User]:
@@ -161,18 +294,142 @@ def create_user(session: Session, user: User) -> User:
 def get_all_users(session: Session) -> List[User]:
     return list(session.exec(select(User)).all())
 
+def has_any_user(session: Session) -> bool:
+    """是否已存在任意用户（注册时判断首个用户，避免加载全表）"""
+    return session.exec(select(User.id).limit(1)).first() is not None
+
+# ============ 管理员用户列表 ============
+
+ADMIN_USER_STATUSES = ("active", "logged_out", "unconfigured")
+_EPOCH = datetime(1970, 1, 1)
+# 排序字段 -> (排序表达式, 游标值解析)；last_checkin 为空时按 1970-01-01 排序
+_ADMIN_USER_SORTS = {
+    "id": (User.id, int),
+    "username": (User.username, str),
+    "created_at": (User.created_at, datetime.fromisoformat),
+    "last_checkin": (func.coalesce(Config.last_checkin, _EPOCH), datetime.fromisoformat),
+}
+ADMIN_USER_SORT_FIELDS = tuple(_ADMIN_USER_SORTS)
+
+
+def _encode_admin_cursor(value, user_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, user_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_admin_cursor(cursor: str, parse) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, user_id = json.loads(raw.decode("utf-8"))
+        return parse(value), int(user_id)
+    except Exception as exc:
+        raise ValueError("无效的分页游标") from exc
+
+
+def _admin_user_filters(status: Optional[str], school: Optional[str], configured: Optional[bool]) -> list:
+    has_session = func.coalesce(Config.session_id, "") != ""
+    conditions = []
+    if status == "active":
+        conditions += [Config.is_active == True, has_session]
+    elif status == "logged_out":
+        conditions += [Config.id.is_not(None), ~((Config.is_active == True) & has_session)]
+    elif status == "unconfigured":
+        conditions.append(Config.id.is_(None))
+    if school:
+        conditions.append(Config.wechat_sch == school)
+    if configured is True:
+        conditions.append(has_session)
+    elif configured is False:
+        conditions.append(~has_session)
+    return conditions
+
+
+def count_admin_users(
+    session: Session,
+    *,
+    status: Optional[str] = None,
+    school: Optional[str] = None,
+    configured: Optional[bool] = None,
+) -> int:
+    statement = (
+        select(func.count(User.id))
+        .select_from(User)
+        .outerjoin(Config, Config.owner_id == User.id)
+        .where(*_admin_user_filters(status, school, configured))
+    )
+    return session.exec(statement).one()
+
+
+def list_admin_users(
+    session: Session,
+    *,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    school: Optional[str] = None,
+    configured: Optional[bool] = None,
+    sort: str = "id",
+    descending: bool = False,
+) -> Tuple[List[Tuple[User, Optional[Config]]], Optional[str]]:
+    """
+    管理员用户列表：User LEFT JOIN Config 一次查询，按 (排序字段, user.id) 做游标分页。
+    返回 (当前页 [(user, config)], 下一页游标)。
+    """
+    if sort not in _ADMIN_USER_SORTS:
+        raise ValueError(f"不支持的排序字段: {sort}")
+    sort_expr, parse = _ADMIN_USER_SORTS[sort]
+
+    statement = (
+        select(User, Config)
+        .outerjoin(Config, Config.owner_id == User.id)
+        .where(*_admin_user_filters(status, school, configured))
+    )
+    if cursor:
+        value, last_id = _decode_admin_cursor(cursor, parse)
+        if sort == "id":
+            statement = statement.where(User.id < last_id if descending else User.id > last_id)
+        elif descending:
+            statement = statement.where((sort_expr < value) | ((sort_expr == value) & (User.id < last_id)))
+        else:
+            statement = statement.where((sort_expr > value) | ((sort_expr == value) & (User.id > last_id)))
+
+    if descending:
+        statement = statement.order_by(sort_expr.desc(), User.id.desc())
+    else:
+        statement = statement.order_by(sort_expr.asc(), User.id.asc())
+    rows = list(session.exec(statement.limit(limit + 1)).all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_user, last_config = rows[-1]
+        if sort == "last_checkin":
+            last_value = (last_config.last_checkin if last_config else None) or _EPOCH
+        else:
+            last_value = getattr(last_user, sort)
+        next_cursor = _encode_admin_cursor(last_value, last_user.id)
+    return [(user, config) for user, config in rows], next_cursor
+
 def delete_user(session: Session, user_id: int):
     user = session.get(User, user_id)
     if user:
         # 同时删除关联的配置
         config = get_config_by_owner(session, user_id)
+        preset_key = None
         if config:
+            preset_key = location_preset_key(config)
+            _adjust_location_preset_stat(session, preset_key, -1)
             session.delete(config)
         auth_sessions = list(session.exec(select(AuthSession).where(AuthSession.user_id == user_id)).all())
         for auth_session in auth_sessions:
             session.delete(auth_session)
+        session.execute(delete(ActivityEvent).where(ActivityEvent.owner_id == user_id))
         session.delete(user)
         session.commit()
+        if preset_key is not None:
+            invalidate_location_presets()
 
 # ============ 配置相关操作 ============
 
@@ -211,9 +468,71 @@ def update_auth_session(session: Session, auth_session: AuthSession) -> AuthSess
     session.refresh(auth_session)
     return auth_session
 
-def get_all_active_configs(session: Session) -> List[Config]:
-    """获取所有活跃用户的配置（用于定时任务）"""
+def get_all_active_configs(session: Session, ranges: Optional[List[Tuple[int, int]]] = None) -> List[Config]:
+    """获取所有活跃用户的配置（用于定时任务）；ranges 非 None 时只取本分区的用户"""
     statement = select(Config).where(Config.is_active == True)
+    if ranges is not None:
+        statement = statement.where(owner_ranges_condition(ranges))
+    return list(session.exec(statement).all())
+
+def get_auto_checkin_configs(
+    session: Session,
+    now: Optional[datetime] = None,
+    ranges: Optional[List[Tuple[int, int]]] = None,
+) -> List[Config]:
+    """获取自动签到未到期的活跃配置；ranges 非 None 时只取本分区的用户"""
+    statement = select(Config).where(
+        Config.is_active == True,
+        Config.owner_id.is_not(None),
+        Config.auto_checkin_expire_at > (now or datetime.now()),
+    )
+    if ranges is not None:
+        statement = statement.where(owner_ranges_condition(ranges))
+    return list(session.exec(statement).all())
+
+# Knuth 乘法散列：Python 与 SQL 两侧得到相同的 32 位散列值，用于按用户稳定分片
+_OWNER_HASH_MULTIPLIER = 2654435761
+_OWNER_HASH_SPACE = 1 << 32
+
+
+def owner_hash(owner_key: int) -> int:
+    """owner_id 的稳定 32 位散列（与 owner_hash_expr 一致）。"""
+    return (int(owner_key) * _OWNER_HASH_MULTIPLIER) % _OWNER_HASH_SPACE
+
+
+def owner_hash_expr():
+    """owner_hash 的 SQL 表达式；旧数据没有 owner_id 时退回使用 Config.id。"""
+    return (func.coalesce(Config.owner_id, Config.id) * _OWNER_HASH_MULTIPLIER) % _OWNER_HASH_SPACE
+
+
+def owner_slot(owner_key: int, slots: int) -> int:
+    """把 owner_id 映射到 [0, slots) 的稳定槽位（取散列高位，分布更均匀）。"""
+    return (owner_hash(owner_key) * slots) >> 32
+
+
+def owner_ranges_condition(ranges: List[Tuple[int, int]]):
+    """owner_hash 落在任一 [start, end) 区间内的 SQL 条件；空列表表示不拥有任何用户"""
+    if not ranges:
+        return false()
+    if len(ranges) == 1 and ranges[0] == (0, _OWNER_HASH_SPACE):
+        return true()
+    expr = owner_hash_expr()
+    return or_(*(and_(expr >= start, expr < end) for start, end in ranges))
+
+
+def get_active_configs_in_slot(
+    session: Session,
+    slot: int,
+    slots: int,
+    ranges: Optional[List[Tuple[int, int]]] = None,
+) -> List[Config]:
+    """获取落在指定时间轮槽位内的活跃配置（用于分片保活）；ranges 非 None 时再限定到本分区"""
+    statement = select(Config).where(
+        Config.is_active == True,
+        (owner_hash_expr() * slots) // _OWNER_HASH_SPACE == slot,
+    )
+    if ranges is not None:
+        statement = statement.where(owner_ranges_condition(ranges))
     return list(session.exec(statement).all())
 
 def apply_wechat_profile_to_config(config: Config, profile: dict) -> None:
@@ -324,6 +643,7 @@ def update_config_by_owner(
 ) -> Config:
     """更新或创建用户配置；profile 非 None 时写入微信资料快照。"""
     config = get_config_by_owner(session, owner_id)
+    old_preset_key = location_preset_key(config) if config else None
     if not config:
         config = Config(
             owner_id=owner_id,
@@ -340,7 +660,14 @@ def update_config_by_owner(
         config.is_active = True
     if profile is not None:
         apply_wechat_profile_to_config(config, profile)
+    new_preset_key = location_preset_key(config)
+    presets_changed = old_preset_key != new_preset_key
+    if presets_changed:
+        _adjust_location_preset_stat(session, old_preset_key, -1)
+        _adjust_location_preset_stat(session, new_preset_key, 1)
     session.commit()
+    if presets_changed:
+        invalidate_location_presets()
     session.refresh(config)
     return config
 
@@ -351,6 +678,10 @@ def log_keepalive_by_owner(session: Session, owner_id: int, success: bool, msg:
         config.last_keepalive = datetime.now()
         config.last_log = f"KeepAlive: {msg}"
         session.add(config)
+        session.add(ActivityEvent(
+            owner_id=owner_id, kind=EVENT_KIND_KEEPALIVE, success=success,
+            message=msg, created_at=config.last_keepalive,
+        ))
         session.commit()
 
 def log_checkin_by_owner(session: Session, owner_id: int, success: bool, msg: str):
@@ -361,6 +692,10 @@ def log_checkin_by_owner(session: Session, owner_id: int, success: bool, msg: st
         config.last_checkin_result = msg
         config.last_log = f"CheckIn: {msg}"
         session.add(config)
+        session.add(ActivityEvent(
+            owner_id=owner_id, kind=EVENT_KIND_CHECKIN, success=success,
+            message=msg, created_at=config.last_checkin,
+        ))
         session.commit()
 
 def update_session_id_for_config(session: Session, config: Config, new_session_id: str):
@@ -377,11 +712,414 @@ def deactivate_session_by_owner(session: Session, owner_id: int) -> bool:
     config.session_id = ""
     config.is_active = False
     config.auto_checkin_expire_at = None
+    config.next_checkin_at = None
     config.last_log = "AdminLogout: session renewal disabled until reauthorization"
     session.add(config)
     session.commit()
     return True
 
+# ============ 配置变更版本 ============
+# Config.version 随每次写入递增（存于数据库，所有 worker 可见）：ORM 写入在 flush 前自动递增，
+# 绕过 ORM 的批量 UPDATE 需自行带上 CONFIG_VERSION_BUMP。
+
+CONFIG_VERSION_BUMP = {"version": Config.version + 1}
+
+
+def get_config_version(session: Session, owner_id: int) -> Optional[int]:
+    """只读取版本号列；用户没有配置时返回 None"""
+    return session.exec(select(Config.version).where(Config.owner_id == owner_id)).first()
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_dirty_config_versions(session, _flush_context, _instances) -> None:
+    for obj in session.dirty:
+        if isinstance(obj, Config) and session.is_modified(obj, include_collections=False):
+            # 用 SQL 表达式在数据库端递增，避免并发写入基于同一个旧值得到相同的版本号
+            obj.version = Config.version + 1
+
+# ============ 位置预设 ============
+
+DEFAULT_LOCATION_PRESET_MAJOR = 20
+DEFAULT_LOCATION_PRESET_MINOR = 9
+DEFAULT_LOCATION_PRESET_SCHOOL = "南京农业大学（卫岗校区/滨江校区）"
+DEFAULT_LOCATION_PRESET_AREA = "滨江校区"
+# 预设缓存的最长有效期（秒）；本进程内的写入通过版本号立即失效，TTL 兜底其他进程的写入
+LOCATION_PRESET_CACHE_TTL_SEC = max(0.0, float(os.getenv("LOCATION_PRESET_CACHE_TTL_SEC", "60")))
+
+_location_presets_lock = threading.Lock()
+_location_presets_version = 0
+# (版本号, 生成时间, 预设列表)
+_location_presets_cache: Optional[Tuple[int, float, List[dict]]] = None
+
+
+def _location_preset_key(school, area_name, major, minor) -> Optional[Tuple[str, str, int, int]]:
+    school = (school or "").strip()
+    area_name = (area_name or "").strip()
+    if not school:
+        return None
+
+    try:
+        venue_major = int(major)
+        venue_minor = int(minor)
+    except (TypeError, ValueError):
+        return None
+
+    if not (1 <= venue_major <= 65535 and 1 <= venue_minor <= 65535):
+        return None
+    # 默认信标只算作默认校区的预设，避免未改位置的用户把其他学校也指向默认信标
+    if (
+        venue_major == DEFAULT_LOCATION_PRESET_MAJOR
+        and venue_minor == DEFAULT_LOCATION_PRESET_MINOR
+        and (
+            school != DEFAULT_LOCATION_PRESET_SCHOOL
+            or area_name != DEFAULT_LOCATION_PRESET_AREA
+        )
+    ):
+        return None
+    return school, area_name, venue_major, venue_minor
+
+
+def location_preset_key(config: Config) -> Optional[Tuple[str, str, int, int]]:
+    """配置对应的预设聚合键；不参与预设统计的配置返回 None。"""
+    return _location_preset_key(config.wechat_sch, config.wechat_area_name, config.major, config.minor)
+
+
+def _adjust_location_preset_stat(
+    session: Session, key: Optional[Tuple[str, str, int, int]], delta: int
+) -> None:
+    """在当前事务中调整一个预设键的计数，计数归零时删除该行；由调用方提交。"""
+    if key is None or delta == 0:
+        return
+    school, area_name, venue_major, venue_minor = key
+    stat = session.exec(
+        select(LocationPresetStat).where(
+            LocationPresetStat.school == school,
+            LocationPresetStat.area_name == area_name,
+            LocationPresetStat.venue_major == venue_major,
+            LocationPresetStat.venue_minor == venue_minor,
+        )
+    ).first()
+    if stat is None:
+        if delta > 0:
+            session.add(LocationPresetStat(
+                school=school,
+                area_name=area_name,
+                venue_major=venue_major,
+                venue_minor=venue_minor,
+                config_count=delta,
+            ))
+        return
+    stat.config_count += delta
+    if stat.config_count <= 0:
+        session.delete(stat)
+    else:
+        session.add(stat)
+
+
+def rebuild_location_preset_stats(session: Session) -> int:
+    """按全部配置重建预设聚合表，返回聚合行数。"""
+    counts: dict[Tuple[str, str, int, int], int] = {}
+    statement = select(
+        Config.wechat_sch, Config.wechat_area_name, Config.major, Config.minor
+    ).where(Config.wechat_sch.is_not(None))
+    for school, area_name, major, minor in session.exec(statement):
+        key = _location_preset_key(school, area_name, major, minor)
+        if key is not None:
+            counts[key] = counts.get(key, 0) + 1
+
+    session.execute(delete(LocationPresetStat))
+    if counts:
+        session.execute(
+            insert(LocationPresetStat),
+            [
+                {
+                    "school": school,
+                    "area_name": area_name,
+                    "venue_major": venue_major,
+                    "venue_minor": venue_minor,
+                    "config_count": count,
+                }
+                for (school, area_name, venue_major, venue_minor), count in counts.items()
+            ],
+        )
+    session.commit()
+    invalidate_location_presets()
+    return len(counts)
+
+
+def invalidate_location_presets() -> None:
+    """预设聚合已变更：递增版本号，下次读取时重新生成。"""
+    global _location_presets_version
+    with _location_presets_lock:
+        _location_presets_version += 1
+
+
+def get_location_presets(session: Session) -> List[dict]:
+    """
+    每个 (学校, 区域) 取配置数最多的信标作为预设（并列时取 major/minor 较小者），按标签排序。
+    结果按版本号缓存，读取只扫描聚合表，开销与预设数量相关而与用户数无关。
+    """
+    global _location_presets_cache
+    with _location_presets_lock:
+        version = _location_presets_version
+        cached = _location_presets_cache
+    now = time.monotonic()
+    if (
+        cached is not None
+        and cached[0] == version
+        and now - cached[1] < LOCATION_PRESET_CACHE_TTL_SEC
+    ):
+        return cached[2]
+
+    statement = select(LocationPresetStat).order_by(
+        LocationPresetStat.school,
+        LocationPresetStat.area_name,
+        LocationPresetStat.config_count.desc(),
+        LocationPresetStat.venue_major,
+        LocationPresetStat.venue_minor,
+    )
+    presets: List[dict] = []
+    last_location: Optional[Tuple[str, str]] = None
+    for stat in session.exec(statement):
+        location = (stat.school, stat.area_name)
+        if location == last_location:
+            continue
+        last_location = location
+        presets.append({
+            "school": stat.school,
+            "area_name": stat.area_name or None,
+            "label": f"{stat.school} · {stat.area_name}" if stat.area_name else stat.school,
+            "venue_major": stat.venue_major,
+            "venue_minor": stat.venue_minor,
+        })
+    presets.sort(key=lambda preset: preset["label"])
+
+    with _location_presets_lock:
+        # 生成期间若有写入导致版本变化，不缓存这份可能过期的结果
+        if _location_presets_version == version:
+            _location_presets_cache = (version, now, presets)
+    return presets
+
+# ============ 调度租约与分区成员 ============
+
+def acquire_lease(session: Session, name: str, holder: str, ttl_seconds: float, now: Optional[datetime] = None) -> bool:
+    """
+    获取或续期租约：租约由自己持有或已过期时原子地改为自己持有并延长有效期。
+    返回是否持有租约。
+    """
+    now = now or datetime.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    result = session.execute(
+        update(SchedulerLease)
+        .where(
+            SchedulerLease.name == name,
+            or_(SchedulerLease.holder == holder, SchedulerLease.expires_at <= now),
+        )
+        .values(holder=holder, expires_at=expires_at, renewed_at=now)
+    )
+    session.commit()
+    if result.rowcount:
+        return True
+    if session.get(SchedulerLease, name) is not None:
+        return False
+    try:
+        session.add(SchedulerLease(name=name, holder=holder, expires_at=expires_at, renewed_at=now))
+        session.commit()
+        return True
+    except IntegrityError:
+        # 其他进程同时创建了租约
+        session.rollback()
+        return False
+
+def release_lease(session: Session, name: str, holder: str) -> None:
+    """主动释放自己持有的租约，其他进程无需等待过期即可接管"""
+    session.execute(
+        update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.holder == holder)
+        .values(expires_at=datetime.now())
+    )
+    session.commit()
+
+def heartbeat_member(session: Session, holder: str, ttl_seconds: float, now: Optional[datetime] = None) -> None:
+    """登记或续期分区成员，并顺带清理早已失效的成员行"""
+    now = now or datetime.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    member = session.get(WorkerMember, holder)
+    if member is None:
+        session.add(WorkerMember(holder=holder, started_at=now, heartbeat_at=now, expires_at=expires_at))
+    else:
+        member.heartbeat_at = now
+        member.expires_at = expires_at
+        session.add(member)
+    session.execute(delete(WorkerMember).where(WorkerMember.expires_at < now - timedelta(days=1)))
+    session.commit()
+
+def remove_member(session: Session, holder: str) -> None:
+    session.execute(delete(WorkerMember).where(WorkerMember.holder == holder))
+    session.commit()
+
+def get_live_members(session: Session, now: Optional[datetime] = None) -> List[str]:
+    """当前存活的成员（按 holder 排序）"""
+    statement = (
+        select(WorkerMember.holder)
+        .where(WorkerMember.expires_at > (now or datetime.now()))
+        .order_by(WorkerMember.holder)
+    )
+    return list(session.exec(statement).all())
+
+# ============ 限流令牌桶 ============
+
+def _refilled_tokens(capacity: float, rate: float, now: float):
+    """按上次更新以来经过的时间补充后的令牌数（SQL 表达式，不超过桶容量）"""
+    refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+    return case((refilled > capacity, capacity), else_=refilled)
+
+def take_rate_limit_token(session: Session, key: str, capacity: float, rate: float, now: float) -> float:
+    """
+    从共享令牌桶中取一个令牌：成功返回 0，令牌不足返回还需等待的秒数。
+    补充与扣减在同一条 UPDATE 中完成，多个进程并发请求同一个桶也不会超发。
+    """
+    for _ in range(2):
+        refilled = _refilled_tokens(capacity, rate, now)
+        result = session.execute(
+            update(RateLimitBucket)
+            .where(RateLimitBucket.key == key, refilled >= 1)
+            .values(tokens=refilled - 1, updated_at=now)
+        )
+        session.commit()
+        if result.rowcount:
+            return 0.0
+
+        bucket = session.get(RateLimitBucket, key)
+        if bucket is not None:
+            tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+            return max(0.0, (1 - tokens) / rate)
+        try:
+            session.add(RateLimitBucket(key=key, tokens=capacity - 1, updated_at=now))
+            session.commit()
+            return 0.0
+        except IntegrityError:
+            # 其他进程同时创建了这个桶，重新按 UPDATE 扣减
+            session.rollback()
+    return 1.0 / rate
+
+def refund_rate_limit_token(session: Session, key: str, capacity: float, rate: float, now: float) -> None:
+    """退还一个令牌（同时受多个桶限制、后续的桶拒绝时使用）"""
+    refilled = _refilled_tokens(capacity, rate, now)
+    session.execute(
+        update(RateLimitBucket)
+        .where(RateLimitBucket.key == key)
+        .values(tokens=case((refilled + 1 > capacity, capacity), else_=refilled + 1), updated_at=now)
+    )
+    session.commit()
+
+def purge_rate_limit_buckets(session: Session, prefix: str, idle_before: float) -> int:
+    """删除 key 以 prefix 开头、idle_before 之前就已不再变化的桶（早已补满，与不存在等价）"""
+    result = session.execute(
+        delete(RateLimitBucket).where(
+            RateLimitBucket.key.startswith(prefix, autoescape=True),
+            RateLimitBucket.updated_at < idle_before,
+        )
+    )
+    session.commit()
+    return result.rowcount or 0
+
+# ============ 事件历史 ============
+
+EVENT_KIND_KEEPALIVE = "keepalive"
+EVENT_KIND_CHECKIN = "checkin"
+# 全部事件保留天数
+ACTIVITY_RETENTION_DAYS = max(1, int(os.getenv("ACTIVITY_RETENTION_DAYS", "30")))
+# 超过该小时数的成功保活事件降采样为每用户每小时一条（失败事件与签到事件完整保留）
+ACTIVITY_DETAIL_HOURS = max(1, int(os.getenv("ACTIVITY_DETAIL_HOURS", "24")))
+# 降采样每次回看的天数（压缩任务每天运行，更早的数据已处理过）
+_ACTIVITY_DOWNSAMPLE_LOOKBACK_DAYS = 7
+_ACTIVITY_DELETE_CHUNK = 5000
+
+
+def append_activity_events(session: Session, events: List[dict]) -> None:
+    """批量追加事件（不提交，由调用方控制事务）"""
+    if events:
+        session.execute(insert(ActivityEvent), events)
+
+
+def get_recent_events(
+    session: Session,
+    owner_id: int,
+    limit: int = 50,
+    kind: Optional[str] = None,
+) -> List[ActivityEvent]:
+    """获取用户最近的 N 条事件（按时间倒序）"""
+    statement = select(ActivityEvent).where(ActivityEvent.owner_id == owner_id)
+    if kind:
+        statement = statement.where(ActivityEvent.kind == kind)
+    statement = statement.order_by(ActivityEvent.created_at.desc(), ActivityEvent.id.desc()).limit(limit)
+    return list(session.exec(statement).all())
+
+
+def get_events_between(
+    session: Session,
+    owner_id: int,
+    start: datetime,
+    end: datetime,
+    kind: Optional[str] = None,
+    limit: int = 500,
+) -> List[ActivityEvent]:
+    """获取用户在 [start, end) 时间段内的事件（按时间倒序）"""
+    statement = select(ActivityEvent).where(
+        ActivityEvent.owner_id == owner_id,
+        ActivityEvent.created_at >= start,
+        ActivityEvent.created_at < end,
+    )
+    if kind:
+        statement = statement.where(ActivityEvent.kind == kind)
+    statement = statement.order_by(ActivityEvent.created_at.desc(), ActivityEvent.id.desc()).limit(limit)
+    return list(session.exec(statement).all())
+
+
+def _delete_events_in_chunks(session: Session, condition) -> int:
+    """分批删除，避免单个长事务长时间占用写锁"""
+    deleted = 0
+    while True:
+        ids = list(session.exec(select(ActivityEvent.id).where(condition).limit(_ACTIVITY_DELETE_CHUNK)).all())
+        if not ids:
+            return deleted
+        session.execute(delete(ActivityEvent).where(ActivityEvent.id.in_(ids)))
+        session.commit()
+        deleted += len(ids)
+
+
+def compact_activity_events(session: Session, now: Optional[datetime] = None) -> dict:
+    """删除保留期外的事件，并把较早的成功保活事件降采样为每用户每小时一条"""
+    now = now or datetime.now()
+    retention_cutoff = now - timedelta(days=ACTIVITY_RETENTION_DAYS)
+    expired = _delete_events_in_chunks(session, ActivityEvent.created_at < retention_cutoff)
+
+    detail_cutoff = now - timedelta(hours=ACTIVITY_DETAIL_HOURS)
+    window_start = max(retention_cutoff, detail_cutoff - timedelta(days=_ACTIVITY_DOWNSAMPLE_LOOKBACK_DAYS))
+    downsampled = 0
+    # 按天分段处理，每段一个短事务；小时分桶在 Python 中计算，不依赖特定数据库的日期函数
+    day_start = window_start
+    while day_start < detail_cutoff:
+        day_end = min(day_start + timedelta(days=1), detail_cutoff)
+        hour_start = day_start
+        while hour_start < day_end:
+            hour_end = min(hour_start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1), day_end)
+            in_window = (
+                (ActivityEvent.kind == EVENT_KIND_KEEPALIVE)
+                & (ActivityEvent.success == True)
+                & (ActivityEvent.created_at >= hour_start)
+                & (ActivityEvent.created_at < hour_end)
+            )
+            keep_ids = select(func.min(ActivityEvent.id)).where(in_window).group_by(ActivityEvent.owner_id)
+            result = session.execute(delete(ActivityEvent).where(in_window, ActivityEvent.id.not_in(keep_ids)))
+            downsampled += result.rowcount or 0
+            hour_start = hour_end
+        session.commit()
+        day_start = day_end
+
+    return {"expired": expired, "downsampled": downsampled}
+
 # ============ 公告相关操作 ============
 
 def get_announcement(session: Session) -> Optional[Announcement]:
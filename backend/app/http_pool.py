@@ -0,0 +1,269 @@
+"""Traceint 进程级共享 HTTP 连接池。"""
+from __future__ import annotations
+
+import http.cookiejar
+import logging
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.connection import is_connection_dropped
+
+from app.upstream_governor import is_upstream_failure, traceint_governor
+
+logger = logging.getLogger(__name__)
+
+# 每个主机（http/https 各算一个）保持的连接上限；耗尽时阻塞等待而不是额外建连
+POOL_MAXSIZE = max(1, int(os.getenv("TRACEINT_POOL_MAXSIZE", "32")))
+# 连接全部被占用时最多等待的秒数，超时抛出 urllib3 EmptyPoolError，不会无限期阻塞调用方
+POOL_TIMEOUT_SECONDS = max(0.1, float(os.getenv("TRACEINT_POOL_TIMEOUT_SEC", "10")))
+# 缓存的主机连接池数量（wechat.v2 / static.wechat.v2 的 http 与 https）
+POOL_CONNECTIONS = max(1, int(os.getenv("TRACEINT_POOL_CONNECTIONS", "4")))
+# 某个源（scheme + 主机 + 端口）空闲超过该秒数后关闭其全部连接，避免复用已被服务端关闭的 keep-alive 连接
+POOL_IDLE_SECONDS = max(0.0, float(os.getenv("TRACEINT_POOL_IDLE_SEC", "50")))
+
+# 当前线程正在发送连接预热请求：不消耗业务请求的令牌，也不计入熔断统计（熔断中时根本不发预热请求）
+_warming = threading.local()
+
+_BASE_HEADERS = {
+    "Accept": "*/*",
+    "Accept-Language": "zh-CN,zh-Hans;q=0.9",
+    "Connection": "keep-alive",
+}
+
+
+class _BoundedWaitHTTPConnectionPool(HTTPConnectionPool):
+    """requests 不传 pool_timeout，默认会在连接耗尽时无限等待；这里补上等待上限"""
+
+    def _get_conn(self, timeout: Optional[float] = None):
+        return super()._get_conn(POOL_TIMEOUT_SECONDS if timeout is None else timeout)
+
+
+class _BoundedWaitHTTPSConnectionPool(HTTPSConnectionPool):
+    def _get_conn(self, timeout: Optional[float] = None):
+        return super()._get_conn(POOL_TIMEOUT_SECONDS if timeout is None else timeout)
+
+
+def _origin(url: str) -> tuple[str, str, int]:
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    return scheme, (parts.hostname or "").lower(), parts.port or (443 if scheme == "https" else 80)
+
+
+class _IdleEvictingAdapter(HTTPAdapter):
+    """
+    线程安全的连接池适配器：按源记录最近使用时间，某个源空闲过久时关闭该源连接池中的全部连接
+    （不是逐条淘汰空闲连接）；每个请求都经过出站限速与熔断。
+    """
+
+    def __init__(self, idle_seconds: float, **kwargs):
+        self._idle_seconds = idle_seconds
+        self._last_used: dict[tuple[str, str, int], float] = {}
+        self._idle_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _BoundedWaitHTTPConnectionPool,
+            "https": _BoundedWaitHTTPSConnectionPool,
+        }
+
+    def _close_origin_pools(self, origins: set[tuple[str, str, int]]) -> None:
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            if (key.key_scheme, key.key_host, key.key_port or (443 if key.key_scheme == "https" else 80)) in origins:
+                # 从容器中删除时会关闭该连接池；正在使用的连接归还时随之关闭
+                pools.pop(key, None)
+
+    def idle_for(self, url: str, now: Optional[float] = None) -> Optional[float]:
+        """url 所在源距最近一次请求的秒数；从未请求过返回 None"""
+        with self._idle_lock:
+            last_used = self._last_used.get(_origin(url))
+        if last_used is None:
+            return None
+        return (time.monotonic() if now is None else now) - last_used
+
+    def evict_idle_pools(self, now: Optional[float] = None) -> int:
+        """关闭空闲超过 idle_seconds 的源的连接池，返回关闭的源数量"""
+        if not self._idle_seconds:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._idle_lock:
+            stale = {origin for origin, used in self._last_used.items() if now - used > self._idle_seconds}
+            for origin in stale:
+                del self._last_used[origin]
+        if stale:
+            self._close_origin_pools(stale)
+            logger.debug("Traceint 连接池 %d 个源空闲超过 %.0fs，已关闭旧连接", len(stale), self._idle_seconds)
+        return len(stale)
+
+    def send(self, request, **kwargs):
+        permit = None if getattr(_warming, "active", False) else traceint_governor.acquire(request.url)
+        origin = _origin(request.url)
+        now = time.monotonic()
+        with self._idle_lock:
+            last_used = self._last_used.get(origin)
+            self._last_used[origin] = now
+        if self._idle_seconds and last_used is not None and now - last_used > self._idle_seconds:
+            self._close_origin_pools({origin})
+        # None 表示没有得到上游结果（如本地连接池等待超时），不计入熔断统计
+        ok: Optional[bool] = None
+        try:
+            response = super().send(request, **kwargs)
+            ok = not is_upstream_failure(response.status_code)
+            return response
+        except requests.exceptions.RequestException:
+            ok = False
+            raise
+        finally:
+            if permit:
+                if ok is None:
+                    permit.cancel()
+                else:
+                    permit.finish(ok)
+
+
+class _PooledSession(requests.Session):
+    """挂载共享适配器的 Session；close() 不关闭进程级连接池。"""
+
+    def close(self) -> None:
+        pass
+
+
+_adapter = _IdleEvictingAdapter(
+    POOL_IDLE_SECONDS,
+    pool_connections=POOL_CONNECTIONS,
+    pool_maxsize=POOL_MAXSIZE,
+    pool_block=True,
+)
+_shared_session: Optional[_PooledSession] = None
+_shared_lock = threading.Lock()
+
+
+def _mount_shared_adapter(session: requests.Session) -> None:
+    session.mount("https://", _adapter)
+    session.mount("http://", _adapter)
+
+
+def new_traceint_session() -> requests.Session:
+    """
+    新建带独立 Cookie 的 Session（OAuth 换票等需要 Cookie 状态的流程使用），
+    底层 TCP/TLS 连接仍来自共享连接池。
+    """
+    session = _PooledSession()
+    _mount_shared_adapter(session)
+    session.headers.update(_BASE_HEADERS)
+    return session
+
+
+def get_traceint_http() -> requests.Session:
+    """
+    进程级共享的无状态 Session（保活、签到、GraphQL 使用）。
+    Cookie 一律由调用方通过请求头显式传入，响应 Set-Cookie 不会写回共享 Cookie 罐，
+    避免不同用户之间串 Cookie；需要新 Cookie 时读取 response.cookies。
+    """
+    global _shared_session
+    if _shared_session is None:
+        with _shared_lock:
+            if _shared_session is None:
+                session = _PooledSession()
+                session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                _mount_shared_adapter(session)
+                session.headers.update(_BASE_HEADERS)
+                _shared_session = session
+    return _shared_session
+
+
+def idle_connections(url: str) -> int:
+    """共享连接池中 url 所在源当前可直接复用的已建立连接数（已被服务端关闭的连接不算）"""
+    pool = _adapter.poolmanager.connection_from_url(url)
+    queue = getattr(pool, "pool", None)
+    if queue is None:
+        return 0
+    with queue.mutex:
+        conns = list(queue.queue)
+    return sum(
+        1 for conn in conns
+        if conn is not None and getattr(conn, "sock", None) is not None and not is_connection_dropped(conn)
+    )
+
+
+def warm_connection(url: str, timeout: float = 5, max_idle: Optional[float] = None) -> bool:
+    """
+    保证 url 所在源至少有一条已完成 TCP/TLS 握手的空闲连接，返回是否实际发出了预热请求。
+    已有可复用的连接时不发请求；给定 max_idle 时，该源超过 max_idle 秒没有请求也会发一次，
+    防止服务端按 keep-alive 超时关闭连接。上游熔断中不发请求。
+    使用不带 Cookie 的共享 Session；预热请求不消耗令牌、不计入熔断统计（见 _warming）。
+    """
+    if traceint_governor.circuit_open(url):
+        return False
+    if idle_connections(url) > 0:
+        idle_for = _adapter.idle_for(url)
+        if max_idle is None or (idle_for is not None and idle_for < max_idle):
+            return False
+    _warming.active = True
+    try:
+        response = get_traceint_http().get(url, timeout=timeout)
+        # 读完响应体，连接才会放回连接池
+        response.content
+    except Exception as exc:
+        logger.debug("Traceint 连接预热失败 %s: %s", url, exc)
+    finally:
+        _warming.active = False
+    return True
+
+
+class ConnectionWarmer:
+    """
+    后台线程按固定间隔检查指定 URL 所在的源，只在连接缺失、已被关闭或整个间隔内没有业务请求时发轻量请求，
+    使对应源常备一条活跃连接；有业务流量时不额外发请求，上游熔断中也不发。
+    间隔短于 POOL_IDLE_SECONDS 时，预热请求会刷新这些源的最近使用时间，空闲淘汰对它们不再生效——
+    被预热的源由预热器代替空闲淘汰来维持连接可用；其他源仍按空闲淘汰。
+    """
+
+    def __init__(self, urls: tuple[str, ...], interval: float):
+        self.urls = urls
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="traceint-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        thread, self._thread = self._thread, None
+        if thread and thread.is_alive():
+            thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            for url in self.urls:
+                warm_connection(url, max_idle=self.interval)
+            if self._stopping.wait(self.interval):
+                return
+
+
+def evict_idle_connections() -> int:
+    """关闭空闲过久的源的连接（调度器定时调用），返回关闭的源数量。"""
+    return _adapter.evict_idle_pools()
+
+
+def close_traceint_pool() -> None:
+    """关闭共享连接池中的全部连接（应用关闭时调用）。"""
+    _adapter.poolmanager.clear()
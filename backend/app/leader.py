@@ -0,0 +1,127 @@
+"""
+多 worker 部署下全局维护任务（事件清理等）的单 worker 租约：基于数据库租约行，不依赖外部服务。
+保活与自动签到不经过该租约，由 app.partition 按一致性散列环分配到所有存活 worker。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from sqlmodel import Session
+
+from app.database import acquire_lease, engine, release_lease
+
+logger = logging.getLogger(__name__)
+
+# 关闭后每个进程都直接持有租约、运行维护任务（单进程部署或调试时使用）；环境变量名沿用旧的 SCHEDULER_ 前缀
+LEADER_ELECTION_ENABLED = os.getenv("SCHEDULER_LEADER_ELECTION", "1").strip().lower() not in {"0", "false", "no", "off"}
+# 租约有效期与续期间隔（秒）；持有者异常退出后最多 LEADER_LEASE_SECONDS 内由其他 worker 接管。
+# 分区成员表的心跳也使用这组间隔
+LEADER_LEASE_SECONDS = max(5.0, float(os.getenv("LEADER_LEASE_SECONDS", "30")))
+LEADER_HEARTBEAT_SECONDS = min(
+    LEADER_LEASE_SECONDS / 3,
+    max(1.0, float(os.getenv("LEADER_HEARTBEAT_SECONDS", "10"))),
+)
+# 租约行名沿用旧值，滚动升级期间新旧进程争用同一行
+LEADER_LEASE_NAME = "scheduler"
+
+
+class LeaderElector:
+    """
+    后台线程定期获取/续期维护租约：拿到租约时调用 on_elected，失去租约时调用 on_demoted。
+    续期失败（如数据库繁忙）时，只要距上次成功续期未超过租约有效期就继续持有；
+    超过后主动让出，保证同一时刻至多一个进程执行维护任务。
+    """
+
+    def __init__(self, name: str = LEADER_LEASE_NAME):
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._on_elected: Optional[Callable[[], None]] = None
+        self._on_demoted: Optional[Callable[[], None]] = None
+        self._is_leader = False
+        self._last_renewed = 0.0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def start(self, on_elected: Callable[[], None], on_demoted: Callable[[], None]) -> None:
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._stopping.clear()
+        if not LEADER_ELECTION_ENABLED:
+            self._become_leader()
+            return
+        # 启动时先同步尝试一次，单进程部署无需等待首个心跳即可注册维护任务
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name="maintenance-lease", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout=LEADER_HEARTBEAT_SECONDS + 5)
+        self._thread = None
+        was_leader = self._is_leader
+        self._step_down()
+        if was_leader and LEADER_ELECTION_ENABLED:
+            try:
+                with Session(engine) as session:
+                    release_lease(session, self.name, self.holder)
+            except Exception as e:
+                logger.warning(f"Failed to release maintenance lease: {e}")
+
+    def _heartbeat(self) -> None:
+        now = time.monotonic()
+        try:
+            with Session(engine) as session:
+                acquired = acquire_lease(session, self.name, self.holder, LEADER_LEASE_SECONDS)
+        except Exception as e:
+            logger.warning(f"Maintenance lease heartbeat failed: {e}")
+            if self._is_leader and now - self._last_renewed >= LEADER_LEASE_SECONDS:
+                logger.warning("Maintenance lease could not be renewed before expiry, stepping down")
+                self._step_down()
+            return
+
+        if acquired:
+            self._last_renewed = now
+            if not self._is_leader:
+                self._become_leader()
+        elif self._is_leader:
+            logger.warning("Maintenance lease taken over by another worker, stepping down")
+            self._step_down()
+
+    def _become_leader(self) -> None:
+        self._is_leader = True
+        logger.info(f"This worker ({self.holder}) now holds the maintenance lease")
+        if self._on_elected:
+            try:
+                self._on_elected()
+            except Exception as e:
+                logger.error(f"Failed to start maintenance jobs after acquiring the lease: {e}")
+
+    def _step_down(self) -> None:
+        if not self._is_leader:
+            return
+        self._is_leader = False
+        logger.info(f"This worker ({self.holder}) no longer holds the maintenance lease")
+        if self._on_demoted:
+            try:
+                self._on_demoted()
+            except Exception as e:
+                logger.error(f"Failed to stop maintenance jobs after losing the lease: {e}")
+
+    def _run(self) -> None:
+        while not self._stopping.wait(LEADER_HEARTBEAT_SECONDS):
+            self._heartbeat()
+
+
+leader_elector = LeaderElector()
@@ -1,37 +1,56 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Optional, List, Any
 from sqlmodel import Session
 from datetime import timedelta, datetime
 from contextlib import asynccontextmanager
+from collections import OrderedDict
+import hashlib
 import json
+import os
+import threading
+import time
 import urllib.parse
-import requests
 
 from app.database import (
-    create_db_and_tables, User, Config, Announcement,
+    engine, create_db_and_tables, User, Config, Announcement,
     get_config_by_owner, update_config_by_owner,
     log_checkin_by_owner, log_keepalive_by_owner,
-    create_user, get_user_by_username, get_all_configs, delete_user,
-    get_all_users, get_announcement, get_or_create_announcement,
+    create_user, get_user_by_username, delete_user,
+    has_any_user, get_announcement, get_or_create_announcement,
+    list_admin_users, count_admin_users, ADMIN_USER_STATUSES, ADMIN_USER_SORT_FIELDS,
     get_profile_display, build_wechat_profile_response, get_wechat_connection_status,
-    deactivate_session_by_owner,
+    deactivate_session_by_owner, get_recent_events, get_events_between, get_config_version,
+    get_location_presets as load_location_presets,
 )
 from app.traceint_client import (
     parse_url_to_session_and_profile,
     parse_url_to_authorization_and_profile,
     parse_url_to_checkin_session,
     parse_code_from_url,
+    shutdown_dual_exchange,
+    start_dual_exchange_warmer,
+)
+from app.scheduler import start_scheduler, shutdown_scheduler, keep_alive_for_user_async, start_auto_checkin_for_user, stop_auto_checkin_for_user
+from app.core import AsyncWegolibCore, aclose_async_client, checkin_latency_summary, SERVER_CLOCK
+from app.http_pool import close_traceint_pool
+from app.avatar_cache import AvatarFetchError, avatar_cache
+from app.rate_limit import TokenBucketLimiter
+from app.upstream_governor import UpstreamRejected, traceint_governor
+from app.route_guard import (
+    avatar_guard, checkin_guard, config_guard, keepalive_guard, parse_guard,
+    run_parse_flow, shutdown_route_executors, RouteDeadlineExceeded,
 )
-from app.scheduler import start_scheduler, shutdown_scheduler, keep_alive_for_user, start_auto_checkin_for_user, stop_auto_checkin_for_user
-from app.core import WegolibCore
 from app.auth import (
-    get_session, get_current_user, get_current_admin,
-    create_access_token, verify_password, get_password_hash,
+    get_session, get_read_session, get_current_user, get_current_admin,
+    create_access_token, verify_password_async, get_password_hash_async,
+    rehash_password_if_needed, shutdown_password_hasher,
     ACCESS_TOKEN_EXPIRE_MINUTES, clear_auth_session_cookie,
-    create_persistent_auth_session, revoke_auth_session_token,
+    create_persistent_auth_session, revoke_auth_session_token, forget_user_identities,
     set_auth_session_cookie, AUTH_SESSION_COOKIE_NAME,
 )
 
@@ -39,8 +58,14 @@ from app.auth import (
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     start_scheduler()
+    start_dual_exchange_warmer()
     yield
     shutdown_scheduler()
+    shutdown_dual_exchange()
+    await aclose_async_client()
+    close_traceint_pool()
+    shutdown_password_hasher()
+    shutdown_route_executors()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -53,6 +78,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(UpstreamRejected)
+async def upstream_rejected_handler(request: Request, exc: UpstreamRejected):
+    """出站限速排队超时或上游熔断中：快速返回 503，而不是继续向 Traceint 施压"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # ============ Models ============
 
 class UserCreate(BaseModel):
@@ -103,6 +138,12 @@ class AdminUserConfigResponse(BaseModel):
     wechat_sch: Optional[str] = None
     wechat_avatar: Optional[str] = None
 
+class AdminUserListResponse(BaseModel):
+    items: List[AdminUserConfigResponse]
+    next_cursor: Optional[str] = None
+    # 仅首页（无游标）或 with_total=true 时统计，翻页时为 None
+    total: Optional[int] = None
+
 class AnnouncementResponse(BaseModel):
     has_announcement: bool
     content: str
@@ -122,6 +163,12 @@ class LocationPresetResponse(BaseModel):
     venue_major: int
     venue_minor: int
 
+class ActivityEventResponse(BaseModel):
+    kind: str
+    success: bool
+    message: str
+    created_at: str
+
 class UpdateAnnouncementDraftRequest(BaseModel):
     content: str = ""
 
@@ -148,46 +195,61 @@ WECHAT_AVATAR_ALLOWED_HOSTS = {
     "static.wechat.v2.traceint.com",
     "wechat.v2.traceint.com",
 }
-DEFAULT_LOCATION_PRESET_MAJOR = 20
-DEFAULT_LOCATION_PRESET_MINOR = 9
-DEFAULT_LOCATION_PRESET_SCHOOL = "南京农业大学（卫岗校区/滨江校区）"
-DEFAULT_LOCATION_PRESET_AREA = "滨江校区"
 CHECKIN_RATE_LIMIT_WINDOW_SECONDS = 60
 CHECKIN_RATE_LIMIT_MAX_ATTEMPTS = 2
-_manual_checkin_attempts: dict[int, list[datetime]] = {}
+# 全部用户合计每分钟允许的手动签到次数，0 表示不限制
+CHECKIN_GLOBAL_RATE_LIMIT_PER_MINUTE = max(0, int(os.getenv("CHECKIN_GLOBAL_RATE_LIMIT_PER_MINUTE", "0")))
+_manual_checkin_limiter = TokenBucketLimiter(
+    "checkin:user", CHECKIN_RATE_LIMIT_MAX_ATTEMPTS, CHECKIN_RATE_LIMIT_WINDOW_SECONDS
+)
+_manual_checkin_global_limiter = (
+    TokenBucketLimiter("checkin:global", CHECKIN_GLOBAL_RATE_LIMIT_PER_MINUTE, 60)
+    if CHECKIN_GLOBAL_RATE_LIMIT_PER_MINUTE
+    else None
+)
+# /api/status 快照缓存的最长有效期（秒）；任何 worker 的配置写入都会递增 Config.version，使快照立即失效
+STATUS_CACHE_TTL_SECONDS = max(0.0, float(os.getenv("STATUS_CACHE_TTL_SEC", "30")))
+# 每个进程最多缓存的用户快照数，超出时淘汰最久未访问的
+STATUS_CACHE_MAX_ENTRIES = max(1, int(os.getenv("STATUS_CACHE_MAX_ENTRIES", "10000")))
+# owner_id -> (配置版本号, 过期时间 monotonic, 响应体, ETag)
+_status_cache: "OrderedDict[int, tuple[Optional[int], float, bytes, str]]" = OrderedDict()
+_status_cache_lock = threading.Lock()
 
 
 def _enforce_manual_checkin_rate_limit(user_id: int) -> None:
-    now = datetime.now()
-    window_start = now - timedelta(seconds=CHECKIN_RATE_LIMIT_WINDOW_SECONDS)
-    recent_attempts = [
-        attempt_at
-        for attempt_at in _manual_checkin_attempts.get(user_id, [])
-        if attempt_at > window_start
-    ]
-    if len(recent_attempts) >= CHECKIN_RATE_LIMIT_MAX_ATTEMPTS:
-        retry_after = max(
-            1,
-            int(
-                CHECKIN_RATE_LIMIT_WINDOW_SECONDS
-                - (now - min(recent_attempts)).total_seconds()
-            ),
-        )
-        _manual_checkin_attempts[user_id] = recent_attempts
+    """数据库后端会执行 SQLite 写事务，异步路由需通过 run_in_threadpool 调用"""
+    retry_after = _manual_checkin_limiter.acquire(user_id)
+    if retry_after:
         raise HTTPException(
             status_code=429,
             detail=f"签到操作太频繁，请 {retry_after} 秒后再试",
             headers={"Retry-After": str(retry_after)},
         )
+    if _manual_checkin_global_limiter is None:
+        return
+    retry_after = _manual_checkin_global_limiter.acquire()
+    if retry_after:
+        # 本次未实际签到，不计入该用户的额度
+        _manual_checkin_limiter.refund(user_id)
+        raise HTTPException(
+            status_code=429,
+            detail=f"当前签到请求较多，请 {retry_after} 秒后再试",
+            headers={"Retry-After": str(retry_after)},
+        )
 
-    recent_attempts.append(now)
-    _manual_checkin_attempts[user_id] = recent_attempts
+def _save_rows(session: Session, *rows) -> None:
+    """提交并刷新 rows；异步路由通过 run_in_threadpool 调用，避免 SQLite 提交与提交后的懒加载落在事件循环上"""
+    for row in rows:
+        session.add(row)
+    session.commit()
+    for row in rows:
+        session.refresh(row)
 
 # ============ Auth Routes ============
 
 @app.post("/api/auth/register", response_model=UserResponse)
-def register(user_in: UserCreate, session: Session = Depends(get_session)):
-    user = get_user_by_username(session, user_in.username)
+async def register(user_in: UserCreate, session: Session = Depends(get_session)):
+    user = await run_in_threadpool(get_user_by_username, session, user_in.username)
     if user:
         raise HTTPException(
             status_code=400,
@@ -195,16 +257,15 @@ def register(user_in: UserCreate, session: Session = Depends(get_session)):
         )
     
     # 第一个注册的用户自动成为管理员（可选逻辑，方便测试）
-    all_users = get_all_users(session)
-    is_admin = len(all_users) == 0
+    is_admin = not await run_in_threadpool(has_any_user, session)
     
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     new_user = User(
         username=user_in.username,
         password_hash=hashed_password,
         is_admin=is_admin
     )
-    create_user(session, new_user)
+    await run_in_threadpool(create_user, session, new_user)
     return {
         "id": new_user.id,
         "username": new_user.username,
@@ -213,25 +274,30 @@ def register(user_in: UserCreate, session: Session = Depends(get_session)):
     }
 
 @app.post("/api/auth/login", response_model=Token)
-def login(
+async def login(
     request: Request,
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(get_session),
 ):
-    user = get_user_by_username(session, form_data.username)
-    if not user or not verify_password(form_data.password, user.password_hash):
+    user = await run_in_threadpool(get_user_by_username, session, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    new_hash = await rehash_password_if_needed(form_data.password, user.password_hash)
+    if new_hash:
+        user.password_hash = new_hash
+        await run_in_threadpool(_save_rows, session, user)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    auth_session_token = create_persistent_auth_session(session, user.id)
+    auth_session_token = await run_in_threadpool(create_persistent_auth_session, session, user.id)
     set_auth_session_cookie(response, auth_session_token, request)
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -334,9 +400,23 @@ def _clear_pending_traceint_authorization(user: User) -> None:
     user.pending_traceint_at = None
 
 
+async def _run_parse(fn, url: str, timings: dict[str, float]):
+    """在专用线程池中执行同步的授权链接解析流程，受 parse 路由并发上限与截止时间约束"""
+    try:
+        return await parse_guard.run_detached(run_parse_flow(fn, url, timings))
+    except RouteDeadlineExceeded:
+        # 解析线程无法中断，继续占用名额直到结束；授权码可能已被使用，需要用户重新获取链接
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="上游响应超时，请稍后重试")
+
+
+def _server_timing_header(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={ms}" for stage, ms in timings.items())
+
+
 @app.post("/api/parse-sessionid")
-def parse_sessionid(
+async def parse_sessionid(
     req: ParseSessionIdRequest,
+    response: Response,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session),
 ):
@@ -349,8 +429,12 @@ def parse_sessionid(
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=WECHAT_CONNECT_HELP_TEXT) from exc
 
+    # 授权流程依赖 pending_traceint_* 等可变字段（可能刚由其他 worker 写入），不能使用身份缓存中的快照
+    current_user = await run_in_threadpool(session.get, User, current_user.id)
+    if current_user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的凭证")
     failures = current_user.wechat_authorization_failures or 0
-    config = get_config_by_owner(session, current_user.id)
+    config = await run_in_threadpool(get_config_by_owner, session, current_user.id)
     has_synced_wechat_profile = bool(
         config and config.wechat_profile_at and config.wechat_nick
     )
@@ -362,17 +446,18 @@ def parse_sessionid(
     if pending_expired:
         _clear_pending_traceint_authorization(current_user)
 
+    # 各阶段耗时（毫秒），通过 Server-Timing 响应头返回，便于在浏览器开发者工具中查看
+    timings: dict[str, float] = {}
     try:
         if current_user.pending_traceint_code:
             code, _ = parse_code_from_url(url)
             if code == current_user.pending_traceint_code:
                 raise ValueError("第二步需要重新授权生成一条新链接")
-            session_id, warning = parse_url_to_checkin_session(url)
+            session_id, warning = await _run_parse(parse_url_to_checkin_session, url, timings)
             profile_response = json.loads(current_user.pending_traceint_profile or "null")
             _clear_pending_traceint_authorization(current_user)
             current_user.wechat_authorization_failures = 0
-            session.add(current_user)
-            session.commit()
+            await run_in_threadpool(_save_rows, session, current_user)
             return {
                 "session_id": session_id,
                 "profile": profile_response,
@@ -381,10 +466,9 @@ def parse_sessionid(
             }
 
         if has_synced_wechat_profile:
-            session_id, warning = parse_url_to_checkin_session(url)
+            session_id, warning = await _run_parse(parse_url_to_checkin_session, url, timings)
             current_user.wechat_authorization_failures = 0
-            session.add(current_user)
-            session.commit()
+            await run_in_threadpool(_save_rows, session, current_user)
             return {
                 "session_id": session_id,
                 "profile": None,
@@ -394,8 +478,8 @@ def parse_sessionid(
 
         if failures >= 1:
             code, _ = parse_code_from_url(url)
-            _authorization, _serverid, profile_snapshot, warning = (
-                parse_url_to_authorization_and_profile(url)
+            _authorization, _serverid, profile_snapshot, warning = await _run_parse(
+                parse_url_to_authorization_and_profile, url, timings
             )
             profile_response = (
                 _snapshot_to_response_dict(profile_snapshot) if profile_snapshot else None
@@ -403,8 +487,7 @@ def parse_sessionid(
             current_user.pending_traceint_code = code
             current_user.pending_traceint_profile = json.dumps(profile_response)
             current_user.pending_traceint_at = datetime.now()
-            session.add(current_user)
-            session.commit()
+            await run_in_threadpool(_save_rows, session, current_user)
             return {
                 "session_id": None,
                 "profile": profile_response,
@@ -412,13 +495,14 @@ def parse_sessionid(
                 "requires_second_link": True,
             }
 
-        session_id, profile_snapshot, warning = parse_url_to_session_and_profile(url)
+        session_id, profile_snapshot, warning = await _run_parse(parse_url_to_session_and_profile, url, timings)
+    except (HTTPException, UpstreamRejected):
+        raise
     except ValueError as exc:
         current_user.wechat_authorization_failures = (
             current_user.wechat_authorization_failures or 0
         ) + 1
-        session.add(current_user)
-        session.commit()
+        await run_in_threadpool(_save_rows, session, current_user)
         if current_user.pending_traceint_code:
             detail = WECHAT_SECOND_STEP_HELP_TEXT
         elif has_synced_wechat_profile:
@@ -432,10 +516,12 @@ def parse_sessionid(
         import logging
         logging.getLogger(__name__).exception("parse-sessionid 未处理异常")
         raise HTTPException(status_code=400, detail=WECHAT_CONNECT_HELP_TEXT) from exc
+    finally:
+        if timings:
+            response.headers["Server-Timing"] = _server_timing_header(timings)
 
     current_user.wechat_authorization_failures = 0
-    session.add(current_user)
-    session.commit()
+    await run_in_threadpool(_save_rows, session, current_user)
 
     profile_response = _snapshot_to_response_dict(profile_snapshot) if profile_snapshot else None
     return {
@@ -446,100 +532,37 @@ def parse_sessionid(
     }
 
 @app.get("/api/wechat-avatar")
-def proxy_wechat_avatar(url: str, current_user: User = Depends(get_current_user)):
+async def proxy_wechat_avatar(request: Request, url: str, current_user: User = Depends(get_current_user)):
     parsed = urllib.parse.urlparse(url)
     if parsed.scheme not in {"http", "https"} or parsed.hostname not in WECHAT_AVATAR_ALLOWED_HOSTS:
         raise HTTPException(status_code=400, detail="头像地址不允许代理")
 
     try:
-        upstream = requests.get(
-            url,
-            headers={
-                "User-Agent": (
-                    "Mozilla/5.0 (iPhone; CPU iPhone OS 18_7 like Mac OS X) "
-                    "AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 "
-                    "MicroMessenger/8.0.67(0x18004239) NetType/WIFI Language/zh_CN"
-                ),
-                "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-            },
-            timeout=15,
-        )
-        upstream.raise_for_status()
-    except Exception as exc:
-        raise HTTPException(status_code=502, detail="头像获取失败") from exc
-
-    content_type = upstream.headers.get("content-type") or "application/octet-stream"
-    if not content_type.startswith("image/"):
-        raise HTTPException(status_code=502, detail="头像响应不是图片")
-
-    return Response(
-        content=upstream.content,
-        media_type=content_type,
-        headers={"Cache-Control": "private, max-age=3600"},
-    )
+        body = await avatar_guard.run(avatar_cache.open(url))
+    except AvatarFetchError as exc:
+        raise HTTPException(status_code=502, detail=str(exc)) from exc
+
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if body.etag:
+        headers["ETag"] = body.etag
+        if _etag_matches(request.headers.get("if-none-match"), body.etag):
+            await body.aclose()
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return StreamingResponse(body.chunks, media_type=body.content_type, headers=headers)
 
 @app.get("/api/announcement", response_model=AnnouncementResponse)
-def get_public_announcement(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_public_announcement(current_user: User = Depends(get_current_user), session: Session = Depends(get_read_session)):
     announcement = get_announcement(session)
     return _build_public_announcement_response(announcement)
 
 @app.get("/api/location-presets", response_model=List[LocationPresetResponse])
 def get_location_presets(
     _current_user: User = Depends(get_current_user),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
-    grouped: dict[tuple[str, str], dict[tuple[int, int], int]] = {}
-    for config in get_all_configs(session):
-        school = (config.wechat_sch or "").strip()
-        area_name = (config.wechat_area_name or "").strip()
-        if not school:
-            continue
-
-        try:
-            venue_major = int(config.major)
-            venue_minor = int(config.minor)
-        except (TypeError, ValueError):
-            continue
-
-        if not (1 <= venue_major <= 65535 and 1 <= venue_minor <= 65535):
-            continue
-        if (
-            venue_major == DEFAULT_LOCATION_PRESET_MAJOR
-            and venue_minor == DEFAULT_LOCATION_PRESET_MINOR
-            and (
-                school != DEFAULT_LOCATION_PRESET_SCHOOL
-                or area_name != DEFAULT_LOCATION_PRESET_AREA
-            )
-        ):
-            continue
-
-        location_key = (school, area_name)
-        beacon_key = (venue_major, venue_minor)
-        beacon_counts = grouped.setdefault(location_key, {})
-        beacon_counts[beacon_key] = beacon_counts.get(beacon_key, 0) + 1
-
-    presets: list[LocationPresetResponse] = []
-    for (school, area_name), beacon_counts in grouped.items():
-        (venue_major, venue_minor), _count = sorted(
-            beacon_counts.items(),
-            key=lambda item: (-item[1], item[0][0], item[0][1]),
-        )[0]
-        presets.append(
-            LocationPresetResponse(
-                school=school,
-                area_name=area_name or None,
-                label=f"{school} · {area_name}" if area_name else school,
-                venue_major=venue_major,
-                venue_minor=venue_minor,
-            )
-        )
-
-    return sorted(presets, key=lambda preset: preset.label)
-
-@app.get("/api/status")
-def get_status(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    config = get_config_by_owner(session, current_user.id)
+    return [LocationPresetResponse(**preset) for preset in load_location_presets(session)]
 
+def _build_status_payload(config: Optional[Config], now: datetime) -> dict:
     if not config:
         return {
             "is_configured": False,
@@ -556,7 +579,6 @@ def get_status(current_user: User = Depends(get_current_user), session: Session
             "wechat_connection_status": "disconnected",
         }
 
-    now = datetime.now()
     auto_checkin_enabled = bool(config.auto_checkin_expire_at and config.auto_checkin_expire_at > now)
     profile_display = get_profile_display(config)
 
@@ -575,9 +597,86 @@ def get_status(current_user: User = Depends(get_current_user), session: Session
         "wechat_connection_status": get_wechat_connection_status(config),
     }
 
+def _load_status_snapshot(session: Session, owner_id: int) -> tuple[bytes, str]:
+    """取当前用户的状态快照（响应体与 ETag），数据库中的配置版本未变且未过期时直接复用缓存"""
+    now_mono = time.monotonic()
+    with _status_cache_lock:
+        cached = _status_cache.get(owner_id)
+        if cached:
+            _status_cache.move_to_end(owner_id)
+    # 只读一列版本号即可判断其他 worker 是否写过该用户的配置
+    if cached and now_mono < cached[1] and cached[0] == get_config_version(session, owner_id):
+        return cached[2], cached[3]
+
+    now = datetime.now()
+    config = get_config_by_owner(session, owner_id)
+    version = config.version if config else None
+    payload = _build_status_payload(config, now)
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+    expires_at = now_mono + STATUS_CACHE_TTL_SECONDS
+    # 自动签到到期时 auto_checkin_enabled 会翻转，快照不能跨过到期时间
+    if config and config.auto_checkin_expire_at and config.auto_checkin_expire_at > now:
+        expires_at = min(expires_at, now_mono + (config.auto_checkin_expire_at - now).total_seconds())
+    # 快照与版本号来自同一次读取；之后的写入会使版本号变化，下次请求重新生成
+    with _status_cache_lock:
+        _status_cache[owner_id] = (version, expires_at, body, etag)
+        _status_cache.move_to_end(owner_id)
+        while len(_status_cache) > STATUS_CACHE_MAX_ENTRIES:
+            _status_cache.popitem(last=False)
+    return body, etag
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+@app.get("/api/status")
+def get_status(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+):
+    body, etag = _load_status_snapshot(session, current_user.id)
+    # 状态因用户而异：只允许浏览器私有缓存，且每次都需带 If-None-Match 重新验证
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/events", response_model=List[ActivityEventResponse])
+def get_activity_events(
+    limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    kind: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_read_session),
+):
+    """当前用户的保活/签到历史：默认最近 N 条，传 since 时按时间段查询"""
+    limit = max(1, min(limit, 500))
+    if since is not None:
+        events = get_events_between(
+            session, current_user.id, since, until or datetime.now(), kind=kind, limit=limit
+        )
+    else:
+        events = get_recent_events(session, current_user.id, limit=limit, kind=kind)
+    return [
+        ActivityEventResponse(
+            kind=event.kind,
+            success=event.success,
+            message=event.message,
+            created_at=_format_datetime(event.created_at),
+        )
+        for event in events
+    ]
+
 @app.post("/api/config")
-def set_config(req: ConfigRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    current = get_config_by_owner(session, current_user.id)
+async def set_config(req: ConfigRequest, current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    owner_id = current_user.id
+    current = await run_in_threadpool(get_config_by_owner, session, owner_id)
 
     session_id = (req.session_id or "").strip()
     if not session_id:
@@ -595,9 +694,10 @@ def set_config(req: ConfigRequest, current_user: User = Depends(get_current_user
 
     profile_dict = _profile_payload_to_dict(req.profile)
     try:
-        update_config_by_owner(
+        await run_in_threadpool(
+            update_config_by_owner,
             session,
-            current_user.id,
+            owner_id,
             session_id,
             int(target_major),
             int(target_minor),
@@ -609,7 +709,9 @@ def set_config(req: ConfigRequest, current_user: User = Depends(get_current_user
         raise HTTPException(status_code=400, detail="保存配置失败，请重试") from exc
 
     try:
-        keep_alive_for_user(current_user.id)
+        await config_guard.run_detached(keep_alive_for_user_async(owner_id))
+    except RouteDeadlineExceeded:
+        pass
     except Exception as exc:
         import logging
         logging.getLogger(__name__).warning("保存后保活失败: %s", exc)
@@ -617,32 +719,53 @@ def set_config(req: ConfigRequest, current_user: User = Depends(get_current_user
     return {"message": "配置已保存"}
 
 @app.post("/api/checkin")
-def trigger_checkin(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    config = get_config_by_owner(session, current_user.id)
+async def trigger_checkin(current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
+    owner_id = current_user.id
+    config = await run_in_threadpool(get_config_by_owner, session, owner_id)
 
     if not config or not config.session_id:
         raise HTTPException(status_code=400, detail="未配置，请先连接微信")
 
-    _enforce_manual_checkin_rate_limit(current_user.id)
-
-    core = WegolibCore(config.session_id)
-    result = core.sign_in(config.major, config.minor)
-
-    log_checkin_by_owner(session, current_user.id, result["success"], result["message"])
+    await run_in_threadpool(_enforce_manual_checkin_rate_limit, owner_id)
 
-    if result["success"]:
-        now = datetime.now()
-        expire_at = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        config.auto_checkin_expire_at = expire_at
-        session.add(config)
-        session.commit()
-        start_auto_checkin_for_user(current_user.id, expire_at)
+    try:
+        return await checkin_guard.run_detached(_checkin_and_record(owner_id, config))
+    except RouteDeadlineExceeded:
+        # sign.html 可能已经发出：不取消，结果在后台记录后可在状态中查看
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"success": False, "pending": True, "message": "签到仍在处理中，请稍后刷新状态查看结果"},
+        )
 
+async def _checkin_and_record(owner_id: int, config: Config) -> dict:
+    """签到并记录结果；超过路由截止时间时在后台继续执行完"""
+    result = await AsyncWegolibCore(config.session_id).sign_in(config.major, config.minor)
+    await run_in_threadpool(_record_manual_checkin, owner_id, result)
     return result
 
+def _record_manual_checkin(owner_id: int, result: dict) -> None:
+    """记录手动签到结果；成功后开启当天的自动签到（在线程池中执行，可能晚于请求结束，因此使用独立的 Session）"""
+    with Session(engine) as session:
+        log_checkin_by_owner(session, owner_id, result["success"], result["message"])
+
+        if result["success"]:
+            config = get_config_by_owner(session, owner_id)
+            if config is None:
+                return
+            now = datetime.now()
+            expire_at = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            config.auto_checkin_expire_at = expire_at
+            config.next_checkin_at = start_auto_checkin_for_user(owner_id, expire_at)
+            session.add(config)
+            session.commit()
+
 @app.post("/api/keepalive")
-def trigger_keepalive(current_user: User = Depends(get_current_user)):
-    keep_alive_for_user(current_user.id)
+async def trigger_keepalive(current_user: User = Depends(get_current_user)):
+    try:
+        await keepalive_guard.run_detached(keep_alive_for_user_async(current_user.id))
+    except RouteDeadlineExceeded:
+        # 保活可能已轮换 session_id，不取消，结果在后台记录
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"message": "保活仍在处理中"})
     return {"message": "已触发保活"}
 
 @app.post("/api/auto-checkin/enable")
@@ -653,9 +776,9 @@ def enable_auto_checkin(current_user: User = Depends(get_current_user), session:
     now = datetime.now()
     expire_at = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
     config.auto_checkin_expire_at = expire_at
+    config.next_checkin_at = start_auto_checkin_for_user(current_user.id, expire_at)
     session.add(config)
     session.commit()
-    start_auto_checkin_for_user(current_user.id, expire_at)
     return {"message": "开启成功"}
 
 @app.post("/api/auto-checkin/disable")
@@ -664,6 +787,7 @@ def disable_auto_checkin(current_user: User = Depends(get_current_user), session
     if not config:
         raise HTTPException(status_code=400, detail="未配置，请先连接微信")
     config.auto_checkin_expire_at = None
+    config.next_checkin_at = None
     session.add(config)
     session.commit()
     stop_auto_checkin_for_user(current_user.id)
@@ -672,7 +796,7 @@ def disable_auto_checkin(current_user: User = Depends(get_current_user), session
 # ============ Admin Routes ============
 
 @app.get("/api/admin/announcement", response_model=AdminAnnouncementResponse)
-def get_admin_announcement(admin: User = Depends(get_current_admin), session: Session = Depends(get_session)):
+def get_admin_announcement(admin: User = Depends(get_current_admin), session: Session = Depends(get_read_session)):
     announcement = get_announcement(session)
     return _build_admin_announcement_response(announcement)
 
@@ -720,41 +844,100 @@ def unpublish_admin_announcement(admin: User = Depends(get_current_admin), sessi
     session.refresh(announcement)
     return _build_admin_announcement_response(announcement)
 
-@app.get("/api/admin/users", response_model=List[AdminUserConfigResponse])
-def get_admin_users(admin: User = Depends(get_current_admin), session: Session = Depends(get_session)):
-    """管理员：获取所有用户状态"""
-    users = get_all_users(session)
-    result = []
-    for user in users:
-        config = get_config_by_owner(session, user.id)
-        
-        info = {
-            "user_id": user.id,
-            "username": user.username,
-            "is_configured": False,
-            "last_checkin": "从未",
-            "status": "未配置"
-        }
-        
-        if config:
-            info["is_configured"] = bool(config.session_id)
-            info["status"] = "活跃" if config.is_active and config.session_id else "已登出"
-            if config.last_checkin:
-                info["last_checkin"] = config.last_checkin.strftime("%Y-%m-%d %H:%M:%S")
-            info["profile_display"] = get_profile_display(config)
-            info["wechat_nick"] = config.wechat_nick
-            info["wechat_student_name"] = config.wechat_student_name
-            info["wechat_student_no"] = config.wechat_student_no
-            info["wechat_sch"] = config.wechat_sch
-            info["wechat_avatar"] = _proxied_wechat_avatar_url(config.wechat_avatar)
-        
-        result.append(info)
-    return result
+ADMIN_USERS_PAGE_MAX = 200
+
+def _build_admin_user_info(user: User, config: Optional[Config]) -> dict[str, Any]:
+    info = {
+        "user_id": user.id,
+        "username": user.username,
+        "is_configured": False,
+        "last_checkin": "从未",
+        "status": "未配置"
+    }
+    
+    if config:
+        info["is_configured"] = bool(config.session_id)
+        info["status"] = "活跃" if config.is_active and config.session_id else "已登出"
+        if config.last_checkin:
+            info["last_checkin"] = config.last_checkin.strftime("%Y-%m-%d %H:%M:%S")
+        info["profile_display"] = get_profile_display(config)
+        info["wechat_nick"] = config.wechat_nick
+        info["wechat_student_name"] = config.wechat_student_name
+        info["wechat_student_no"] = config.wechat_student_no
+        info["wechat_sch"] = config.wechat_sch
+        info["wechat_avatar"] = _proxied_wechat_avatar_url(config.wechat_avatar)
+    return info
+
+@app.get("/api/admin/users", response_model=AdminUserListResponse)
+def get_admin_users(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    school: Optional[str] = None,
+    configured: Optional[bool] = None,
+    sort: str = "id",
+    order: str = "asc",
+    with_total: bool = False,
+    admin: User = Depends(get_current_admin),
+    session: Session = Depends(get_read_session),
+):
+    """
+    管理员：分页获取用户状态（单次 JOIN 查询，支持筛选、排序与游标分页）。
+    总数需要扫描整个筛选结果，只在首页（无游标）或显式 with_total=true 时统计。
+    """
+    if status and status not in ADMIN_USER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status 仅支持 {', '.join(ADMIN_USER_STATUSES)}")
+    if sort not in ADMIN_USER_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort 仅支持 {', '.join(ADMIN_USER_SORT_FIELDS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order 仅支持 asc、desc")
+    limit = max(1, min(limit, ADMIN_USERS_PAGE_MAX))
+    school = (school or "").strip() or None
+
+    try:
+        rows, next_cursor = list_admin_users(
+            session,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            school=school,
+            configured=configured,
+            sort=sort,
+            descending=order == "desc",
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    return {
+        "items": [_build_admin_user_info(user, config) for user, config in rows],
+        "next_cursor": next_cursor,
+        "total": (
+            count_admin_users(session, status=status, school=school, configured=configured)
+            if cursor is None or with_total
+            else None
+        ),
+    }
+
+@app.get("/api/admin/checkin-latency")
+def get_admin_checkin_latency(admin: User = Depends(get_current_admin)):
+    """管理员：classic / prearmed 两种签到方式的耗时对比与服务器时钟偏移"""
+    return {
+        "modes": checkin_latency_summary(),
+        "server_clock": SERVER_CLOCK.snapshot(),
+    }
+
+@app.get("/api/admin/upstream")
+def get_admin_upstream(admin: User = Depends(get_current_admin)):
+    """管理员：Traceint 出站限速配置、被拒绝的请求数与各主机熔断状态"""
+    return traceint_governor.snapshot()
 
 @app.delete("/api/admin/users/{user_id}")
 def delete_admin_user(user_id: int, admin: User = Depends(get_current_admin), session: Session = Depends(get_session)):
     """管理员：删除用户"""
     delete_user(session, user_id)
+    with _status_cache_lock:
+        _status_cache.pop(user_id, None)
+    forget_user_identities(user_id)
     return {"message": "用户已删除"}
 
 @app.post("/api/admin/users/{user_id}/logout")
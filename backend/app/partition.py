@@ -0,0 +1,159 @@
+"""后台任务分区：存活 worker 组成一致性散列环，每个 worker 只处理落在自己区间内的用户。"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from sqlmodel import Session
+
+from app.database import engine, get_live_members, heartbeat_member, owner_hash, remove_member
+from app.leader import LEADER_HEARTBEAT_SECONDS, LEADER_LEASE_SECONDS, leader_elector
+
+logger = logging.getLogger(__name__)
+
+# 每个成员在环上的虚拟节点数，越大各成员分到的用户越均匀
+PARTITION_VNODES = max(1, int(os.getenv("PARTITION_VNODES", "64")))
+
+_RING_SPACE = 1 << 32
+
+
+def _vnode_position(holder: str, index: int) -> int:
+    digest = hashlib.md5(f"{holder}#{index}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big")
+
+
+def build_ring(members: List[str], vnodes: int = PARTITION_VNODES) -> List[Tuple[int, str]]:
+    return sorted((_vnode_position(holder, i), holder) for holder in members for i in range(vnodes))
+
+
+def ring_owner(ring: List[Tuple[int, str]], key_hash: int) -> Optional[str]:
+    """散列值归属环上顺时针方向的第一个虚拟节点（位置严格大于散列值，越过末尾回到开头）"""
+    if not ring:
+        return None
+    index = bisect.bisect_right(ring, (key_hash, "\uffff"))
+    return ring[index % len(ring)][1]
+
+
+def ranges_for(ring: List[Tuple[int, str]], holder: str) -> List[Tuple[int, int]]:
+    """holder 在环上拥有的 [start, end) 区间（已合并相邻区间），与 ring_owner 的归属规则一致"""
+    if not ring:
+        return []
+    ranges: List[Tuple[int, int]] = []
+    for index, (position, node_holder) in enumerate(ring):
+        if node_holder != holder:
+            continue
+        if index == 0:
+            # 第一个虚拟节点还拥有从最后一个节点到环尾的区间
+            if ring[-1][0] < _RING_SPACE:
+                ranges.append((ring[-1][0], _RING_SPACE))
+            ranges.append((0, position))
+        else:
+            ranges.append((ring[index - 1][0], position))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(r for r in ranges if r[0] < r[1]):
+        if merged and merged[-1][1] >= start:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class PartitionMembership:
+    """
+    后台线程定期在成员表中心跳，读取存活成员并重建散列环；成员变化时回调 on_change，
+    由调度器据此重新对账本分区的自动签到名单。心跳连续失败超过有效期时本进程不再拥有任何用户，
+    避免其他成员接管后重复处理。
+    """
+
+    def __init__(self, holder: str):
+        self.holder = holder
+        self._members: List[str] = []
+        self._ring: List[Tuple[int, str]] = []
+        self._ranges: List[Tuple[int, int]] = []
+        self._last_heartbeat = 0.0
+        self._lock = threading.Lock()
+        self._on_change: Optional[Callable[[], None]] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ranges(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            return list(self._ranges)
+
+    @property
+    def members(self) -> List[str]:
+        with self._lock:
+            return list(self._members)
+
+    def owns(self, owner_key: int) -> bool:
+        with self._lock:
+            return ring_owner(self._ring, owner_hash(owner_key)) == self.holder
+
+    def start(self, on_change: Callable[[], None]) -> None:
+        self._on_change = on_change
+        self._stopping.clear()
+        self._heartbeat()
+        self._thread = threading.Thread(target=self._run, name="partition-membership", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout=LEADER_HEARTBEAT_SECONDS + 5)
+        self._thread = None
+        self._apply([])
+        try:
+            with Session(engine) as session:
+                remove_member(session, self.holder)
+        except Exception as e:
+            logger.warning(f"Failed to leave partition membership: {e}")
+
+    def _heartbeat(self) -> None:
+        now = time.monotonic()
+        try:
+            with Session(engine) as session:
+                heartbeat_member(session, self.holder, LEADER_LEASE_SECONDS)
+                members = get_live_members(session)
+        except Exception as e:
+            logger.warning(f"Partition membership heartbeat failed: {e}")
+            if self._ranges and now - self._last_heartbeat >= LEADER_LEASE_SECONDS:
+                logger.warning("Partition membership expired, releasing all owned users")
+                self._apply([])
+            return
+        self._last_heartbeat = now
+        if self.holder not in members:
+            members = sorted(members + [self.holder])
+        self._apply(members)
+
+    def _apply(self, members: List[str]) -> None:
+        with self._lock:
+            if members == self._members:
+                return
+            self._members = members
+            self._ring = build_ring(members)
+            self._ranges = ranges_for(self._ring, self.holder)
+        share = sum(end - start for start, end in self._ranges) / _RING_SPACE
+        logger.info(
+            f"Partition membership changed: {len(members)} worker(s), "
+            f"this worker owns {share:.1%} of users"
+        )
+        if self._on_change:
+            try:
+                self._on_change()
+            except Exception as e:
+                logger.error(f"Partition rebalance failed: {e}")
+
+    def _run(self) -> None:
+        while not self._stopping.wait(LEADER_HEARTBEAT_SECONDS):
+            self._heartbeat()
+
+
+partition_membership = PartitionMembership(leader_elector.holder)
@@ -0,0 +1,129 @@
+"""令牌桶限流：每个活跃 key 只保存 (令牌数, 更新时间)，空闲补满的 key 自动回收；可选内存或数据库（多进程共享）后端。"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlmodel import Session
+
+from app.database import engine, purge_rate_limit_buckets, refund_rate_limit_token, take_rate_limit_token
+
+logger = logging.getLogger(__name__)
+
+# database：状态存于数据库，多个 worker 共享同一额度；memory：仅本进程内计数
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "database").strip().lower()
+# 内存后端最多保留的 key 数，超出时淘汰最久未使用的 key
+RATE_LIMIT_MAX_KEYS = max(1, int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000")))
+# 清理空闲 key 的最小间隔（秒）
+RATE_LIMIT_PURGE_INTERVAL_SECONDS = 60
+
+
+class MemoryBucketStore:
+    """进程内令牌桶：OrderedDict 按最近使用排序，淘汰已补满的和超出容量的 key"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0.0
+
+    def refund(self, key: str, capacity: float, rate: float, now: float) -> None:
+        with self._lock:
+            if key not in self._buckets:
+                return
+            tokens, updated_at = self._buckets[key]
+            self._buckets[key] = (min(capacity, tokens + (now - updated_at) * rate + 1), now)
+
+    def purge(self, prefix: str, idle_before: float) -> int:
+        with self._lock:
+            stale = [
+                key for key, (_tokens, updated_at) in self._buckets.items()
+                if updated_at < idle_before and key.startswith(prefix)
+            ]
+            for key in stale:
+                del self._buckets[key]
+            return len(stale)
+
+
+class DatabaseBucketStore:
+    """令牌桶状态存于 RateLimitBucket 表，所有 worker 共享"""
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        with Session(engine) as session:
+            return take_rate_limit_token(session, key, capacity, rate, now)
+
+    def refund(self, key: str, capacity: float, rate: float, now: float) -> None:
+        with Session(engine) as session:
+            refund_rate_limit_token(session, key, capacity, rate, now)
+
+    def purge(self, prefix: str, idle_before: float) -> int:
+        with Session(engine) as session:
+            return purge_rate_limit_buckets(session, prefix, idle_before)
+
+
+def _create_store():
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBucketStore()
+    if RATE_LIMIT_BACKEND != "database":
+        logger.warning(f"Unknown RATE_LIMIT_BACKEND={RATE_LIMIT_BACKEND!r}, falling back to database")
+    return DatabaseBucketStore()
+
+
+class TokenBucketLimiter:
+    """
+    容量为 burst、每 period 秒补满的令牌桶。
+    acquire 返回 0 表示放行，否则返回建议的 Retry-After 秒数（向上取整）。
+    """
+
+    def __init__(self, name: str, burst: int, period: float, store=None):
+        self.name = name
+        self.capacity = float(max(1, burst))
+        self.rate = self.capacity / max(1e-3, period)
+        self.store = store if store is not None else _create_store()
+        self._prefix = f"{name}:"
+        self._next_purge = 0.0
+
+    @property
+    def refill_seconds(self) -> float:
+        """空桶补满所需时间；超过该时间未使用的 key 与新 key 等价，可以回收"""
+        return self.capacity / self.rate
+
+    def _key(self, key) -> str:
+        return f"{self._prefix}{key}"
+
+    def acquire(self, key="*", now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        self._maybe_purge(now)
+        wait = self.store.take(self._key(key), self.capacity, self.rate, now)
+        return 0 if wait <= 0 else max(1, math.ceil(wait))
+
+    def refund(self, key="*", now: Optional[float] = None) -> None:
+        self.store.refund(self._key(key), self.capacity, self.rate, time.time() if now is None else now)
+
+    def _maybe_purge(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        self._next_purge = now + RATE_LIMIT_PURGE_INTERVAL_SECONDS
+        try:
+            purged = self.store.purge(self._prefix, now - self.refill_seconds)
+        except Exception as e:
+            logger.warning(f"Failed to purge idle {self.name} rate limit buckets: {e}")
+            return
+        if purged:
+            logger.debug(f"Purged {purged} idle {self.name} rate limit bucket(s)")
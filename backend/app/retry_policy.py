@@ -0,0 +1,189 @@
+"""Traceint 请求统一重试策略：全抖动指数退避、按操作的总截止时间、进程级重试预算。"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from app.upstream_governor import UpstreamRejected, is_upstream_failure
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 第 n 次重试前在 [0, min(MAX_DELAY, BASE_DELAY * 2^n)] 内随机等待
+RETRY_BASE_DELAY_SECONDS = max(0.01, float(os.getenv("TRACEINT_RETRY_BASE_DELAY_SEC", "0.5")))
+RETRY_MAX_DELAY_SECONDS = max(RETRY_BASE_DELAY_SECONDS, float(os.getenv("TRACEINT_RETRY_MAX_DELAY_SEC", "4")))
+# 重试预算：每个首次请求存入 RATIO 个重试额度，另按 MIN_PER_SEC 匀速补充（低流量时也能重试），最多积累 BURST 个。
+# 上游整体故障时重试最多使出站请求放大 (1 + RATIO) 倍，而不是 attempts 倍
+RETRY_BUDGET_RATIO = max(0.0, float(os.getenv("TRACEINT_RETRY_BUDGET_RATIO", "0.2")))
+RETRY_BUDGET_MIN_PER_SEC = max(0.0, float(os.getenv("TRACEINT_RETRY_BUDGET_MIN_PER_SEC", "1")))
+RETRY_BUDGET_BURST = max(1.0, float(os.getenv("TRACEINT_RETRY_BUDGET_BURST", "10")))
+# 剩余时间不足以完成一次请求时不再重试
+_MIN_ATTEMPT_SECONDS = 1.0
+
+_TRANSIENT_REQUESTS_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+)
+
+
+class RetryBudget:
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_sec: float = RETRY_BUDGET_MIN_PER_SEC,
+        burst: float = RETRY_BUDGET_BURST,
+    ):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.min_per_sec)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                self.exhausted += 1
+                return False
+            self._tokens -= 1
+            return True
+
+
+retry_budget = RetryBudget()
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return None
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """网络层错误与 5xx/429 可重试；本地限速/熔断拒绝、4xx 与业务错误不重试"""
+    if isinstance(exc, UpstreamRejected):
+        return False
+    if isinstance(exc, (_TRANSIENT_REQUESTS_ERRORS, httpx.TransportError)):
+        return True
+    status_code = _status_code(exc)
+    return status_code is not None and is_upstream_failure(status_code)
+
+
+def is_connect_error(exc: BaseException) -> bool:
+    """
+    请求确定没有发到服务端的错误（建连阶段失败），非幂等请求也可以安全重试。
+    requests 的 SSLError 也可能发生在复用连接读取响应时（请求已发出），因此不算在内。
+    """
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.SSLError) or not isinstance(exc, requests.exceptions.ConnectionError):
+        return False
+    # requests 把 urllib3 的 MaxRetryError 放在 args[0]，真正的原因在其 reason 上
+    cause = exc.args[0] if exc.args else None
+    return isinstance(getattr(cause, "reason", cause), NewConnectionError) or isinstance(
+        exc.__context__, NewConnectionError
+    )
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    attempts 为最多尝试次数（含首次），deadline 为整个操作（含等待）的总时长上限。
+    被调用的函数接收本次尝试剩余的秒数，应把它作为请求超时的上限。
+    """
+
+    name: str
+    attempts: int
+    deadline: float
+    base_delay: float = RETRY_BASE_DELAY_SECONDS
+    max_delay: float = RETRY_MAX_DELAY_SECONDS
+
+    def backoff(self, retry: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+    def _next_delay(
+        self,
+        exc: Exception,
+        attempt: int,
+        deadline_at: float,
+        retryable: Callable[[BaseException], bool],
+    ) -> Optional[float]:
+        """返回下次重试前的等待秒数；不应再重试时返回 None"""
+        if attempt + 1 >= self.attempts or not retryable(exc):
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay + _MIN_ATTEMPT_SECONDS > deadline_at:
+            return None
+        if not retry_budget.withdraw():
+            logger.warning(f"{self.name}: retry budget exhausted, giving up after attempt {attempt + 1}: {exc}")
+            return None
+        logger.warning(
+            f"{self.name}: transient error (attempt {attempt + 1}/{self.attempts}), "
+            f"retrying in {delay:.2f}s: {exc}"
+        )
+        return delay
+
+    def call(self, fn: Callable[[float], T], retryable: Callable[[BaseException], bool] = is_transient_error) -> T:
+        deadline_at = time.monotonic() + self.deadline
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return fn(max(0.1, deadline_at - time.monotonic()))
+            except Exception as exc:
+                delay = self._next_delay(exc, attempt, deadline_at, retryable)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(
+        self,
+        fn: Callable[[float], Awaitable[T]],
+        retryable: Callable[[BaseException], bool] = is_transient_error,
+    ) -> T:
+        deadline_at = time.monotonic() + self.deadline
+        retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await fn(max(0.1, deadline_at - time.monotonic()))
+            except Exception as exc:
+                delay = self._next_delay(exc, attempt, deadline_at, retryable)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+KEEPALIVE_RETRY = RetryPolicy("keep-alive", attempts=3, deadline=15)
+# getTime 可以放心重试；sign.html 只在建连失败时重试（见 is_connect_error）
+CHECKIN_RETRY = RetryPolicy("check-in", attempts=3, deadline=18)
+VALIDATE_RETRY = RetryPolicy("JWT validate", attempts=4, deadline=30)
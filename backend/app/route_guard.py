@@ -0,0 +1,153 @@
+"""依赖 Traceint 上游的路由：按路由限制并发、给整个请求设定截止时间。"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+# 等待并发名额的最长时间（秒），超时返回 503
+ROUTE_QUEUE_WAIT_SECONDS = max(0.0, float(os.getenv("ROUTE_QUEUE_WAIT_SEC", "2")))
+ROUTE_RETRY_AFTER_SECONDS = 3
+# 授权链接解析流程（同步 requests + 双换票线程）使用的专用线程数
+PARSE_WORKERS = max(1, int(os.getenv("PARSE_WORKERS", "8")))
+
+
+class RouteDeadlineExceeded(Exception):
+    """run_detached 的调用超过截止时间，仍在后台继续执行"""
+
+
+class RouteGuard:
+    """
+    单个路由的并发上限与截止时间。
+    信号量按事件循环惰性创建（Python 3.9 的 asyncio.Semaphore 创建时即绑定事件循环）。
+    """
+
+    def __init__(self, name: str, concurrency: int, deadline: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.deadline = deadline
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        # 超时后继续在后台执行的任务（事件循环只持有任务的弱引用）
+        self._detached: set = set()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _acquire(self, semaphore: asyncio.Semaphore) -> None:
+        """占用一个并发名额；排队超过 ROUTE_QUEUE_WAIT_SECONDS 时返回 503"""
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=ROUTE_QUEUE_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Route {self.name} is saturated ({self.concurrency} in flight), rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": str(ROUTE_RETRY_AFTER_SECONDS)},
+            )
+
+    async def run(self, awaitable, deadline: Optional[float] = None):
+        """在并发名额内执行 awaitable，超过截止时间返回 504"""
+        timeout = self.deadline if deadline is None else deadline
+        semaphore = self._semaphore()
+        try:
+            await self._acquire(semaphore)
+        except BaseException:
+            # 未拿到名额时协程不会被执行，主动关闭以免产生 "never awaited" 警告
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Route {self.name} exceeded its {timeout:g}s deadline")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="上游响应超时，请稍后重试",
+            )
+        finally:
+            semaphore.release()
+
+    async def run_detached(self, awaitable, deadline: Optional[float] = None):
+        """
+        有副作用或无法中断的调用（签到、保活、线程中的授权解析）：超过截止时间时不取消，
+        让它在后台执行完（包括记录结果），并一直占用并发名额直到真正结束，
+        使在途的上游请求与线程数始终受并发上限约束。
+        按时完成返回结果；超时抛出 RouteDeadlineExceeded，由路由决定响应（如 202 处理中）。
+        """
+        timeout = self.deadline if deadline is None else deadline
+        semaphore = self._semaphore()
+        try:
+            await self._acquire(semaphore)
+        except BaseException:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        task = asyncio.ensure_future(awaitable)
+        self._detached.add(task)
+        task.add_done_callback(lambda done: self._finish_detached(done, semaphore))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Route {self.name} exceeded its {timeout:g}s deadline, finishing in the background")
+            raise RouteDeadlineExceeded(self.name) from None
+
+    def _finish_detached(self, task: asyncio.Future, semaphore: asyncio.Semaphore) -> None:
+        semaphore.release()
+        self._detached.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Route {self.name} background call failed: {task.exception()}")
+
+
+def _env_guard(name: str, concurrency: int, deadline: float) -> RouteGuard:
+    key = name.upper()
+    return RouteGuard(
+        name,
+        int(os.getenv(f"ROUTE_{key}_CONCURRENCY", str(concurrency))),
+        float(os.getenv(f"ROUTE_{key}_DEADLINE_SEC", str(deadline))),
+    )
+
+
+checkin_guard = _env_guard("checkin", 16, 20)
+keepalive_guard = _env_guard("keepalive", 16, 15)
+config_guard = _env_guard("config", 16, 15)
+parse_guard = _env_guard("parse", PARSE_WORKERS, 45)
+avatar_guard = _env_guard("avatar", 32, 15)
+
+_parse_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_parse_executor() -> ThreadPoolExecutor:
+    """
+    授权链接解析仍是同步流程，放在专用线程池里执行，不占用 FastAPI 共享线程池；
+    名额由 parse_guard 限制，因此线程数与其并发上限一致。
+    """
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="traceint-parse")
+    return _parse_executor
+
+
+async def run_parse_flow(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parse_executor(), fn, *args)
+
+
+def shutdown_route_executors() -> None:
+    global _parse_executor
+    executor, _parse_executor = _parse_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
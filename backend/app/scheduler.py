@@ -1,21 +1,64 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from app.database import (
-    engine, Session, Config,
-    get_all_active_configs, get_config_by_owner,
-    update_session_id_for_config,
-    log_checkin_by_owner
+    engine, Session, Config, EVENT_KIND_CHECKIN, EVENT_KIND_KEEPALIVE,
+    compact_activity_events,
+    get_all_active_configs, get_active_configs_in_slot, get_auto_checkin_configs, get_config_by_owner, select,
 )
-from app.core import WegolibCore
-from datetime import datetime, timedelta
+from app.leader import leader_elector
+from app.partition import partition_membership
+from app.http_pool import POOL_IDLE_SECONDS, evict_idle_connections
+from app.core import WegolibCore, AsyncWegolibCore, new_async_client, CHECKIN_MODE, SERVER_CLOCK, PreparedSignIn
+from app.writeback import ConfigOutcome, result_writer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Optional
+import asyncio
+import heapq
 import logging
+import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
 scheduler = BackgroundScheduler()
 
-def _keep_alive_single(session: Session, config: Config) -> bool:
-    """为单个用户执行保活"""
+KEEPALIVE_INTERVAL_SECONDS = max(60, int(os.getenv("KEEPALIVE_INTERVAL_SECONDS", "300")))
+# 时间轮槽位数：每个用户按 owner_id 散列到固定槽位，每个 tick 只处理一个槽位，
+# 使上游请求在整个保活周期内均匀分布；1 表示每个周期一次性处理全部用户
+KEEPALIVE_WHEEL_SLOTS = max(1, int(os.getenv("KEEPALIVE_WHEEL_SLOTS", "10")))
+KEEPALIVE_TICK_SECONDS = KEEPALIVE_INTERVAL_SECONDS / KEEPALIVE_WHEEL_SLOTS
+# 保活并发上限：1 表示逐个串行；每个用户请求前的随机延迟仍在 keep_alive 内部执行
+KEEPALIVE_CONCURRENCY = max(1, int(os.getenv("KEEPALIVE_CONCURRENCY", "8")))
+# 保活执行方式：threads 使用线程池 + 同步 requests；async 在单个事件循环内用 httpx 并发
+KEEPALIVE_MODE = os.getenv("KEEPALIVE_MODE", "threads").strip().lower()
+
+# 最近一次保活轮询的统计（供日志与排查使用）
+last_keepalive_sweep: dict[str, Any] = {}
+
+# 自动签到间隔（秒）
+AUTO_CHECKIN_INTERVAL_SECONDS = max(60, int(os.getenv("AUTO_CHECKIN_INTERVAL_SECONDS", str(18 * 60))))
+# 签到引擎检查到期用户的间隔（秒）
+AUTO_CHECKIN_TICK_SECONDS = max(1, int(os.getenv("AUTO_CHECKIN_TICK_SECONDS", "5")))
+# 同一批到期用户的签到并发上限
+AUTO_CHECKIN_CONCURRENCY = max(1, int(os.getenv("AUTO_CHECKIN_CONCURRENCY", "16")))
+# 各 worker 与数据库对账本分区自动签到名单的间隔（秒），用于接收其他 worker 上开启/关闭的自动签到
+AUTO_CHECKIN_SYNC_SECONDS = max(5, int(os.getenv("AUTO_CHECKIN_SYNC_SECONDS", "30")))
+# 重启后已错过签到时间的用户在该时间窗口（秒）内均匀补签，避免同一时刻集中请求上游
+AUTO_CHECKIN_CATCHUP_SECONDS = max(0, int(os.getenv("AUTO_CHECKIN_CATCHUP_SECONDS", "300")))
+
+# prearmed 模式下每个 tick 预先生成到下一个 tick 前到期的签到载荷（RSA 加密等），由派发线程在各自到期时刻只发 sign.html
+AUTO_CHECKIN_PREARM_SECONDS = float(AUTO_CHECKIN_TICK_SECONDS) if CHECKIN_MODE == "prearmed" else 0.0
+# 预生成载荷实际发出时晚于计划时间超过该秒数（签到线程排队等），按当前时间重新生成载荷
+AUTO_CHECKIN_PREARM_MAX_LAG_SECONDS = max(0.0, float(os.getenv("AUTO_CHECKIN_PREARM_MAX_LAG_SEC", "1")))
+
+# 最近一批自动签到的统计
+last_checkin_batch: dict[str, Any] = {}
+
+def _keep_alive_single(config: Config) -> bool:
+    """为单个用户执行保活；结果进入写回缓冲"""
     if not config.session_id:
         return False
     
@@ -24,36 +67,93 @@ def _keep_alive_single(session: Session, config: Config) -> bool:
     try:
         core = WegolibCore(config.session_id)
         result = core.keep_alive()
+        return _record_keep_alive_result(config.id, config.owner_id, config.session_id, result)
+    except Exception as e:
+        logger.error(f"Keep-alive error for {user_identifier}...: {e}")
+        return False
 
-        # 如果 session_id 被服务器更新
-        if result.get("new_session_id"):
-            update_session_id_for_config(session, config, result["new_session_id"])
-            logger.info(f"Session ID updated for {user_identifier}...")
+def _record_keep_alive_result(
+    config_id: int,
+    owner_id: Optional[int],
+    session_id: str,
+    result: dict,
+    flush: bool = False,
+) -> bool:
+    """把保活结果交给写回缓冲（同步与异步保活共用）"""
+    user_identifier = f"User(ID={owner_id})"
 
-        # 记录保活结果
-        config.last_keepalive = datetime.now()
-        config.last_log = f"KeepAlive: {result['message']}"
-        session.add(config)
-        session.commit()
+    now = datetime.now()
+    outcome = ConfigOutcome(
+        config_id=config_id,
+        owner_id=owner_id,
+        last_keepalive=now,
+        last_log=f"KeepAlive: {result['message']}",
+    )
+    # 如果 session_id 被服务器更新
+    if result.get("new_session_id"):
+        outcome.rotate_from = session_id
+        outcome.rotate_to = result["new_session_id"]
+        logger.info(f"Session ID updated for {user_identifier}...")
 
-        if result["success"]:
-            logger.info(f"Keep-alive success for {user_identifier}...")
-        else:
-            logger.warning(f"Keep-alive failed for {user_identifier}...: {result['message']}")
+    result_writer.submit(outcome)
+    result_writer.submit_event(owner_id, EVENT_KIND_KEEPALIVE, result["success"], result["message"], now)
+    if flush:
+        result_writer.flush()
 
-        return result["success"]
+    if result["success"]:
+        logger.info(f"Keep-alive success for {user_identifier}...")
+    else:
+        logger.warning(f"Keep-alive failed for {user_identifier}...: {result['message']}")
+
+    return result["success"]
+
+def _prepare_checkin(config: Config, due: float) -> Optional[PreparedSignIn]:
+    """按计划签到时间预先生成载荷；失败时返回 None，到期后退回普通签到"""
+    try:
+        return WegolibCore(config.session_id).prepare_sign_in(config.major, config.minor, at=due)
     except Exception as e:
-        logger.error(f"Keep-alive error for {user_identifier}...: {e}")
-        return False
+        logger.warning(f"Failed to pre-arm check-in for User(ID={config.owner_id})...: {e}")
+        return None
 
-def _checkin_single(session: Session, config: Config) -> bool:
+def _checkin_prepared(
+    config: Config,
+    next_checkin_at: Optional[datetime],
+    prepared: Optional[PreparedSignIn],
+) -> bool:
+    """发送前按本机时钟再核对一次计划时间：早到则补足等待，晚到过多则按当前时间重新生成载荷"""
+    if prepared is not None:
+        lag = time.time() - prepared.target_time
+        if lag < 0:
+            time.sleep(-lag)
+        elif lag > AUTO_CHECKIN_PREARM_MAX_LAG_SECONDS:
+            logger.info(f"Pre-armed check-in for User(ID={config.owner_id}) is {lag:.1f}s late, re-arming")
+            prepared = _prepare_checkin(config, time.time())
+    return _checkin_single(config, next_checkin_at, prepared)
+
+def _checkin_single(
+    config: Config,
+    next_checkin_at: Optional[datetime] = None,
+    prepared: Optional[PreparedSignIn] = None,
+) -> bool:
     if not config.session_id:
         return False
     user_identifier = f"User(ID={config.owner_id})"
     try:
         core = WegolibCore(config.session_id)
-        result = core.sign_in(config.major, config.minor)
-        log_checkin_by_owner(session, config.owner_id, result["success"], result["message"])
+        if prepared is not None:
+            result = core.submit_sign_in(prepared)
+        else:
+            result = core.sign_in(config.major, config.minor)
+        now = datetime.now()
+        result_writer.submit(ConfigOutcome(
+            config_id=config.id,
+            owner_id=config.owner_id,
+            last_checkin=now,
+            last_checkin_result=result["message"],
+            last_log=f"CheckIn: {result['message']}",
+            next_checkin_at=next_checkin_at,
+        ))
+        result_writer.submit_event(config.owner_id, EVENT_KIND_CHECKIN, result["success"], result["message"], now)
         if result["success"]:
             logger.info(f"Auto check-in success for {user_identifier}...")
         else:
@@ -63,69 +163,554 @@ def _checkin_single(session: Session, config: Config) -> bool:
         logger.error(f"Auto check-in error for {user_identifier}...: {e}")
         return False
 
-def keep_alive_job():
-    """定时任务：为所有活跃用户执行保活"""
+def _keep_alive_by_config_id(config_id: int) -> bool:
+    """在独立的数据库 Session 中为单个配置执行保活（供并发工作线程使用）"""
     with Session(engine) as session:
-        configs = get_all_active_configs(session)
-
-        if not configs:
-            logger.debug("No active users to keep alive")
-            return
+        config = session.get(Config, config_id)
+        if not config or not config.is_active:
+            return False
+        try:
+            return _keep_alive_single(config)
+        except Exception as e:
+            # 尝试获取标识
+            uid = config.owner_id if config.owner_id else config.user_id
+            logger.error(f"Keep-alive failed for User {uid}...: {e}")
+            return False
 
-        logger.info(f"Running keep-alive for {len(configs)} active user(s)")
+def _run_keep_alive_sweep(config_ids: list[int], concurrency: int) -> int:
+    """按并发上限执行一轮保活，返回成功数量"""
+    if concurrency <= 1 or len(config_ids) <= 1:
+        return sum(1 for config_id in config_ids if _keep_alive_by_config_id(config_id))
 
-        for config in configs:
+    succeeded = 0
+    with ThreadPoolExecutor(
+        max_workers=min(concurrency, len(config_ids)),
+        thread_name_prefix="keepalive",
+    ) as executor:
+        futures = [executor.submit(_keep_alive_by_config_id, config_id) for config_id in config_ids]
+        for future in as_completed(futures):
             try:
-                _keep_alive_single(session, config)
+                if future.result():
+                    succeeded += 1
             except Exception as e:
-                # 尝试获取标识
-                uid = config.owner_id if config.owner_id else config.user_id
-                logger.error(f"Keep-alive failed for User {uid}...: {e}")
+                logger.error(f"Keep-alive worker error: {e}")
+    return succeeded
 
-def keep_alive_for_user(owner_id: int):
-    """为指定用户执行保活（手动触发时使用）"""
+async def _keep_alive_sweep_async(config_ids: list[int], concurrency: int) -> int:
+    """在单个事件循环内并发保活：网络请求走 AsyncWegolibCore，结果交给写回缓冲"""
     with Session(engine) as session:
-        config = get_config_by_owner(session, owner_id)
-        if config and config.is_active and config.session_id:
-            _keep_alive_single(session, config)
+        targets = [
+            (config.id, config.owner_id, config.session_id)
+            for config in (session.get(Config, config_id) for config_id in config_ids)
+            if config and config.is_active and config.session_id
+        ]
+
+    semaphore = asyncio.Semaphore(concurrency)
 
-def auto_checkin_job(owner_id: int):
+    async with new_async_client(max_connections=concurrency) as client:
+        async def _one(config_id: int, owner_id: Optional[int], session_id: str) -> bool:
+            async with semaphore:
+                try:
+                    result = await AsyncWegolibCore(session_id, client=client).keep_alive()
+                    return _record_keep_alive_result(config_id, owner_id, session_id, result)
+                except Exception as e:
+                    logger.error(f"Keep-alive failed for User {owner_id}...: {e}")
+                    return False
+
+        results = await asyncio.gather(*(_one(*target) for target in targets))
+    return sum(1 for ok in results if ok)
+
+def _warm_server_clock() -> None:
+    """prearmed 签到依赖服务器时钟偏移；样本过期前顺带刷新，使到点签到只需一次 POST"""
+    if CHECKIN_MODE != "prearmed" or SERVER_CLOCK.is_fresh():
+        return
+    try:
+        WegolibCore("").refresh_server_clock()
+        logger.info(f"Server clock offset refreshed: {SERVER_CLOCK.snapshot()}")
+    except Exception as e:
+        logger.warning(f"Server clock refresh failed: {e}")
+
+def current_keepalive_slot(now: Optional[float] = None) -> int:
+    """按墙上时间计算当前 tick 对应的时间轮槽位，重启后槽位相位不变"""
+    now = time.time() if now is None else now
+    return int(now // KEEPALIVE_TICK_SECONDS) % KEEPALIVE_WHEEL_SLOTS
+
+def keep_alive_job(concurrency: Optional[int] = None, slot: Optional[int] = None):
+    """定时任务：为本分区内、当前时间轮槽位内的活跃用户执行保活（未分片时处理本分区全部用户）"""
+    _warm_server_clock()
+
+    sharded = KEEPALIVE_WHEEL_SLOTS > 1
+    if sharded and slot is None:
+        slot = current_keepalive_slot()
+
+    ranges = partition_membership.ranges
+    with Session(engine) as session:
+        if sharded:
+            configs = get_active_configs_in_slot(session, slot, KEEPALIVE_WHEEL_SLOTS, ranges=ranges)
+        else:
+            configs = get_all_active_configs(session, ranges=ranges)
+        config_ids = [config.id for config in configs if config.session_id]
+
+    if not config_ids:
+        logger.debug("No active users to keep alive")
+        return
+
+    concurrency = KEEPALIVE_CONCURRENCY if concurrency is None else max(1, concurrency)
+    slot_label = f" slot={slot}/{KEEPALIVE_WHEEL_SLOTS}" if sharded else ""
+    logger.info(
+        f"Running keep-alive for {len(config_ids)} active user(s) "
+        f"with concurrency={concurrency} mode={KEEPALIVE_MODE}{slot_label}"
+    )
+
+    started_at = datetime.now()
+    started = time.monotonic()
+    if KEEPALIVE_MODE == "async":
+        succeeded = asyncio.run(_keep_alive_sweep_async(config_ids, concurrency))
+    else:
+        succeeded = _run_keep_alive_sweep(config_ids, concurrency)
+    duration = time.monotonic() - started
+
+    last_keepalive_sweep.update({
+        "started_at": started_at,
+        "duration_sec": duration,
+        "total": len(config_ids),
+        "succeeded": succeeded,
+        "concurrency": concurrency,
+        "mode": KEEPALIVE_MODE,
+        "slot": slot,
+    })
+    logger.info(
+        f"Keep-alive sweep finished{slot_label}: {succeeded}/{len(config_ids)} succeeded in {duration:.1f}s"
+    )
+    if duration > KEEPALIVE_TICK_SECONDS:
+        logger.warning(
+            f"Keep-alive sweep took {duration:.1f}s, longer than the {KEEPALIVE_TICK_SECONDS:.0f}s tick; "
+            "consider raising KEEPALIVE_CONCURRENCY"
+        )
+
+def _keep_alive_target(owner_id: int) -> Optional[tuple[int, str]]:
     with Session(engine) as session:
         config = get_config_by_owner(session, owner_id)
         if not config or not config.is_active or not config.session_id:
-            return
-        _checkin_single(session, config)
+            return None
+        return config.id, config.session_id
+
+async def keep_alive_for_user_async(owner_id: int) -> Optional[dict]:
+    """为指定用户执行保活（手动触发时使用）：网络请求不占用线程，读配置与写库放到线程中，供异步路由直接 await"""
+    target = await asyncio.to_thread(_keep_alive_target, owner_id)
+    if target is None:
+        return None
+    config_id, session_id = target
+
+    result = await AsyncWegolibCore(session_id).keep_alive()
+    await asyncio.to_thread(_record_keep_alive_result, config_id, owner_id, session_id, result, True)
+    return result
+
+class CheckinEngine:
+    """
+    自动签到引擎：用最小堆维护每个用户的下一次签到时间，由单个定时任务每 tick 唤醒一次，
+    取出全部到期用户，批量读取配置后在固定大小的线程池中并发签到，并在内存中排好下一次。
+    堆中的过期条目采用惰性删除：以 _entries 中记录的到期时间为准。
+    prearm > 0 时载荷在独立的线程池中预先生成，再由派发线程在各自的到期时刻交给签到线程池。
+    """
+
+    def __init__(self, interval: float, concurrency: int, prearm: float = 0.0):
+        self.interval = interval
+        self.concurrency = concurrency
+        self.prearm = prearm
+        self._heap: list[tuple[float, int]] = []
+        # owner_id -> (下次签到时间戳, 自动签到截止时间)
+        self._entries: dict[int, tuple[float, datetime]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._prepare_executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[_DueDispatcher] = None
+
+    def schedule(self, owner_id: int, expire_at: datetime, first_due: Optional[float] = None) -> datetime:
+        """排期并返回首次签到时间（调用方可写入 Config.next_checkin_at）"""
+        due = time.time() + self.interval if first_due is None else first_due
+        with self._lock:
+            self._entries[owner_id] = (due, expire_at)
+            heapq.heappush(self._heap, (due, owner_id))
+        return datetime.fromtimestamp(due)
+
+    def resume_due(self, config: Config, now: float) -> Optional[float]:
+        """
+        按持久化的 next_checkin_at（没有时按 last_checkin + 间隔）恢复该用户原有的签到节奏；
+        计划时间已过返回 None，由调用方安排补签。
+        """
+        if config.next_checkin_at is not None:
+            anchor = config.next_checkin_at.timestamp()
+        elif config.last_checkin is not None:
+            anchor = config.last_checkin.timestamp() + self.interval
+        else:
+            return None
+        if anchor <= now:
+            return None
+        # 系统时钟被回拨等异常情况下不会无限推迟
+        return min(anchor, now + self.interval)
 
-def start_auto_checkin_for_user(owner_id: int, expire_at: datetime):
-    trigger = IntervalTrigger(minutes=18, start_date=datetime.now() + timedelta(minutes=18), end_date=expire_at)
-    job_id = f"auto_checkin_{owner_id}"
-    scheduler.add_job(auto_checkin_job, trigger, id=job_id, replace_existing=True, kwargs={"owner_id": owner_id})
-    logger.info(f"Auto check-in scheduled for User(ID={owner_id}) every 18 minutes until {expire_at}")
+    def cancel(self, owner_id: int) -> bool:
+        with self._lock:
+            return self._entries.pop(owner_id, None) is not None
+
+    def is_scheduled(self, owner_id: int) -> bool:
+        with self._lock:
+            return owner_id in self._entries
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def sync(self, configs: list[Config], now: Optional[float] = None) -> tuple[int, int, int]:
+        """
+        与数据库对账本分区的自动签到名单：移除已关闭、已过期、已停用或已划归其他 worker 的用户；
+        新出现的用户（启动、其他 worker 开启、分区重新划分）按其 next_checkin_at 保持原节奏，
+        已错过的按错过时长先后在 AUTO_CHECKIN_CATCHUP_SECONDS 内均匀补签。
+        返回 (按原节奏加入数, 补签数, 移除数)。
+        """
+        now = time.time() if now is None else now
+        now_dt = datetime.fromtimestamp(now)
+        wanted = {
+            config.owner_id: config
+            for config in configs
+            if config.owner_id and config.auto_checkin_expire_at and config.auto_checkin_expire_at > now_dt
+        }
+        with self._lock:
+            current = dict(self._entries)
+
+        removed = 0
+        for owner_id in current.keys() - wanted.keys():
+            if self.cancel(owner_id):
+                removed += 1
+
+        resumed = 0
+        overdue: list[tuple[float, Config]] = []
+        for owner_id, config in wanted.items():
+            entry = current.get(owner_id)
+            if entry is None:
+                due = self.resume_due(config, now)
+                if due is None:
+                    missed_at = config.next_checkin_at or config.last_checkin
+                    overdue.append((missed_at.timestamp() if missed_at else 0.0, config))
+                    continue
+                self.schedule(owner_id, config.auto_checkin_expire_at, first_due=due)
+                resumed += 1
+            elif entry[1] != config.auto_checkin_expire_at:
+                with self._lock:
+                    if owner_id in self._entries:
+                        self._entries[owner_id] = (self._entries[owner_id][0], config.auto_checkin_expire_at)
+
+        if overdue:
+            overdue.sort(key=lambda item: item[0])
+            spacing = AUTO_CHECKIN_CATCHUP_SECONDS / len(overdue)
+            for index, (_missed_at, config) in enumerate(overdue):
+                self.schedule(
+                    config.owner_id,
+                    config.auto_checkin_expire_at,
+                    first_due=now + AUTO_CHECKIN_TICK_SECONDS + index * spacing,
+                )
+        return resumed, len(overdue), removed
+
+    def _pop_due(self, now: float, horizon: Optional[float] = None) -> dict[int, tuple[float, Optional[float]]]:
+        """
+        取出 horizon（默认 now）之前到期的用户，并立即按固定间隔排好下一次（错过的轮次直接跳过，不补签）。
+        返回 owner_id -> (本次签到时间戳, 下一次签到时间戳)；已到截止时间不再排期的下一次为 None。
+        """
+        horizon = now if horizon is None else horizon
+        due_owners: dict[int, tuple[float, Optional[float]]] = {}
+        now_dt = datetime.fromtimestamp(now)
+        with self._lock:
+            while self._heap and self._heap[0][0] <= horizon:
+                due, owner_id = heapq.heappop(self._heap)
+                entry = self._entries.get(owner_id)
+                if entry is None or entry[0] != due:
+                    continue
+                expire_at = entry[1]
+                if expire_at <= now_dt:
+                    del self._entries[owner_id]
+                    continue
+                next_due = due + self.interval
+                while next_due <= now:
+                    next_due += self.interval
+                if datetime.fromtimestamp(next_due) > expire_at:
+                    del self._entries[owner_id]
+                    due_owners[owner_id] = (due, None)
+                else:
+                    self._entries[owner_id] = (next_due, expire_at)
+                    heapq.heappush(self._heap, (next_due, owner_id))
+                    due_owners[owner_id] = (due, next_due)
+            # 惰性删除积累过多时重建堆
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [(due, owner_id) for owner_id, (due, _expire_at) in self._entries.items()]
+                heapq.heapify(self._heap)
+        return due_owners
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="auto-checkin"
+            )
+        return self._executor
+
+    def _get_prepare_executor(self) -> ThreadPoolExecutor:
+        # 生成载荷可能需要请求 getTime，与发送签到的线程池分开，避免互相排队
+        if self._prepare_executor is None:
+            self._prepare_executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="auto-checkin-prepare"
+            )
+        return self._prepare_executor
+
+    def _get_dispatcher(self) -> "_DueDispatcher":
+        if self._dispatcher is None:
+            self._dispatcher = _DueDispatcher()
+        return self._dispatcher
+
+    def tick(self, now: Optional[float] = None) -> int:
+        """
+        定时任务入口：派发所有到期用户的签到，返回本批处理的用户数；tick 本身不等待签到完成。
+        prearm > 0 时同时取出 prearm 秒内将到期的用户，载荷生成后由派发线程在各自的到期时刻提交；
+        签到结果由线程池异步汇总到 last_checkin_batch。
+        """
+        now = time.time() if now is None else now
+        due_owners = self._pop_due(now, now + self.prearm)
+        if not due_owners:
+            return 0
+
+        with Session(engine) as session:
+            configs = list(session.exec(select(Config).where(Config.owner_id.in_(list(due_owners)))).all())
+        runnable = [config for config in configs if config.is_active and config.session_id]
+        runnable_owners = {config.owner_id for config in runnable}
+        # 配置已删除或已停用的用户不再继续排期
+        for owner_id in due_owners:
+            if owner_id not in runnable_owners:
+                self.cancel(owner_id)
+        if not runnable:
+            return 0
+
+        batch = _CheckinBatch(len(runnable), time.monotonic(), self.pending_count)
+        runnable.sort(key=lambda config: due_owners[config.owner_id][0])
+        for config in runnable:
+            due, next_due = due_owners[config.owner_id]
+            next_dt = datetime.fromtimestamp(next_due) if next_due else None
+            if self.prearm > 0:
+                # 已过期的（补签或 tick 延迟）按当前时间生成，生成后立即提交
+                self._get_prepare_executor().submit(self._arm, config, max(due, now), next_dt, batch)
+            else:
+                self._submit(config, next_dt, None, batch)
+        return len(runnable)
+
+    def _submit(
+        self,
+        config: Config,
+        next_dt: Optional[datetime],
+        prepared: Optional[PreparedSignIn],
+        batch: "_CheckinBatch",
+    ) -> None:
+        future = self._get_executor().submit(_checkin_prepared, config, next_dt, prepared)
+        future.add_done_callback(batch.done)
+
+    def _arm(self, config: Config, due: float, next_dt: Optional[datetime], batch: "_CheckinBatch") -> None:
+        prepared = _prepare_checkin(config, due)
+        self._get_dispatcher().call_at(due, lambda: self._submit(config, next_dt, prepared, batch))
+
+    def shutdown(self) -> None:
+        """等待已取出的签到全部派发并完成后再关闭线程池"""
+        prepare_executor, self._prepare_executor = self._prepare_executor, None
+        if prepare_executor is not None:
+            prepare_executor.shutdown(wait=True)
+        dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None:
+            dispatcher.stop()
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+class _DueDispatcher:
+    """单个派发线程：按到期时间（本机 time.time()）依次执行回调，回调只负责提交到线程池，不应阻塞"""
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, Callable[[], None]]] = []
+        self._counter = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="auto-checkin-dispatch", daemon=True)
+        self._thread.start()
+
+    def call_at(self, when: float, callback: Callable[[], None]) -> None:
+        with self._condition:
+            self._counter += 1
+            heapq.heappush(self._heap, (when, self._counter, callback))
+            self._condition.notify()
+
+    def stop(self) -> None:
+        """执行完已登记的回调（最多等到最后一个到期）后退出"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if not self._heap:
+                        if self._stopping:
+                            return
+                        self._condition.wait()
+                        continue
+                    wait = self._heap[0][0] - time.time()
+                    if wait <= 0:
+                        _when, _seq, callback = heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(wait)
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Auto check-in dispatch error: {e}")
+
+
+class _CheckinBatch:
+    """汇总一批异步提交的签到结果，全部完成后写入 last_checkin_batch"""
+
+    def __init__(self, total: int, started: float, pending_count: Callable[[], int]):
+        self.total = total
+        self.started = started
+        self.pending_count = pending_count
+        self.finished = 0
+        self.succeeded = 0
+        self._lock = threading.Lock()
+
+    def done(self, future) -> None:
+        ok = not future.cancelled() and future.exception() is None and future.result()
+        with self._lock:
+            self.finished += 1
+            if ok:
+                self.succeeded += 1
+            if self.finished < self.total:
+                return
+        duration = time.monotonic() - self.started
+        last_checkin_batch.update({
+            "started_at": datetime.now(),
+            "duration_sec": duration,
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "scheduled": self.pending_count(),
+        })
+        logger.info(f"Auto check-in batch finished: {self.succeeded}/{self.total} succeeded in {duration:.1f}s")
+
+
+checkin_engine = CheckinEngine(AUTO_CHECKIN_INTERVAL_SECONDS, AUTO_CHECKIN_CONCURRENCY, AUTO_CHECKIN_PREARM_SECONDS)
+
+def start_auto_checkin_for_user(owner_id: int, expire_at: datetime) -> datetime:
+    """
+    开启自动签到，返回首次签到时间。
+    用户不在本 worker 的分区内时只返回计划时间，由调用方写入 next_checkin_at 后经所属 worker 对账接管。
+    """
+    if partition_membership.owns(owner_id):
+        first_due = checkin_engine.schedule(owner_id, expire_at)
+    else:
+        first_due = datetime.fromtimestamp(time.time() + AUTO_CHECKIN_INTERVAL_SECONDS)
+    logger.info(
+        f"Auto check-in scheduled for User(ID={owner_id}) every "
+        f"{AUTO_CHECKIN_INTERVAL_SECONDS // 60} minutes until {expire_at}"
+    )
+    return first_due
 
 def stop_auto_checkin_for_user(owner_id: int):
-    job_id = f"auto_checkin_{owner_id}"
-    try:
-        scheduler.remove_job(job_id)
+    if checkin_engine.cancel(owner_id):
         logger.info(f"Auto check-in stopped for User(ID={owner_id})")
+
+def compact_events_job():
+    """定时任务（仅持有维护租约的 worker）：清理保留期外的事件历史并降采样较早的保活事件"""
+    started = time.monotonic()
+    with Session(engine) as session:
+        stats = compact_activity_events(session)
+    logger.info(
+        f"Activity events compacted: {stats['expired']} expired, {stats['downsampled']} downsampled "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+
+def auto_checkin_sync_job():
+    """定时任务：与数据库对账本分区的自动签到名单；分区成员变化时也会立即执行一次"""
+    with Session(engine) as session:
+        configs = get_auto_checkin_configs(session, ranges=partition_membership.ranges)
+    resumed, catching_up, removed = checkin_engine.sync(configs)
+    if resumed or catching_up or removed:
+        logger.info(
+            f"Auto check-in roster synced: +{resumed} on their previous cadence, "
+            f"+{catching_up} overdue spread over {AUTO_CHECKIN_CATCHUP_SECONDS}s, -{removed}"
+        )
+
+def _start_partition_jobs():
+    """每个 worker 都运行的任务：只处理散列环上属于本 worker 的用户"""
+    # tick 起点对齐到墙上时间槽位中点，避免调度抖动导致 current_keepalive_slot 跳槽或重复
+    tick_start = (time.time() // KEEPALIVE_TICK_SECONDS + 1.5) * KEEPALIVE_TICK_SECONDS
+    trigger = IntervalTrigger(
+        seconds=KEEPALIVE_TICK_SECONDS,
+        start_date=datetime.fromtimestamp(tick_start),
+    )
+    scheduler.add_job(keep_alive_job, trigger, id='keep_alive', replace_existing=True)
+    scheduler.add_job(
+        checkin_engine.tick,
+        IntervalTrigger(seconds=AUTO_CHECKIN_TICK_SECONDS),
+        id='auto_checkin_tick',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.add_job(
+        auto_checkin_sync_job,
+        IntervalTrigger(seconds=AUTO_CHECKIN_SYNC_SECONDS),
+        id='auto_checkin_sync',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    if POOL_IDLE_SECONDS:
+        # 连接池只在请求前按源检查空闲；长时间无请求的源由该任务关闭，不必等到下次请求
+        scheduler.add_job(
+            evict_idle_connections,
+            IntervalTrigger(seconds=POOL_IDLE_SECONDS),
+            id='evict_idle_connections',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    # 首次心跳确定分区后立即对账，恢复本分区的自动签到排期
+    partition_membership.start(on_change=auto_checkin_sync_job)
+    logger.info(
+        f"Scheduler jobs started - will process this worker's share of active users every "
+        f"{KEEPALIVE_INTERVAL_SECONDS}s in {KEEPALIVE_WHEEL_SLOTS} slot(s) (concurrency={KEEPALIVE_CONCURRENCY}); "
+        f"{len(partition_membership.members)} worker(s), {checkin_engine.pending_count()} user(s) on auto check-in"
+    )
+
+def _start_maintenance_jobs():
+    """拿到维护租约：注册全局维护任务（事件清理只需一个 worker 执行）"""
+    scheduler.add_job(compact_events_job, CronTrigger(hour=4, minute=17), id='compact_events', replace_existing=True)
+    logger.info("Maintenance jobs started on this worker")
+
+def _stop_maintenance_jobs():
+    """失去维护租约：移除全局维护任务"""
+    try:
+        scheduler.remove_job('compact_events')
     except Exception:
         pass
+    logger.info("Maintenance jobs stopped on this worker")
 
 def start_scheduler():
-    trigger = IntervalTrigger(minutes=5)
-    scheduler.add_job(keep_alive_job, trigger, id='keep_alive', replace_existing=True)
-    now = datetime.now()
-    with Session(engine) as session:
-        configs = get_all_active_configs(session)
-        for config in configs:
-            if not config.owner_id:
-                continue
-            if not config.auto_checkin_expire_at:
-                continue
-            if config.auto_checkin_expire_at <= now:
-                continue
-            start_auto_checkin_for_user(config.owner_id, config.auto_checkin_expire_at)
+    result_writer.start()
     scheduler.start()
-    logger.info("Scheduler started - will process all active users every 5 minutes")
+    # 保活与自动签到按一致性散列分区到所有存活 worker（取代了早先由单个主节点执行全部调度的方式）；
+    # 租约只用于保证事件清理等全局维护任务同一时刻只有一个 worker 执行
+    _start_partition_jobs()
+    leader_elector.start(on_elected=_start_maintenance_jobs, on_demoted=_stop_maintenance_jobs)
 
 def shutdown_scheduler():
+    leader_elector.stop()
+    partition_membership.stop()
     scheduler.shutdown()
+    checkin_engine.shutdown()
+    # 停止后把缓冲中尚未写库的保活/签到结果全部写入
+    result_writer.stop()
@@ -8,14 +8,17 @@ import re
 import threading
 import time
 import urllib.parse
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Callable, Optional, Tuple, TypeVar
+from typing import Any, Callable, Mapping, Optional, Sequence, Tuple, Union
 
 import requests
 from requests.exceptions import ConnectionError, RequestException, SSLError, Timeout
 
+from app.http_pool import ConnectionWarmer, POOL_IDLE_SECONDS, get_traceint_http, new_traceint_session, warm_connection
+from app.retry_policy import VALIDATE_RETRY, RetryPolicy
+
 logger = logging.getLogger(__name__)
 
 # auth.html 实测需走 HTTP；wechatAuth / GraphQL / wxApp 走 HTTPS
@@ -33,26 +36,19 @@ TRACEINT_UA = (
     "NetType/WIFI Language/zh_CN"
 )
 
-INDEX_QUERY = (
-    "query index($pos: String!, $param: [hash]) { userAuth { oftenseat { list { id info "
-    "lib_id seat_key status } } message { new(from: \"system\") { has from_user title num } "
-    "indexMsg { message_id title content isread isused from_user create_time } } reserve { "
-    "reserve { token status user_id user_nick sch_name lib_id lib_name lib_floor seat_key "
-    "seat_name date exp_date exp_date_str validate_date hold_date diff diff_str mark_source "
-    "isRecordUser isChooseSeat isRecord mistakeNum openTime threshold daynum closeTime "
-    "timerange forbidQrValid renewTimeNext forbidRenewTime forbidWechatCancle } getSToken } "
-    "currentUser { user_id user_nick user_mobile user_sex user_sch_id user_sch user_last_login "
-    "user_avatar(size: MIDDLE) user_adate user_student_no user_student_name area_name user_deny "
-    "{ deny_deadline } sch { sch_id sch_name activityUrl isShowCommon isBusy } subscribe_remind } "
-    "record { recordRegInfo { reg_start reg_end } recordShortlistInfo } } ad(pos: $pos, param: "
-    "$param) { name pic url } homeIconAd: ad(pos: \"home-icon\", param: $param) { name pic url } }"
+# GraphQL 字段名（可带参数，如 user_avatar(size: MIDDLE)）
+_GRAPHQL_FIELD_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\([^(){}]*\))?$")
+# _map_current_user 用到的全部资料字段
+PROFILE_FIELDS = (
+    "user_id",
+    "user_nick",
+    "user_avatar(size: MIDDLE)",
+    "user_student_name",
+    "user_student_no",
+    "user_sch",
+    "area_name",
 )
 
-INDEX_QUERY_MINIMAL = "query index { userAuth { currentUser { user_id user_nick } } }"
-
-# 换票后校验的重试次数（Traceint 在频繁请求时可能 RST/TLS EOF）
-_VALIDATE_RETRIES = 4
-_VALIDATE_RETRY_DELAY_SEC = 2.0
 _DUAL_AUTH_DELAY_SEC = max(
     0.0,
     int(os.getenv("TRACEINT_DUAL_AUTH_DELAY_MS", "0")) / 1000,
@@ -69,8 +65,24 @@ _DUAL_NETWORK_RETRIES = max(
     1,
     int(os.getenv("TRACEINT_DUAL_NETWORK_RETRIES", "2")),
 )
-
-T = TypeVar("T")
+# 双换票使用的常驻线程数（每次粘贴占用两个，并发解析上限由 parse 路由控制）
+_DUAL_EXCHANGE_WORKERS = max(2, int(os.getenv("TRACEINT_DUAL_WORKERS", "16")))
+# 双换票端点所在的两个源（auth.html 走 HTTP，wechatAuth 走 HTTPS）常备连接的保活间隔，0 表示不常备；
+# 开启时这两个源由预热器维持连接，不再按 TRACEINT_POOL_IDLE_SEC 空闲淘汰
+_DUAL_WARM_INTERVAL_SEC = max(
+    0.0,
+    float(os.getenv("TRACEINT_DUAL_WARM_INTERVAL_SEC", str(min(30.0, POOL_IDLE_SECONDS * 0.6)))),
+)
+_AUTH_ORIGIN_WARM_URL = "http://wechat.v2.traceint.com/index.php/wxApp/getTime.html"
+_DUAL_WARM_URLS = (_AUTH_ORIGIN_WARM_URL, GET_TIME_URL)
+# 双换票首包只在没有拿到任何响应的网络错误时快速重试（两侧需尽量同时到达）
+_DUAL_FIRST_FLIGHT_RETRY = RetryPolicy(
+    "OAuth first flight",
+    attempts=_DUAL_NETWORK_RETRIES,
+    deadline=_DUAL_REQUEST_TIMEOUT_SEC * _DUAL_NETWORK_RETRIES,
+    base_delay=0.08,
+    max_delay=0.5,
+)
 
 _RETRYABLE_REQUEST_ERRORS = (
     SSLError,
@@ -108,6 +120,38 @@ def _safe_response_json(resp: requests.Response) -> dict[str, Any]:
         return {"_raw": text, "_status": resp.status_code}
 
 
+GraphQLSelection = Union[Mapping[str, "GraphQLSelection"], Sequence[str]]
+
+
+def _render_selection(selection: GraphQLSelection) -> str:
+    if isinstance(selection, Mapping):
+        fields = [f"{_checked_field(name)} {{ {_render_selection(sub)} }}" for name, sub in selection.items()]
+    else:
+        fields = [_checked_field(name) for name in selection]
+    if not fields:
+        raise ValueError("GraphQL 选择集不能为空")
+    return " ".join(fields)
+
+
+def _checked_field(name: str) -> str:
+    if not _GRAPHQL_FIELD_RE.match(name):
+        raise ValueError(f"非法的 GraphQL 字段: {name!r}")
+    return name
+
+
+def build_graphql_query(operation: str, selection: GraphQLSelection) -> str:
+    """
+    按选择集构造 GraphQL 查询：嵌套 dict 表示对象字段，序列表示叶子字段。
+    例如 {"userAuth": {"currentUser": ["user_id"]}} → query index { userAuth { currentUser { user_id } } }
+    """
+    return f"query {_checked_field(operation)} {{ {_render_selection(selection)} }}"
+
+
+def current_user_query(fields: Sequence[str]) -> str:
+    """只查询 userAuth.currentUser 指定字段的 index 查询"""
+    return build_graphql_query("index", {"userAuth": {"currentUser": fields}})
+
+
 def _graphql_headers(cookie: Optional[str] = None) -> dict[str, str]:
     headers = {
         "Host": "wechat.v2.traceint.com",
@@ -215,32 +259,6 @@ def _is_transient_request_error(exc: BaseException) -> bool:
     )
 
 
-def _call_with_retry(
-    fn: Callable[[], T],
-    *,
-    action: str,
-    retries: int = _VALIDATE_RETRIES,
-    delay_sec: float = _VALIDATE_RETRY_DELAY_SEC,
-) -> T:
-    last_exc: Optional[BaseException] = None
-    for attempt in range(retries):
-        try:
-            return fn()
-        except _RETRYABLE_REQUEST_ERRORS as exc:
-            last_exc = exc
-            logger.warning(
-                "%s  transient error (attempt %s/%s): %s",
-                action,
-                attempt + 1,
-                retries,
-                exc,
-            )
-            if attempt + 1 < retries:
-                time.sleep(delay_sec * (attempt + 1))
-    assert last_exc is not None
-    raise last_exc
-
-
 def _decode_response_text(resp: requests.Response) -> str:
     try:
         return resp.content.decode("utf-8", errors="replace")
@@ -258,7 +276,8 @@ def _is_wechat_session_expired_message(msg: str) -> bool:
 
 
 def _traceint_session() -> requests.Session:
-    session = requests.Session()
+    # 每个换票流程独立 Cookie 罐，底层连接来自共享连接池
+    session = new_traceint_session()
     session.headers.update(
         {
             "User-Agent": TRACEINT_UA,
@@ -271,11 +290,45 @@ def _traceint_session() -> requests.Session:
     return session
 
 
-def _prewarm_session(session: requests.Session, url: str) -> None:
-    try:
-        session.get(url, timeout=5)
-    except Exception as exc:
-        logger.debug("Traceint prewarm failed for %s: %s", url, exc)
+_dual_executor: Optional[ThreadPoolExecutor] = None
+_dual_executor_lock = threading.Lock()
+_dual_warmer = ConnectionWarmer(_DUAL_WARM_URLS, _DUAL_WARM_INTERVAL_SEC)
+
+
+def _get_dual_executor() -> ThreadPoolExecutor:
+    global _dual_executor
+    if _dual_executor is None:
+        with _dual_executor_lock:
+            if _dual_executor is None:
+                _dual_executor = ThreadPoolExecutor(
+                    max_workers=_DUAL_EXCHANGE_WORKERS,
+                    thread_name_prefix="traceint-dual",
+                )
+    return _dual_executor
+
+
+def start_dual_exchange_warmer() -> None:
+    """应用启动时调用：为双换票的两个源常备已握手的连接"""
+    _dual_warmer.start()
+
+
+def shutdown_dual_exchange() -> None:
+    global _dual_executor
+    _dual_warmer.stop()
+    executor, _dual_executor = _dual_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _prepare_first_flight(
+    session: requests.Session,
+    url: str,
+    params: dict[str, Any],
+) -> Tuple[requests.PreparedRequest, dict[str, Any]]:
+    """提前完成 URL 编码、Cookie 合并与代理等环境设置，竞速开始后只剩发送"""
+    prepared = session.prepare_request(requests.Request("GET", url, params=params))
+    settings = session.merge_environment_settings(prepared.url, {}, None, None, None)
+    return prepared, settings
 
 
 def _extract_cookie_from_set_cookie(set_cookie: Optional[str], name: str) -> Optional[str]:
@@ -317,8 +370,8 @@ def _build_oauth_params(code: str, state: str) -> dict[str, Any]:
 def _request_oauth_cookie_first_flight(
     *,
     session: requests.Session,
-    url: str,
-    params: dict[str, Any],
+    prepared: requests.PreparedRequest,
+    settings: dict[str, Any],
     cookie_name: str,
     action: str,
     detect_wechat_auth_error: bool = False,
@@ -329,57 +382,40 @@ def _request_oauth_cookie_first_flight(
     OAuth code 是一次性凭据，双换票时不能在同一端点内部继续做顺序 fallback。
     这里只发出一个不跟随重定向的请求；只有在没有拿到任何 HTTP 响应的网络错误时才重试。
     """
-    last_error: Optional[BaseException] = None
-    for attempt in range(_DUAL_NETWORK_RETRIES):
-        try:
-            resp = session.get(
-                url,
-                params=params,
+    try:
+        resp = _DUAL_FIRST_FLIGHT_RETRY.call(
+            lambda remaining: session.send(
+                prepared.copy(),
                 allow_redirects=False,
-                timeout=_DUAL_REQUEST_TIMEOUT_SEC,
-            )
-        except _RETRYABLE_REQUEST_ERRORS as exc:
-            last_error = exc
-            logger.warning(
-                "%s 首包网络错误 (attempt %s/%s): %s",
-                action,
-                attempt + 1,
-                _DUAL_NETWORK_RETRIES,
-                exc,
-            )
-            if attempt + 1 < _DUAL_NETWORK_RETRIES:
-                time.sleep(0.08 * (attempt + 1))
-            continue
-        except Exception as exc:
-            logger.warning("%s 首包请求失败: %s", action, exc)
-            return OAuthCookieResult(
-                value=None,
-                serverid=session.cookies.get("SERVERID"),
-                error=exc,
-            )
-
-        error_page = detect_wechat_auth_error and _wechat_auth_response_has_error(resp)
-        value = _collect_cookie_value(session, resp, cookie_name)
-        serverid = _collect_cookie_value(session, resp, "SERVERID")
-        logger.info(
-            "%s 首包完成 status=%s has_%s=%s error_page=%s",
-            action,
-            resp.status_code,
-            cookie_name,
-            bool(value),
-            error_page,
+                timeout=min(_DUAL_REQUEST_TIMEOUT_SEC, remaining),
+                **settings,
+            ),
+            retryable=lambda exc: isinstance(exc, _RETRYABLE_REQUEST_ERRORS),
         )
+    except Exception as exc:
+        logger.warning("%s 首包请求失败: %s", action, exc)
         return OAuthCookieResult(
-            value=value,
-            serverid=serverid,
-            status_code=resp.status_code,
-            error_page=error_page,
+            value=None,
+            serverid=session.cookies.get("SERVERID"),
+            error=exc,
         )
 
+    error_page = detect_wechat_auth_error and _wechat_auth_response_has_error(resp)
+    value = _collect_cookie_value(session, resp, cookie_name)
+    serverid = _collect_cookie_value(session, resp, "SERVERID")
+    logger.info(
+        "%s 首包完成 status=%s has_%s=%s error_page=%s",
+        action,
+        resp.status_code,
+        cookie_name,
+        bool(value),
+        error_page,
+    )
     return OAuthCookieResult(
-        value=None,
-        serverid=session.cookies.get("SERVERID"),
-        error=last_error,
+        value=value,
+        serverid=serverid,
+        status_code=resp.status_code,
+        error_page=error_page,
     )
 
 
@@ -482,12 +518,18 @@ def exchange_dual_authorization_and_session(
     Traceint/微信 code 是一次性凭据；顺序调用时先成功的一侧会让另一侧返回
     code been used。并发请求是单链接双换票唯一可行的形式。
     """
+    executor = _get_dual_executor()
+    if not _dual_warmer.running:
+        # 未开启常备连接时才在换票前补建连接（已有可复用连接时不发请求）；开启时由预热器维持，换票不再等待
+        list(executor.map(warm_connection, _DUAL_WARM_URLS))
+
     auth_session = _traceint_session()
     wechat_session = _traceint_session()
-    _prewarm_session(auth_session, GRAPHQL_URL)
-    _prewarm_session(wechat_session, GET_TIME_URL)
-    start_barrier = threading.Barrier(2)
     params = _build_oauth_params(code, state)
+    auth_prepared, auth_settings = _prepare_first_flight(auth_session, AUTH_HTML_URL, params)
+    sess_prepared, sess_settings = _prepare_first_flight(wechat_session, WECHAT_AUTH_URL, params)
+    # 线程池排队时最多等待对侧这么久，避免单侧一直阻塞
+    start_barrier = threading.Barrier(2, timeout=_DUAL_REQUEST_TIMEOUT_SEC)
     auth_result: Optional[OAuthCookieResult] = None
     sess_result: Optional[OAuthCookieResult] = None
 
@@ -497,8 +539,8 @@ def exchange_dual_authorization_and_session(
             time.sleep(_DUAL_AUTH_DELAY_SEC)
         return _request_oauth_cookie_first_flight(
             session=auth_session,
-            url=AUTH_HTML_URL,
-            params=params,
+            prepared=auth_prepared,
+            settings=auth_settings,
             cookie_name="Authorization",
             action="auth.html",
         )
@@ -509,41 +551,36 @@ def exchange_dual_authorization_and_session(
             time.sleep(_DUAL_SESSION_DELAY_SEC)
         return _request_oauth_cookie_first_flight(
             session=wechat_session,
-            url=WECHAT_AUTH_URL,
-            params=params,
+            prepared=sess_prepared,
+            settings=sess_settings,
             cookie_name="wechatSESS_ID",
             action="wechatAuth.html",
             detect_wechat_auth_error=True,
         )
 
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        sess_future = executor.submit(
-            _exchange_wechat_sess_id_raced,
-        )
-        auth_future = executor.submit(
-            _exchange_authorization_raced,
-        )
-        auth_error: Optional[BaseException] = None
-        sess_error: Optional[BaseException] = None
+    sess_future = executor.submit(_exchange_wechat_sess_id_raced)
+    auth_future = executor.submit(_exchange_authorization_raced)
+    auth_error: Optional[BaseException] = None
+    sess_error: Optional[BaseException] = None
 
-        try:
-            auth_result = auth_future.result()
-            authorization = auth_result.value
-            auth_serverid = auth_result.serverid
-            auth_error = auth_result.error
-        except BaseException as exc:
-            authorization, auth_serverid = None, None
-            auth_error = exc
+    try:
+        auth_result = auth_future.result()
+        authorization = auth_result.value
+        auth_serverid = auth_result.serverid
+        auth_error = auth_result.error
+    except BaseException as exc:
+        authorization, auth_serverid = None, None
+        auth_error = exc
 
-        try:
-            sess_result = sess_future.result()
-            wechat_sess_id = sess_result.value
-            sess_error = sess_result.error
-            if sess_result.error_page:
-                sess_error = ValueError("Traceint 返回授权错误页，code 可能已被提前消耗")
-        except BaseException as exc:
-            wechat_sess_id = None
-            sess_error = exc
+    try:
+        sess_result = sess_future.result()
+        wechat_sess_id = sess_result.value
+        sess_error = sess_result.error
+        if sess_result.error_page:
+            sess_error = ValueError("Traceint 返回授权错误页，code 可能已被提前消耗")
+    except BaseException as exc:
+        wechat_sess_id = None
+        sess_error = exc
 
     wechat_serverid = (sess_result.serverid if sess_result else None) or wechat_session.cookies.get("SERVERID")
 
@@ -620,21 +657,22 @@ def normalize_checkin_session_id(session_id: str) -> str:
     return "; ".join(f"{k}={values[k]}" for k in ordered if k in values)
 
 
-def validate_authorization(
+def _query_current_user(
     authorization: str,
-    serverid: Optional[str] = None,
-    http_session: Optional[requests.Session] = None,
-) -> Optional[str]:
+    serverid: Optional[str],
+    http_session: Optional[requests.Session],
+    fields: Sequence[str],
+) -> Tuple[Optional[str], Optional[dict[str, Any]]]:
     """
-    GraphQL index 校验 JWT。
-    网络异常且重试仍失败时返回警告文案（不阻断保存）；业务错误仍抛 ValueError。
+    GraphQL index 校验 JWT，并取回 currentUser 的指定字段。
+    返回 (警告文案, currentUser)：网络异常且重试仍失败时只返回警告（不阻断保存）；业务错误仍抛 ValueError。
     """
     body = {
         "operationName": "index",
         "variables": {},
-        "query": INDEX_QUERY_MINIMAL,
+        "query": current_user_query(fields),
     }
-    session = http_session or _traceint_session()
+    session = http_session or get_traceint_http()
     # 复用换票 Session 时不再重复设置 Cookie 头，避免与 session.cookies 冲突
     if http_session is None:
         cookie_parts = [f"Authorization={authorization}"]
@@ -644,26 +682,26 @@ def validate_authorization(
     else:
         headers = _graphql_headers()
 
-    def _do_validate() -> dict[str, Any]:
-        resp = session.post(GRAPHQL_URL, json=body, headers=headers, timeout=20)
+    def _do_validate(remaining: float) -> dict[str, Any]:
+        resp = session.post(GRAPHQL_URL, json=body, headers=headers, timeout=min(20, remaining))
         if resp.status_code >= 500:
             resp.raise_for_status()
         return _safe_response_json(resp)
 
     try:
-        payload = _call_with_retry(_do_validate, action="JWT validate")
+        payload = VALIDATE_RETRY.call(_do_validate)
     except Exception as exc:
         if _is_transient_request_error(exc):
             logger.warning("JWT 校验因网络异常跳过: %s", exc)
             return (
                 "预约凭证暂未校验（Traceint 连接异常，可能因请求过于频繁）。"
                 "凭据已保存，请等待数分钟后再试签到"
-            )
+            ), None
         logger.exception("JWT 校验未预期错误")
         return (
             "预约凭证暂未校验（服务响应异常）。凭据已保存，请稍后试签到；"
             "若仍失败请重新扫码授权"
-        )
+        ), None
 
     if payload.get("errors"):
         err = payload["errors"][0] if payload["errors"] else {}
@@ -679,9 +717,24 @@ def validate_authorization(
             logger.warning("JWT 校验因网络异常跳过: %s", payload.get("_raw"))
             return (
                 "预约凭证暂未校验（Traceint 返回异常）。凭据已保存，请稍后重试签到"
-            )
+            ), None
         raise ValueError("JWT 校验未返回用户信息，请重新扫码粘贴最新授权链接")
-    return None
+    return None, current_user
+
+
+def validate_and_fetch_profile(
+    authorization: str,
+    serverid: Optional[str] = None,
+    http_session: Optional[requests.Session] = None,
+    fields: Sequence[str] = PROFILE_FIELDS,
+) -> Tuple[Optional[str], Optional[WechatProfileSnapshot]]:
+    """
+    一次 GraphQL 请求同时校验 JWT 并取回个人资料（只查询 fields 中的 currentUser 字段）。
+    返回 (警告文案, 资料快照)；网络异常时资料为 None。
+    """
+    warning, current_user = _query_current_user(authorization, serverid, http_session, fields)
+    profile = _map_current_user(current_user) if current_user else None
+    return warning, profile
 
 
 def validate_wechat_sess_id(
@@ -699,11 +752,11 @@ def validate_wechat_sess_id(
     from app.core import WegolibCore
 
     session_cookie = build_checkin_session_id(wechat_sess_id, serverid)
-    time.sleep(0.5)
 
     try:
         core = WegolibCore(session_cookie)
-        result = core.keep_alive()
+        # 用户正在等待结果，不加模拟延迟；Traceint 的瞬时连接错误由重试策略处理
+        result = core.keep_alive(delay=False)
     except Exception as exc:
         if _is_transient_request_error(exc):
             logger.warning("签到会话保活校验网络异常: %s", exc)
@@ -730,51 +783,6 @@ def validate_wechat_sess_id(
     )
 
 
-def fetch_user_auth(authorization: str, serverid: Optional[str] = None) -> Optional[WechatProfileSnapshot]:
-    """GraphQL index 查询个人资料（JWT 已校验后调用）。"""
-    cookie_parts = [f"Authorization={authorization}"]
-    if serverid:
-        cookie_parts.append(f"SERVERID={serverid}")
-
-    headers = {
-        "Host": "wechat.v2.traceint.com",
-        "Content-Type": "application/json",
-        "Accept": "*/*",
-        "App-Version": "2.2.5",
-        "Origin": "https://web.traceint.com",
-        "Referer": MINIPROGRAM_REFERER,
-        "User-Agent": TRACEINT_UA,
-        "Cookie": "; ".join(cookie_parts),
-    }
-    body = {
-        "operationName": "index",
-        "variables": {"pos": "App-首页", "param": []},
-        "query": INDEX_QUERY,
-    }
-
-    try:
-        resp = requests.post(GRAPHQL_URL, json=body, headers=headers, timeout=15)
-        resp.raise_for_status()
-        payload = resp.json()
-    except Exception as exc:
-        logger.warning("GraphQL index 请求失败: %s", exc)
-        return None
-
-    if payload.get("errors"):
-        logger.warning("GraphQL index 返回错误: %s", payload.get("errors"))
-        return None
-
-    user_auth = (payload.get("data") or {}).get("userAuth")
-    if not user_auth:
-        return None
-
-    current_user = user_auth.get("currentUser")
-    if not current_user:
-        return None
-
-    return _map_current_user(current_user)
-
-
 def _map_current_user(current_user: dict[str, Any]) -> WechatProfileSnapshot:
     user_id = current_user.get("user_id")
     try:
@@ -794,41 +802,78 @@ def _map_current_user(current_user: dict[str, Any]) -> WechatProfileSnapshot:
     )
 
 
+def _timed_call(timings: Optional[dict[str, float]], stage: str, fn: Callable, *args, **kwargs):
+    """执行 fn 并把耗时（毫秒）记入 timings[stage]；timings 为 None 时不记录"""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if timings is not None:
+            timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _submit_timed(
+    timings: Optional[dict[str, float]],
+    stage: str,
+    fn: Callable,
+    *args,
+    **kwargs,
+) -> Future:
+    return _get_dual_executor().submit(_timed_call, timings, stage, fn, *args, **kwargs)
+
+
+def _log_timings(flow: str, timings: Optional[dict[str, float]]) -> None:
+    if timings:
+        logger.info(
+            "%s 各阶段耗时: %s",
+            flow,
+            " ".join(f"{stage}={ms:.0f}ms" for stage, ms in timings.items()),
+        )
+
+
 def parse_url_to_session_and_profile(
     url: str,
+    timings: Optional[dict[str, float]] = None,
 ) -> Tuple[str, Optional[WechatProfileSnapshot], Optional[str]]:
     """
     一次粘贴、双换票：
     同一 code → 并发 auth.html(JWT) + wechatAuth.html(Session，独立 Session)
-    → GraphQL 验 JWT → keep_alive 验 Session → 入库 wechatSESS_ID。
-    返回 (session_id, profile, warning)。
+    → 并发 GraphQL 验 JWT 并取资料（同一请求）/ keep_alive 验 Session → 入库 wechatSESS_ID。
+    返回 (session_id, profile, warning)；传入 timings 时写入各阶段耗时（毫秒）。
     """
+    started = time.perf_counter()
     code, state = parse_code_from_url(url)
-    ticket = exchange_dual_authorization_and_session(code, state)
+    ticket = _timed_call(timings, "exchange", exchange_dual_authorization_and_session, code, state)
     authorization = ticket.authorization
     auth_serverid = ticket.auth_serverid
     wechat_sess_id = ticket.wechat_sess_id
     wechat_serverid = ticket.wechat_serverid
 
-    warnings: list[str] = []
-    jwt_warn = validate_authorization(
+    # JWT 校验与资料合并为一次 GraphQL 请求，与 Session 校验并发执行；
+    # 错误优先级与原先顺序执行时一致（JWT 校验 → Session 校验）
+    jwt_future = _submit_timed(
+        timings,
+        "validate_jwt",
+        validate_and_fetch_profile,
         authorization,
         auth_serverid,
         http_session=ticket.auth_session,
     )
+    sess_future = _submit_timed(
+        timings, "validate_session", validate_wechat_sess_id, wechat_sess_id, authorization, wechat_serverid
+    )
+
+    warnings: list[str] = []
+    jwt_warn, profile = jwt_future.result()
     if jwt_warn:
         warnings.append(jwt_warn)
-    sess_warn = validate_wechat_sess_id(
-        wechat_sess_id, authorization, wechat_serverid
-    )
+    sess_warn = sess_future.result()
     if sess_warn:
         warnings.append(sess_warn)
 
-    profile: Optional[WechatProfileSnapshot] = None
-    try:
-        profile = fetch_user_auth(authorization, auth_serverid)
-    except Exception as exc:
-        logger.warning("获取微信个人资料失败: %s", exc)
+    if timings is not None:
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    _log_timings("双换票", timings)
 
     session_id = build_checkin_session_id(wechat_sess_id, wechat_serverid)
     warning = " ".join(warnings) if warnings else None
@@ -837,26 +882,39 @@ def parse_url_to_session_and_profile(
 
 def parse_url_to_authorization_and_profile(
     url: str,
+    timings: Optional[dict[str, float]] = None,
 ) -> Tuple[str, Optional[str], Optional[WechatProfileSnapshot], Optional[str]]:
     """两步授权第一阶段：单独使用一条 code 换取 JWT Cookie 与资料快照。"""
+    started = time.perf_counter()
     code, state = parse_code_from_url(url)
     auth_session = _traceint_session()
-    _prewarm_session(auth_session, GRAPHQL_URL)
-    authorization, serverid = exchange_authorization(code, state, auth_session)
+    warm_connection(_AUTH_ORIGIN_WARM_URL)
+    authorization, serverid = _timed_call(timings, "exchange", exchange_authorization, code, state, auth_session)
     if not authorization:
         raise ValueError("未能换取登录凭据，请重新授权")
 
-    warning = validate_authorization(authorization, serverid, http_session=auth_session)
-    profile = fetch_user_auth(authorization, serverid)
+    warning, profile = _timed_call(
+        timings, "validate_jwt", validate_and_fetch_profile, authorization, serverid, http_session=auth_session
+    )
+    if timings is not None:
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    _log_timings("两步授权（JWT）", timings)
     return authorization, serverid, profile, warning
 
 
-def parse_url_to_checkin_session(url: str) -> Tuple[str, Optional[str]]:
+def parse_url_to_checkin_session(
+    url: str,
+    timings: Optional[dict[str, float]] = None,
+) -> Tuple[str, Optional[str]]:
     """两步授权第二阶段：单独使用一条新 code 换取签到 Session。"""
+    started = time.perf_counter()
     code, state = parse_code_from_url(url)
     wechat_session = _traceint_session()
-    _prewarm_session(wechat_session, GET_TIME_URL)
-    wechat_sess_id = exchange_wechat_sess_id(code, state, wechat_session)
+    warm_connection(GET_TIME_URL)
+    wechat_sess_id = _timed_call(timings, "exchange", exchange_wechat_sess_id, code, state, wechat_session)
     wechat_serverid = wechat_session.cookies.get("SERVERID")
-    warning = validate_wechat_sess_id(wechat_sess_id, "", wechat_serverid)
+    warning = _timed_call(timings, "validate_session", validate_wechat_sess_id, wechat_sess_id, "", wechat_serverid)
+    if timings is not None:
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    _log_timings("两步授权（Session）", timings)
     return build_checkin_session_id(wechat_sess_id, wechat_serverid), warning
@@ -0,0 +1,308 @@
+"""Traceint 出站流量控制：按接口类别限速（令牌桶），按主机熔断（错误率过高时快速失败，冷却后半开探测）。"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 每类接口每秒允许发出的请求数（突发上限相同），0 表示不限速。
+# OAuth 换票的 code 是一次性的，默认不限速，只受熔断保护
+_DEFAULT_RATES = {
+    "keepalive": 10.0,
+    "checkin": 20.0,
+    "graphql": 10.0,
+    "auth": 0.0,
+    "avatar": 20.0,
+}
+UPSTREAM_RATES = {
+    name: max(0.0, float(os.getenv(f"TRACEINT_RATE_{name.upper()}_PER_SEC", str(rate))))
+    for name, rate in _DEFAULT_RATES.items()
+}
+# 令牌不足时最多排队等待的秒数，超出则直接失败
+UPSTREAM_MAX_WAIT_SECONDS = max(0.0, float(os.getenv("TRACEINT_RATE_MAX_WAIT_SEC", "2")))
+# 熔断：统计窗口内请求数不少于 MIN_REQUESTS 且失败率达到 ERROR_RATE 时打开，COOLDOWN 秒后放行探测请求
+BREAKER_WINDOW_SECONDS = max(1, int(os.getenv("TRACEINT_BREAKER_WINDOW_SEC", "30")))
+BREAKER_MIN_REQUESTS = max(1, int(os.getenv("TRACEINT_BREAKER_MIN_REQUESTS", "20")))
+BREAKER_ERROR_RATE = min(1.0, max(0.01, float(os.getenv("TRACEINT_BREAKER_ERROR_RATE", "0.5"))))
+BREAKER_COOLDOWN_SECONDS = max(1.0, float(os.getenv("TRACEINT_BREAKER_COOLDOWN_SEC", "15")))
+BREAKER_PROBES = max(1, int(os.getenv("TRACEINT_BREAKER_PROBES", "1")))
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class UpstreamRejected(RuntimeError):
+    """请求未发出：上游熔断中或本地限速排队超时"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def classify_endpoint(url: str) -> Optional[tuple[str, str]]:
+    """返回 (主机, 接口类别)；非 Traceint 主机返回 None（不受管控）"""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if not host.endswith("traceint.com"):
+        return None
+    path = parts.path
+    if host.startswith("static."):
+        return host, "avatar"
+    if "/wxApp/devices.html" in path:
+        return host, "keepalive"
+    if "/wxApp/sign.html" in path or "/wxApp/getTime.html" in path:
+        return host, "checkin"
+    if "graphql" in path:
+        return host, "graphql"
+    if path.endswith((".png", ".jpg", ".jpeg", ".gif", ".webp")):
+        return host, "avatar"
+    return host, "auth"
+
+
+def is_upstream_failure(status_code: int) -> bool:
+    """计入熔断统计的失败：5xx 与 429（4xx 多为凭据问题，与上游负载无关）"""
+    return status_code >= 500 or status_code == 429
+
+
+class _RateLimiter:
+    """预约式令牌桶：令牌可以预支为负数，调用方按返回的时长等待后再发请求"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """预约一个令牌，返回需等待的秒数；等待会超过 max_wait 时不预约并返回 None"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    def __init__(self, host: str):
+        self.host = host
+        self.state = BREAKER_CLOSED
+        # 每秒一个桶：[秒, 请求数, 失败数]
+        self._buckets: deque[list] = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        horizon = int(now) - BREAKER_WINDOW_SECONDS
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+
+    def _counts(self) -> tuple[int, int]:
+        total = sum(bucket[1] for bucket in self._buckets)
+        errors = sum(bucket[2] for bucket in self._buckets)
+        return total, errors
+
+    def _retry_after(self, now: float) -> float:
+        return max(self._opened_at + BREAKER_COOLDOWN_SECONDS - now, 1.0)
+
+    def check(self) -> None:
+        """仍在冷却期内时抛出 UpstreamRejected，不改变状态"""
+        with self._lock:
+            if self.state != BREAKER_OPEN:
+                return
+            now = time.monotonic()
+            if self._opened_at + BREAKER_COOLDOWN_SECONDS <= now:
+                return
+            retry_after = self._retry_after(now)
+        raise UpstreamRejected("Traceint 上游暂时不可用，请稍后重试", retry_after)
+
+    def admit(self) -> bool:
+        """放行返回是否为半开探测请求；熔断中抛出 UpstreamRejected"""
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return False
+            now = time.monotonic()
+            if self.state == BREAKER_OPEN and self._opened_at + BREAKER_COOLDOWN_SECONDS <= now:
+                self.state = BREAKER_HALF_OPEN
+                self._probes = 0
+                logger.info(f"Traceint circuit for {self.host} half-open, probing")
+            if self.state == BREAKER_HALF_OPEN and self._probes < BREAKER_PROBES:
+                self._probes += 1
+                return True
+            retry_after = self._retry_after(now)
+        raise UpstreamRejected("Traceint 上游暂时不可用，请稍后重试", retry_after)
+
+    def record(self, ok: bool, probe: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probes = max(0, self._probes - 1)
+                if self.state != BREAKER_HALF_OPEN:
+                    return
+                if ok:
+                    self.state = BREAKER_CLOSED
+                    self._buckets.clear()
+                    logger.info(f"Traceint circuit for {self.host} closed after successful probe")
+                else:
+                    self._open(now, "probe failed")
+                return
+            if self.state != BREAKER_CLOSED:
+                return
+
+            # 每次记录都裁掉窗口外的桶，只有成功请求时也不会无限增长
+            self._trim(now)
+            second = int(now)
+            if self._buckets and self._buckets[-1][0] == second:
+                bucket = self._buckets[-1]
+            else:
+                bucket = [second, 0, 0]
+                self._buckets.append(bucket)
+            bucket[1] += 1
+            if not ok:
+                bucket[2] += 1
+                total, errors = self._counts()
+                if total >= BREAKER_MIN_REQUESTS and errors / total >= BREAKER_ERROR_RATE:
+                    self._open(now, f"{errors}/{total} failed in {BREAKER_WINDOW_SECONDS}s")
+
+    def release(self, probe: bool) -> None:
+        """请求在本地被取消、没有得到上游结果：归还半开探测名额，不计入成功或失败"""
+        if not probe:
+            return
+        with self._lock:
+            self._probes = max(0, self._probes - 1)
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = BREAKER_OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        logger.warning(
+            f"Traceint circuit for {self.host} opened ({reason}), "
+            f"failing fast for {BREAKER_COOLDOWN_SECONDS:g}s"
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            total, errors = self._counts()
+            return {"state": self.state, "window_requests": total, "window_errors": errors}
+
+
+class UpstreamPermit:
+    """一次已放行的出站请求；请求结束后必须调用 finish 报告结果，未得到上游结果时调用 cancel"""
+
+    __slots__ = ("_breaker", "_probe", "_done")
+
+    def __init__(self, breaker: CircuitBreaker, probe: bool):
+        self._breaker = breaker
+        self._probe = probe
+        self._done = False
+
+    def finish(self, ok: bool) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._breaker.record(ok, self._probe)
+
+    def cancel(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._breaker.release(self._probe)
+
+
+class UpstreamGovernor:
+    def __init__(self):
+        self._limiters = {name: _RateLimiter(rate) for name, rate in UPSTREAM_RATES.items() if rate > 0}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._rejected = {"rate": 0, "circuit": 0}
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(host, CircuitBreaker(host))
+        return breaker
+
+    def _count_rejection(self, reason: str) -> None:
+        with self._lock:
+            self._rejected[reason] += 1
+
+    def _reserve(self, url: str) -> tuple[Optional[CircuitBreaker], float]:
+        """检查熔断并预约令牌，返回 (熔断器, 需等待秒数)；不受管控的 URL 返回 (None, 0)"""
+        endpoint = classify_endpoint(url)
+        if endpoint is None:
+            return None, 0.0
+        host, kind = endpoint
+        breaker = self._breaker(host)
+        # 熔断中的请求不消耗令牌；是否放行（及半开探测名额）在等待令牌之后的 admit 中确定
+        try:
+            breaker.check()
+        except UpstreamRejected:
+            self._count_rejection("circuit")
+            raise
+        limiter = self._limiters.get(kind)
+        if limiter is None:
+            return breaker, 0.0
+        wait = limiter.reserve(UPSTREAM_MAX_WAIT_SECONDS)
+        if wait is None:
+            self._count_rejection("rate")
+            raise UpstreamRejected("Traceint 请求过多，请稍后重试", 1.0 / limiter.rate)
+        return breaker, wait
+
+    def _admit(self, breaker: Optional[CircuitBreaker]) -> Optional[UpstreamPermit]:
+        if breaker is None:
+            return None
+        try:
+            probe = breaker.admit()
+        except UpstreamRejected:
+            self._count_rejection("circuit")
+            raise
+        return UpstreamPermit(breaker, probe)
+
+    def acquire(self, url: str) -> Optional[UpstreamPermit]:
+        """同步调用方：按需等待令牌后放行；上游熔断或排队超时抛出 UpstreamRejected"""
+        breaker, wait = self._reserve(url)
+        if wait > 0:
+            time.sleep(wait)
+        return self._admit(breaker)
+
+    async def acquire_async(self, url: str) -> Optional[UpstreamPermit]:
+        breaker, wait = self._reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return self._admit(breaker)
+
+    def circuit_open(self, url: str) -> bool:
+        """url 所在主机的熔断器是否处于打开或半开状态（不受管控的 URL 返回 False）"""
+        endpoint = classify_endpoint(url)
+        if endpoint is None:
+            return False
+        breaker = self._breakers.get(endpoint[0])
+        return breaker is not None and breaker.state != BREAKER_CLOSED
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+            rejected = dict(self._rejected)
+        return {
+            "rates_per_sec": dict(UPSTREAM_RATES),
+            "rejected": rejected,
+            "circuits": {host: breaker.snapshot() for host, breaker in breakers.items()},
+        }
+
+
+traceint_governor = UpstreamGovernor()
@@ -0,0 +1,224 @@
+"""调度任务结果的写回缓冲：合并保活/签到结果后批量写库。"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlmodel import Session
+
+from app.database import CONFIG_VERSION_BUMP, Config, append_activity_events, engine
+
+logger = logging.getLogger(__name__)
+
+# 缓冲中待写配置数达到该值时立即写库
+WRITEBACK_BATCH_SIZE = max(1, int(os.getenv("WRITEBACK_BATCH_SIZE", "200")))
+# 最长缓冲时间（秒）
+WRITEBACK_FLUSH_SEC = max(0.1, float(os.getenv("WRITEBACK_FLUSH_SEC", "2")))
+# 缓冲中最多保留的事件数；写库持续失败时丢弃最旧的事件（配置结果按 config_id 合并，本身有界）
+WRITEBACK_MAX_EVENTS = max(1, int(os.getenv("WRITEBACK_MAX_EVENTS", "10000")))
+# 写库失败后重试间隔从 WRITEBACK_FLUSH_SEC 起逐次翻倍，最长不超过该秒数
+WRITEBACK_MAX_BACKOFF_SEC = max(WRITEBACK_FLUSH_SEC, float(os.getenv("WRITEBACK_MAX_BACKOFF_SEC", "60")))
+
+
+@dataclass
+class ConfigOutcome:
+    """单个配置待写回的字段；None 表示不修改。"""
+    config_id: int
+    owner_id: Optional[int] = None
+    last_keepalive: Optional[datetime] = None
+    last_checkin: Optional[datetime] = None
+    last_checkin_result: Optional[str] = None
+    last_log: Optional[str] = None
+    next_checkin_at: Optional[datetime] = None
+    # session_id 轮换：仅当库中仍为 rotate_from 时才写入 rotate_to，避免覆盖用户刚保存的新凭据
+    rotate_from: Optional[str] = None
+    rotate_to: Optional[str] = None
+
+    def merge(self, newer: "ConfigOutcome") -> None:
+        for f in fields(self):
+            if f.name in ("config_id", "rotate_from"):
+                continue
+            value = getattr(newer, f.name)
+            if value is not None:
+                setattr(self, f.name, value)
+        if self.rotate_from is None:
+            self.rotate_from = newer.rotate_from
+
+    def column_values(self) -> dict:
+        return {
+            name: getattr(self, name)
+            for name in ("last_keepalive", "last_checkin", "last_checkin_result", "last_log", "next_checkin_at")
+            if getattr(self, name) is not None
+        }
+
+
+class ResultWriter:
+    """
+    单写线程：调度任务只把结果放进缓冲，按数量或时间阈值合并成一个事务写库，
+    把 N 次 SQLite 写事务降为 1 次，减少与 API 请求争抢数据库锁。
+    """
+
+    def __init__(
+        self,
+        batch_size: int = WRITEBACK_BATCH_SIZE,
+        flush_interval: float = WRITEBACK_FLUSH_SEC,
+        max_events: int = WRITEBACK_MAX_EVENTS,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._pending: dict[int, ConfigOutcome] = {}
+        self._events: list[dict] = []
+        self._dropped_events = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """停止写线程并把缓冲中剩余结果全部写库"""
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout=max(5.0, self.flush_interval * 2))
+        self._thread = None
+        self.flush()
+
+    def submit(self, outcome: ConfigOutcome) -> None:
+        with self._lock:
+            current = self._pending.get(outcome.config_id)
+            if current is None:
+                self._pending[outcome.config_id] = outcome
+            else:
+                current.merge(outcome)
+            pending_count = len(self._pending)
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if pending_count >= self.batch_size:
+            self._wake.set()
+
+    def submit_event(
+        self,
+        owner_id: Optional[int],
+        kind: str,
+        success: bool,
+        message: str,
+        created_at: Optional[datetime] = None,
+    ) -> None:
+        """追加一条事件历史，与配置更新在同一事务中批量写入"""
+        if owner_id is None:
+            return
+        with self._lock:
+            self._events.append({
+                "owner_id": owner_id,
+                "kind": kind,
+                "success": bool(success),
+                "message": message or "",
+                "created_at": created_at or datetime.now(),
+            })
+            self._trim_events()
+            pending_count = len(self._pending) + len(self._events)
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if pending_count >= self.batch_size:
+            self._wake.set()
+
+    def _trim_events(self) -> None:
+        """丢弃超出 max_events 的最旧事件（调用方持有 _lock）"""
+        overflow = len(self._events) - self.max_events
+        if overflow > 0:
+            del self._events[:overflow]
+            self._dropped_events += overflow
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending) + len(self._events)
+
+    def flush(self) -> int:
+        """立即写库，返回写入的配置数量"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                events, self._events = self._events, []
+            if not batch and not events:
+                return 0
+            try:
+                self._write(batch, events)
+            except Exception as e:
+                logger.error(
+                    f"Result write-back failed for {len(batch)} config(s) / {len(events)} event(s), will retry: {e}"
+                )
+                with self._lock:
+                    for config_id, outcome in batch.items():
+                        newer = self._pending.get(config_id)
+                        if newer is not None:
+                            outcome.merge(newer)
+                        self._pending[config_id] = outcome
+                    self._events[:0] = events
+                    self._trim_events()
+                    dropped, self._dropped_events = self._dropped_events, 0
+                    self._failures += 1
+                    backoff = min(WRITEBACK_MAX_BACKOFF_SEC, self.flush_interval * 2 ** self._failures)
+                    self._retry_at = time.monotonic() + backoff
+                if dropped:
+                    logger.warning(f"Result write-back buffer full, dropped {dropped} oldest event(s)")
+                return 0
+            with self._lock:
+                dropped, self._dropped_events = self._dropped_events, 0
+                self._failures = 0
+                self._retry_at = 0.0
+            if dropped:
+                logger.warning(f"Result write-back buffer full, dropped {dropped} oldest event(s)")
+            logger.debug(f"Result write-back flushed {len(batch)} config(s) / {len(events)} event(s)")
+            return len(batch)
+
+    def _write(self, batch: dict[int, ConfigOutcome], events: list[dict]) -> None:
+        with Session(engine) as session:
+            append_activity_events(session, events)
+            for config_id, outcome in batch.items():
+                values = outcome.column_values()
+                if values:
+                    session.execute(
+                        update(Config).where(Config.id == config_id).values(**values, **CONFIG_VERSION_BUMP)
+                    )
+                if outcome.rotate_to and outcome.rotate_to != outcome.rotate_from:
+                    session.execute(
+                        update(Config)
+                        .where(Config.id == config_id, Config.session_id == outcome.rotate_from)
+                        .values(session_id=outcome.rotate_to, **CONFIG_VERSION_BUMP)
+                    )
+            session.commit()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            # 上次写库失败后退避：期间不因批量阈值或定时唤醒反复重试
+            with self._lock:
+                backoff = self._retry_at - time.monotonic()
+            if backoff > 0:
+                self._stopping.wait(backoff)
+                if self._stopping.is_set():
+                    return
+            self.flush()
+
+
+result_writer = ResultWriter()
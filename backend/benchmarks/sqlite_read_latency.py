@@ -0,0 +1,122 @@
+"""
+SQLite 存储配置基准：保活轮询持续写库时，/api/status 式读取的延迟。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.sqlite_read_latency --users 2000 --seconds 5
+
+对 legacy（回滚日志）与 wal 两种配置分别建库，后台线程按保活轮询的方式逐用户
+UPDATE + COMMIT，主线程用只读连接池反复按 owner_id 读取配置，输出读延迟分位数。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 先指向临时库，避免导入 app.database 时在工作目录创建默认数据库
+_tmpdir = tempfile.mkdtemp(prefix="wegolib-bench-")
+os.environ.setdefault("SQLITE_DB_PATH", str(Path(_tmpdir) / "default.db"))
+
+from sqlalchemy import update  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from app.database import Config, User, create_storage_engine, get_config_by_owner  # noqa: E402
+
+
+def _seed(engine, users: int) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        for i in range(1, users + 1):
+            session.add(User(id=i, username=f"bench{i}", password_hash="x"))
+            session.add(Config(owner_id=i, user_id=f"user_{i}", session_id=f"wechatSESS_ID=s{i}", major=20, minor=9))
+        session.commit()
+
+
+def _writer(engine, users: int, stop: threading.Event, counter: list[int]) -> None:
+    owner_id = 0
+    with Session(engine) as session:
+        while not stop.is_set():
+            owner_id = owner_id % users + 1
+            session.execute(
+                update(Config)
+                .where(Config.owner_id == owner_id)
+                .values(last_keepalive=datetime.now(), last_log="KeepAlive: Session renewed successfully")
+            )
+            session.commit()
+            counter[0] += 1
+
+
+def run_profile(profile: str, users: int, seconds: float) -> dict:
+    path = Path(_tmpdir) / f"{profile}.db"
+    url = f"sqlite:///{path.as_posix()}"
+    write_engine = create_storage_engine(url, profile=profile)
+    read_engine = create_storage_engine(url, read_only=True, profile=profile)
+    _seed(write_engine, users)
+
+    stop = threading.Event()
+    writes = [0]
+    writer = threading.Thread(target=_writer, args=(write_engine, users, stop, writes), daemon=True)
+    writer.start()
+
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        owner_id = random.randint(1, users)
+        started = time.perf_counter()
+        try:
+            with Session(read_engine) as session:
+                get_config_by_owner(session, owner_id)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    stop.set()
+    writer.join()
+    write_engine.dispose()
+    read_engine.dispose()
+
+    latencies.sort()
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else float("nan")
+
+    return {
+        "profile": profile,
+        "reads": len(latencies),
+        "writes": writes[0],
+        "errors": errors,
+        "mean_ms": statistics.fmean(latencies) if latencies else float("nan"),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": latencies[-1] if latencies else float("nan"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profiles", default="legacy,wal")
+    args = parser.parse_args()
+
+    print(f"{'profile':<8} {'reads':>7} {'writes':>7} {'errors':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for profile in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+        r = run_profile(profile, args.users, args.seconds)
+        print(
+            f"{r['profile']:<8} {r['reads']:>7} {r['writes']:>7} {r['errors']:>6} "
+            f"{r['mean_ms']:>7.2f}ms {r['p50_ms']:>7.2f}ms {r['p95_ms']:>7.2f}ms "
+            f"{r['p99_ms']:>7.2f}ms {r['max_ms']:>7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+# 引擎在导入 app.database 时创建，必须先指向临时数据库
+_db_dir = tempfile.mkdtemp(prefix="wegolib-test-")
+os.environ["SQLITE_DB_PATH"] = os.path.join(_db_dir, "test.db")
+os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+
+import pytest
+from sqlalchemy import delete
+from sqlmodel import Session, SQLModel
+
+from app.database import create_db_and_tables, engine
+
+
+@pytest.fixture
+def session():
+    create_db_and_tables()
+    with Session(engine) as db:
+        yield db
+    with Session(engine) as db:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            db.execute(delete(table))
+        db.commit()
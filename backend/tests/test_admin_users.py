@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database import ADMIN_USER_SORT_FIELDS, Config, User, list_admin_users
+
+
+@pytest.fixture
+def users(session):
+    base = datetime(2026, 1, 1)
+    names = ["carol", "alice", "bob", "dave", "erin", "alice2", "frank"]
+    for index, name in enumerate(names, start=1):
+        # 部分用户 created_at 相同，用于检查相同排序值时按 id 继续翻页
+        session.add(User(id=index, username=name, password_hash="x", created_at=base + timedelta(days=index // 3)))
+    for owner_id, checkin_day in ((1, 5), (2, None), (4, 5), (6, 2)):
+        session.add(Config(
+            owner_id=owner_id,
+            session_id="sid" if owner_id != 4 else "",
+            major=1,
+            minor=1,
+            last_checkin=base + timedelta(days=checkin_day) if checkin_day else None,
+        ))
+    session.commit()
+    return names
+
+
+def _all_pages(session, limit, **kwargs):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = list_admin_users(session, limit=limit, cursor=cursor, **kwargs)
+        ids += [user.id for user, _config in rows]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("sort", ADMIN_USER_SORT_FIELDS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_match_single_query(session, users, sort, descending):
+    expected = [user.id for user, _config in list_admin_users(session, limit=100, sort=sort, descending=descending)[0]]
+    assert sorted(expected) == list(range(1, len(users) + 1))
+    for limit in (1, 2, 3):
+        assert _all_pages(session, limit, sort=sort, descending=descending) == expected
+
+
+def test_sort_order(session, users):
+    rows, _cursor = list_admin_users(session, limit=100, sort="username")
+    assert [user.username for user, _config in rows] == sorted(users)
+    rows, _cursor = list_admin_users(session, limit=100, sort="last_checkin", descending=True)
+    assert [user.id for user, _config in rows][:3] == [4, 1, 6]
+
+
+def test_filters(session, users):
+    assert _all_pages(session, 2, status="unconfigured") == [3, 5, 7]
+    assert _all_pages(session, 2, status="active") == [1, 2, 6]
+    assert _all_pages(session, 2, status="logged_out") == [4]
+
+
+def test_invalid_cursor_and_sort(session, users):
+    with pytest.raises(ValueError):
+        list_admin_users(session, cursor="not-a-cursor")
+    with pytest.raises(ValueError):
+        list_admin_users(session, sort="password_hash")
+
+
+def test_total_only_on_first_page(session, users, monkeypatch):
+    from app import main
+
+    counts = []
+    count = main.count_admin_users
+    monkeypatch.setattr(main, "count_admin_users", lambda *args, **kwargs: counts.append(1) or count(*args, **kwargs))
+    admin = session.get(User, 1)
+
+    def page(**kwargs):
+        return main.get_admin_users(
+            limit=3, status=None, school=None, configured=None, sort="id", order="asc", admin=admin, session=session,
+            **kwargs,
+        )
+
+    first = page(cursor=None, with_total=False)
+    assert first["total"] == len(users)
+    second = page(cursor=first["next_cursor"], with_total=False)
+    assert second["total"] is None
+    assert page(cursor=first["next_cursor"], with_total=True)["total"] == len(users)
+    assert len(counts) == 2
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+from sqlalchemy import event, update
+from sqlmodel import Session
+from starlette.requests import Request
+
+from app import auth
+from app.auth import create_persistent_auth_session, _refresh_auth_session, _resolve_auth_session
+from app.database import AuthSession, User, engine
+
+
+@pytest.fixture
+def token(session, monkeypatch):
+    monkeypatch.setattr(auth, "_identity_cache", auth._IdentityCache(60, 100))
+    session.add(User(id=1, username="alice", password_hash="x", is_admin=True))
+    session.commit()
+    return create_persistent_auth_session(session, 1)
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def _record(_conn, _cursor, statement, *_args):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", _record)
+
+
+def _request() -> Request:
+    return Request({"type": "http", "headers": [], "scheme": "http", "server": ("test", 80), "path": "/"})
+
+
+def test_cache_hit_does_not_query(token, statements):
+    with Session(engine) as db:
+        user, identity = _resolve_auth_session(db, token)
+    assert (user.id, user.username, user.is_admin) == (1, "alice", True)
+    statements.clear()
+
+    with Session(engine) as db:
+        cached, cached_identity = _resolve_auth_session(db, token)
+        assert _refresh_auth_session(db, cached_identity, Response(), _request(), token)
+    assert statements == []
+    assert cached is not user
+    assert (cached.id, cached.username, cached.is_admin) == (1, "alice", True)
+
+
+def test_refresh_of_revoked_session_fails(token, monkeypatch):
+    with Session(engine) as db:
+        _user, identity = _resolve_auth_session(db, token)
+        # 其他 worker 撤销了会话，续期时发现未更新任何行
+        db.execute(update(AuthSession).values(revoked_at=datetime.now()))
+        db.commit()
+        identity.last_used_at = datetime.now() - timedelta(days=1)
+        assert not _refresh_auth_session(db, identity, Response(), _request(), token)
+        assert _resolve_auth_session(db, token) == (None, None)
+
+
+def test_cached_user_can_be_saved(token):
+    with Session(engine) as db:
+        _resolve_auth_session(db, token)
+    with Session(engine) as db:
+        user, _identity = _resolve_auth_session(db, token)
+        user.wechat_authorization_failures = 3
+        db.add(user)
+        db.commit()
+    with Session(engine) as db:
+        assert db.get(User, 1).wechat_authorization_failures == 3
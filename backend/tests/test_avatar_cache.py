@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app import avatar_cache
+from app.avatar_cache import AvatarCache, AvatarFetchError, _cache_key
+
+URL = "https://wx.qlogo.cn/mmopen/avatar/0"
+BODY = b"x" * 200_000
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("if-none-match") == "up-1":
+            return httpx.Response(304)
+        if request.url.path.endswith("/html"):
+            return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html>")
+        return httpx.Response(200, headers={"content-type": "image/png", "etag": "up-1"}, content=BODY)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(avatar_cache, "get_async_client", lambda: client)
+    return requests
+
+
+async def _read(body):
+    return b"".join([chunk async for chunk in body.chunks])
+
+
+def test_miss_streams_and_coalesces(tmp_path, upstream):
+    async def scenario():
+        cache = AvatarCache(str(tmp_path), memory_bytes=0, disk_bytes=10 ** 6)
+        leader, follower = await asyncio.gather(cache.open(URL), cache.open(URL))
+        # 发起回源的请求边下载边返回，此时还没有内容哈希
+        assert leader.etag is None
+        assert follower.etag is not None
+        assert await _read(leader) == BODY
+        assert await _read(follower) == BODY
+        hit = await cache.open(URL)
+        assert hit.etag == follower.etag
+        assert await _read(hit) == BODY
+
+    asyncio.run(scenario())
+    assert len(upstream) == 1
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".img", ".json"]
+
+
+def test_evicted_file_and_revalidation(tmp_path, upstream):
+    async def scenario():
+        cache = AvatarCache(str(tmp_path), memory_bytes=0, disk_bytes=10 ** 6)
+        await _read(await cache.open(URL))
+        # 其他 worker 淘汰了文件：重新回源
+        os.unlink(tmp_path / f"{_cache_key(URL)}.img")
+        assert await _read(await cache.open(URL)) == BODY
+        # 过期后带条件请求验证，304 时继续使用磁盘文件
+        for entry in cache._disk.values():
+            entry.fetched_at = 0
+        body = await cache.open(URL)
+        assert body.etag is not None
+        assert await _read(body) == BODY
+
+    asyncio.run(scenario())
+    assert len(upstream) == 3
+    assert upstream[-1].headers["if-none-match"] == "up-1"
+
+
+def test_rejects_non_image(tmp_path, upstream):
+    async def scenario():
+        cache = AvatarCache(str(tmp_path), memory_bytes=10 ** 6, disk_bytes=10 ** 6)
+        with pytest.raises(AvatarFetchError):
+            await cache.open(URL + "/html")
+
+    asyncio.run(scenario())
+    assert not list(tmp_path.iterdir())
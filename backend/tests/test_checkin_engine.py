@@ -0,0 +1,70 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import scheduler
+from app.core import PreparedSignIn
+from app.database import Config, User
+from app.scheduler import CheckinEngine
+
+
+@pytest.fixture
+def sent(session, monkeypatch):
+    expire_at = datetime.now() + timedelta(days=1)
+    for owner_id in (1, 2, 3):
+        session.add(User(id=owner_id, username=f"u{owner_id}", password_hash="x"))
+        session.add(Config(owner_id=owner_id, session_id="sid", major=1, minor=1, auto_checkin_expire_at=expire_at))
+    session.commit()
+
+    records = []
+    prepared_on = []
+    done = threading.Event()
+
+    def prepare(config, due):
+        prepared_on.append((config.owner_id, threading.current_thread().name))
+        return PreparedSignIn(payload={}, target_time=due, clock_source="offset", prepared_at=time.time())
+
+    def checkin(config, next_checkin_at=None, prepared=None):
+        records.append((config.owner_id, time.time(), prepared, threading.current_thread().name))
+        if len(records) == 3:
+            done.set()
+        return True
+
+    monkeypatch.setattr(scheduler, "_prepare_checkin", prepare)
+    monkeypatch.setattr(scheduler, "_checkin_single", checkin)
+    return expire_at, records, prepared_on, done
+
+
+def test_prearmed_tick_dispatches_at_due_time(sent):
+    expire_at, records, prepared_on, done = sent
+    engine = CheckinEngine(interval=600, concurrency=2, prearm=2.0)
+    now = time.time()
+    dues = {1: now - 1, 2: now + 0.3, 3: now + 0.6}
+    for owner_id, due in dues.items():
+        engine.schedule(owner_id, expire_at, first_due=due)
+
+    started = time.monotonic()
+    assert engine.tick(now) == 3
+    # tick 只负责派发，不等待到期
+    assert time.monotonic() - started < 0.2
+    assert done.wait(5)
+    engine.shutdown()
+
+    for owner_id, sent_at, prepared, thread_name in records:
+        assert prepared is not None
+        assert thread_name.startswith("auto-checkin_")
+        assert max(dues[owner_id], now) <= sent_at < max(dues[owner_id], now) + 0.2
+    assert all(name.startswith("auto-checkin-prepare") for _owner_id, name in prepared_on)
+    # 已排好下一次签到
+    assert engine.pending_count() == 3
+
+
+def test_late_payload_is_rearmed(sent):
+    _expire_at, records, prepared_on, _done = sent
+    config = Config(owner_id=1, session_id="sid", major=1, minor=1)
+    stale = PreparedSignIn(payload={}, target_time=time.time() - 5, clock_source="offset", prepared_at=0)
+    scheduler._checkin_prepared(config, None, stale)
+    assert prepared_on and records[0][2] is not stale
+    assert abs(records[0][2].target_time - time.time()) < 1
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import select
+
+from app.database import (
+    ACTIVITY_DETAIL_HOURS,
+    ACTIVITY_RETENTION_DAYS,
+    EVENT_KIND_CHECKIN,
+    EVENT_KIND_KEEPALIVE,
+    ActivityEvent,
+    append_activity_events,
+    compact_activity_events,
+)
+
+NOW = datetime(2026, 3, 10, 12, 30)
+
+
+def _event(owner_id, created_at, kind=EVENT_KIND_KEEPALIVE, success=True):
+    return {"owner_id": owner_id, "kind": kind, "success": success, "message": "", "created_at": created_at}
+
+
+def test_compaction(session):
+    old_hour = (NOW - timedelta(hours=ACTIVITY_DETAIL_HOURS + 3)).replace(minute=0)
+    recent = NOW - timedelta(hours=1)
+    expired = NOW - timedelta(days=ACTIVITY_RETENTION_DAYS, minutes=1)
+    events = [_event(1, expired), _event(1, expired, kind=EVENT_KIND_CHECKIN)]
+    # 较早的一小时内：用户 1 有 4 条成功保活，用户 2 有 2 条，下一小时用户 1 还有 2 条
+    events += [_event(1, old_hour + timedelta(minutes=m)) for m in (0, 15, 30, 45)]
+    events += [_event(2, old_hour + timedelta(minutes=m)) for m in (5, 50)]
+    events += [_event(1, old_hour + timedelta(hours=1, minutes=m)) for m in (10, 40)]
+    # 失败保活与签到事件完整保留
+    events += [_event(1, old_hour + timedelta(minutes=20), success=False)]
+    events += [_event(1, old_hour + timedelta(minutes=25), kind=EVENT_KIND_CHECKIN)]
+    # 明细窗口内的事件不降采样
+    events += [_event(1, recent + timedelta(minutes=m)) for m in (0, 1, 2)]
+    append_activity_events(session, events)
+    session.commit()
+
+    result = compact_activity_events(session, now=NOW)
+    assert result == {"expired": 2, "downsampled": 5}
+
+    remaining = session.exec(select(ActivityEvent).order_by(ActivityEvent.id)).all()
+    kept = [(e.owner_id, e.kind, e.success, e.created_at) for e in remaining]
+    assert (1, EVENT_KIND_KEEPALIVE, True, old_hour) in kept
+    assert (2, EVENT_KIND_KEEPALIVE, True, old_hour + timedelta(minutes=5)) in kept
+    assert (1, EVENT_KIND_KEEPALIVE, True, old_hour + timedelta(hours=1, minutes=10)) in kept
+    assert (1, EVENT_KIND_KEEPALIVE, False, old_hour + timedelta(minutes=20)) in kept
+    assert (1, EVENT_KIND_CHECKIN, True, old_hour + timedelta(minutes=25)) in kept
+    assert sum(1 for e in remaining if e.created_at >= recent) == 3
+    assert len(remaining) == 8
+
+    # 再次压缩不会继续删除
+    assert compact_activity_events(session, now=NOW) == {"expired": 0, "downsampled": 0}
@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import http_pool
+from app.http_pool import ConnectionWarmer, idle_connections, warm_connection
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        body = b"1700000000000"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    _Handler.hits = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/getTime.html"
+    server.shutdown()
+    server.server_close()
+    http_pool.close_traceint_pool()
+
+
+def test_warm_only_when_no_reusable_connection(url):
+    assert warm_connection(url)
+    assert idle_connections(url) == 1
+    # 已有可复用连接：不发请求
+    assert not warm_connection(url)
+    assert not warm_connection(url, max_idle=60)
+    # 整个间隔内没有请求：发一次，防止服务端按 keep-alive 超时关闭连接
+    assert warm_connection(url, max_idle=0)
+    assert _Handler.hits == 2
+
+
+def test_no_warm_while_circuit_open(url, monkeypatch):
+    monkeypatch.setattr(http_pool.traceint_governor, "circuit_open", lambda _url: True)
+    assert not warm_connection(url)
+    assert _Handler.hits == 0
+
+
+def test_warmer_running_flag():
+    warmer = ConnectionWarmer((), interval=60)
+    assert not warmer.running
+    warmer.start()
+    assert warmer.running
+    warmer.stop()
+    assert not warmer.running
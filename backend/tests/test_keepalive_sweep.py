@@ -0,0 +1,63 @@
+import threading
+import time
+import types
+
+import pytest
+
+from app import scheduler
+from app.database import Config, User
+
+
+class _Gauge:
+    """统计同时执行的保活调用数"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, config_id: int) -> bool:
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.calls.append(config_id)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return config_id % 2 == 0
+
+
+@pytest.mark.parametrize("concurrency", [1, 3, 8])
+def test_sweep_is_bounded_by_concurrency(monkeypatch, concurrency):
+    gauge = _Gauge(delay=0.02)
+    monkeypatch.setattr(scheduler, "_keep_alive_by_config_id", gauge)
+    config_ids = list(range(1, 21))
+
+    assert scheduler._run_keep_alive_sweep(config_ids, concurrency) == 10
+    assert sorted(gauge.calls) == config_ids
+    assert gauge.peak == concurrency
+
+
+def test_job_reports_sweep_stats(session, monkeypatch):
+    for owner_id in range(1, 7):
+        session.add(User(id=owner_id, username=f"u{owner_id}", password_hash="x"))
+        session.add(Config(owner_id=owner_id, session_id="" if owner_id == 6 else "sid", major=1, minor=1))
+    session.commit()
+
+    gauge = _Gauge(delay=0.05)
+    monkeypatch.setattr(scheduler, "_keep_alive_by_config_id", gauge)
+    monkeypatch.setattr(scheduler, "partition_membership", types.SimpleNamespace(ranges=None))
+    monkeypatch.setattr(scheduler, "KEEPALIVE_WHEEL_SLOTS", 1)
+    monkeypatch.setattr(scheduler, "KEEPALIVE_MODE", "threads")
+    monkeypatch.setattr(scheduler, "last_keepalive_sweep", {})
+
+    scheduler.keep_alive_job(concurrency=2)
+
+    stats = scheduler.last_keepalive_sweep
+    # 没有 session_id 的配置不参与保活；5 个用户、并发 2 至少需要 3 轮
+    assert (stats["total"], stats["concurrency"], stats["mode"]) == (5, 2, "threads")
+    assert stats["succeeded"] == sum(1 for config_id in gauge.calls if config_id % 2 == 0)
+    assert gauge.peak == 2
+    assert 0.15 <= stats["duration_sec"] < 5
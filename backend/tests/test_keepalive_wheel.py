@@ -0,0 +1,40 @@
+import pytest
+
+from app.database import Config, User, get_active_configs_in_slot, owner_slot
+from app.scheduler import KEEPALIVE_TICK_SECONDS, KEEPALIVE_WHEEL_SLOTS, current_keepalive_slot
+
+
+@pytest.fixture
+def configs(session):
+    for owner_id in range(1, 201):
+        session.add(User(id=owner_id, username=f"u{owner_id}", password_hash="x"))
+        session.add(Config(owner_id=owner_id, session_id="sid", major=1, minor=1, is_active=owner_id % 10 != 0))
+    session.commit()
+    return {owner_id for owner_id in range(1, 201) if owner_id % 10 != 0}
+
+
+def test_owner_slot_is_stable_and_balanced():
+    slots = 12
+    counts = [0] * slots
+    for owner_id in range(1, 12001):
+        slot = owner_slot(owner_id, slots)
+        assert 0 <= slot < slots
+        assert slot == owner_slot(owner_id, slots)
+        counts[slot] += 1
+    assert max(counts) - min(counts) < 0.1 * 1000
+
+
+def test_slot_query_matches_python(session, configs):
+    slots = 7
+    seen = set()
+    for slot in range(slots):
+        owners = {config.owner_id for config in get_active_configs_in_slot(session, slot, slots)}
+        assert all(owner_slot(owner_id, slots) == slot for owner_id in owners)
+        assert not owners & seen
+        seen |= owners
+    assert seen == configs
+
+
+def test_current_slot_follows_wall_clock():
+    slots = [current_keepalive_slot(index * KEEPALIVE_TICK_SECONDS + 1) for index in range(2 * KEEPALIVE_WHEEL_SLOTS)]
+    assert slots == list(range(KEEPALIVE_WHEEL_SLOTS)) * 2
@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from app.database import Config, User, get_all_active_configs, owner_hash
+from app.partition import _RING_SPACE, build_ring, ranges_for, ring_owner
+
+MEMBERS = ["worker-a", "worker-b", "worker-c"]
+
+
+@pytest.fixture
+def configs(session):
+    for owner_id in range(1, 201):
+        session.add(User(id=owner_id, username=f"u{owner_id}", password_hash="x"))
+        session.add(Config(owner_id=owner_id, session_id="sid", major=1, minor=1, is_active=owner_id % 10 != 0))
+    session.commit()
+    return {owner_id for owner_id in range(1, 201) if owner_id % 10 != 0}
+
+
+def test_ring_ranges_partition_the_hash_space():
+    ring = build_ring(MEMBERS, vnodes=16)
+    all_ranges = sorted(r for member in MEMBERS for r in ranges_for(ring, member))
+    assert all_ranges[0][0] == 0
+    assert all_ranges[-1][1] == _RING_SPACE
+    for (_start, end), (next_start, _end) in zip(all_ranges, all_ranges[1:]):
+        assert end == next_start
+
+    rng = random.Random(7)
+    probes = [0, _RING_SPACE - 1] + [position for position, _holder in ring] + [rng.randrange(_RING_SPACE) for _ in range(500)]
+    for key_hash in probes:
+        owner = ring_owner(ring, key_hash)
+        assert any(start <= key_hash < end for start, end in ranges_for(ring, owner))
+
+
+def test_single_member_owns_everything():
+    ring = build_ring(["solo"], vnodes=4)
+    assert ranges_for(ring, "solo") == [(0, _RING_SPACE)]
+    assert ranges_for([], "solo") == []
+
+
+def test_range_query_matches_ring_owner(session, configs):
+    ring = build_ring(MEMBERS, vnodes=16)
+    seen = set()
+    for member in MEMBERS:
+        owners = {config.owner_id for config in get_all_active_configs(session, ranges_for(ring, member))}
+        assert all(ring_owner(ring, owner_hash(owner_id)) == member for owner_id in owners)
+        assert not owners & seen
+        seen |= owners
+    assert seen == configs
+    assert get_all_active_configs(session, []) == []
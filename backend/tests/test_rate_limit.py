@@ -0,0 +1,52 @@
+from app.database import RateLimitBucket
+from app.rate_limit import DatabaseBucketStore, MemoryBucketStore, TokenBucketLimiter
+
+
+def test_burst_then_retry_after():
+    limiter = TokenBucketLimiter("t", burst=3, period=30, store=MemoryBucketStore())
+    assert [limiter.acquire("u1", now=100.0) for _ in range(3)] == [0, 0, 0]
+    # 每 10 秒补一个令牌
+    assert limiter.acquire("u1", now=100.0) == 10
+    assert limiter.acquire("u1", now=104.5) == 6
+    # 其他 key 不受影响
+    assert limiter.acquire("u2", now=100.0) == 0
+
+
+def test_refill_is_capped_at_burst():
+    limiter = TokenBucketLimiter("t", burst=2, period=10, store=MemoryBucketStore())
+    assert limiter.acquire("u", now=0.0) == 0
+    assert limiter.acquire("u", now=0.0) == 0
+    assert limiter.acquire("u", now=5.0) == 0
+    assert limiter.acquire("u", now=5.0) > 0
+    assert limiter.acquire("u", now=1000.0) == 0
+    assert limiter.acquire("u", now=1000.0) == 0
+    assert limiter.acquire("u", now=1000.0) > 0
+
+
+def test_refund_returns_token():
+    limiter = TokenBucketLimiter("t", burst=1, period=60, store=MemoryBucketStore())
+    assert limiter.acquire("u", now=0.0) == 0
+    assert limiter.acquire("u", now=0.0) > 0
+    limiter.refund("u", now=0.0)
+    assert limiter.acquire("u", now=0.0) == 0
+
+
+def test_memory_store_evicts_idle_and_overflow_keys():
+    store = MemoryBucketStore(max_keys=2)
+    limiter = TokenBucketLimiter("t", burst=1, period=10, store=store)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key, now=0.0)
+    assert list(store._buckets) == ["t:b", "t:c"]
+    assert store.purge("t:", idle_before=1.0) == 2
+    assert not store._buckets
+
+
+def test_database_store_is_shared(session):
+    first = TokenBucketLimiter("db", burst=2, period=20, store=DatabaseBucketStore())
+    second = TokenBucketLimiter("db", burst=2, period=20, store=DatabaseBucketStore())
+    assert first.acquire("u", now=50.0) == 0
+    assert second.acquire("u", now=50.0) == 0
+    assert first.acquire("u", now=50.0) == 10
+    second.refund("u", now=50.0)
+    assert first.acquire("u", now=50.0) == 0
+    assert session.get(RateLimitBucket, "db:u") is not None
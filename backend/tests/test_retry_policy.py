@@ -0,0 +1,84 @@
+import socket
+
+import httpx
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from app.core import _sign_retryable
+from app.retry_policy import RetryPolicy, is_connect_error, is_transient_error
+from app.upstream_governor import UpstreamRejected
+
+
+def _http_error(status_code: int) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _refused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_transient_errors():
+    assert is_transient_error(requests.exceptions.ConnectionError())
+    assert is_transient_error(requests.exceptions.ReadTimeout())
+    assert is_transient_error(httpx.ReadTimeout("timeout"))
+    assert is_transient_error(_http_error(503))
+    assert is_transient_error(_http_error(429))
+    assert not is_transient_error(_http_error(404))
+    assert not is_transient_error(UpstreamRejected("busy", 1))
+    assert not is_transient_error(ValueError("bad json"))
+
+
+def test_connect_errors_from_real_refused_connection():
+    with pytest.raises(requests.exceptions.ConnectionError) as excinfo:
+        requests.get(f"http://127.0.0.1:{_refused_port()}/", timeout=2)
+    assert is_connect_error(excinfo.value)
+
+
+def test_connect_error_classification():
+    refused = NewConnectionError(None, "Connection refused")
+    assert is_connect_error(requests.exceptions.ConnectionError(MaxRetryError(None, "/", reason=refused)))
+    assert is_connect_error(requests.exceptions.ConnectTimeout())
+    assert is_connect_error(httpx.ConnectError("refused"))
+    # 请求可能已经发出：连接中途断开、TLS 错误、读超时
+    reset = ProtocolError("Connection aborted.", ConnectionResetError())
+    assert not is_connect_error(requests.exceptions.ConnectionError(reset))
+    assert not is_connect_error(requests.exceptions.ConnectionError("NewConnectionError in message only"))
+    assert not is_connect_error(requests.exceptions.SSLError(MaxRetryError(None, "/", reason=refused)))
+    assert not is_connect_error(requests.exceptions.ReadTimeout())
+    assert not is_connect_error(httpx.ReadError("reset"))
+
+
+def test_sign_retryable_only_retries_sign_before_send():
+    timeout = requests.exceptions.ReadTimeout()
+    assert _sign_retryable("getTime", timeout)
+    assert not _sign_retryable("sign", timeout)
+    assert _sign_retryable("sign", requests.exceptions.ConnectTimeout())
+
+
+def test_policy_retries_transient_errors_only():
+    policy = RetryPolicy("test", attempts=3, deadline=30, base_delay=0.01, max_delay=0.01)
+    calls = []
+
+    def flaky(_timeout):
+        calls.append(_timeout)
+        if len(calls) < 3:
+            raise requests.exceptions.ConnectionError()
+        return "ok"
+
+    assert policy.call(flaky) == "ok"
+    assert len(calls) == 3
+
+    calls.clear()
+
+    def rejected(_timeout):
+        calls.append(_timeout)
+        raise UpstreamRejected("busy", 1)
+
+    with pytest.raises(UpstreamRejected):
+        policy.call(rejected)
+    assert len(calls) == 1
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import route_guard
+from app.route_guard import RouteDeadlineExceeded, RouteGuard, run_parse_flow
+
+
+def test_detached_call_finishes_and_holds_slot(monkeypatch):
+    monkeypatch.setattr(route_guard, "ROUTE_QUEUE_WAIT_SECONDS", 0.01)
+    guard = RouteGuard("test", concurrency=1, deadline=0.05)
+    recorded = []
+
+    async def checkin():
+        await asyncio.sleep(0.2)
+        recorded.append("signed")
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(RouteDeadlineExceeded):
+            await guard.run_detached(checkin())
+        # 超时的调用仍在后台执行并占用名额
+        with pytest.raises(HTTPException) as excinfo:
+            await guard.run(asyncio.sleep(0))
+        assert excinfo.value.status_code == 503
+        await asyncio.sleep(0.3)
+        assert recorded == ["signed"]
+        assert await guard.run_detached(asyncio.sleep(0, result="next")) == "next"
+
+    asyncio.run(scenario())
+
+
+def test_parse_thread_keeps_slot_until_it_returns(monkeypatch):
+    monkeypatch.setattr(route_guard, "ROUTE_QUEUE_WAIT_SECONDS", 0.01)
+    guard = RouteGuard("parse", concurrency=1, deadline=0.05)
+    finished = threading.Event()
+
+    def slow_parse():
+        time.sleep(0.2)
+        finished.set()
+
+    async def scenario():
+        with pytest.raises(RouteDeadlineExceeded):
+            await guard.run_detached(run_parse_flow(slow_parse))
+        with pytest.raises(HTTPException):
+            await guard.run_detached(run_parse_flow(slow_parse))
+        await asyncio.sleep(0.3)
+        assert finished.is_set()
+        assert guard._semaphore()._value == 1
+
+    asyncio.run(scenario())
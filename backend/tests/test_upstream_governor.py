@@ -0,0 +1,163 @@
+import asyncio
+import types
+
+import httpx
+import pytest
+
+from app import core, upstream_governor
+from app.upstream_governor import (
+    BREAKER_CLOSED,
+    BREAKER_HALF_OPEN,
+    BREAKER_OPEN,
+    CircuitBreaker,
+    UpstreamGovernor,
+    UpstreamRejected,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(upstream_governor, "time", types.SimpleNamespace(monotonic=fake.monotonic, sleep=fake.sleep))
+    monkeypatch.setattr(upstream_governor, "BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(upstream_governor, "BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(upstream_governor, "BREAKER_COOLDOWN_SECONDS", 15.0)
+    monkeypatch.setattr(upstream_governor, "BREAKER_WINDOW_SECONDS", 30)
+    monkeypatch.setattr(upstream_governor, "BREAKER_PROBES", 1)
+    return fake
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for ok in (True, True, False, False):
+        breaker.record(ok, probe=False)
+    assert breaker.state == BREAKER_OPEN
+
+
+def test_opens_at_error_rate_after_min_requests(clock):
+    breaker = CircuitBreaker("h")
+    for ok in (False, False, False):
+        breaker.record(ok, probe=False)
+    assert breaker.state == BREAKER_CLOSED
+    breaker.record(True, probe=False)
+    breaker.record(False, probe=False)
+    assert breaker.state == BREAKER_OPEN
+    with pytest.raises(UpstreamRejected) as excinfo:
+        breaker.admit()
+    assert excinfo.value.retry_after == 15
+
+
+def test_window_drops_old_failures(clock):
+    breaker = CircuitBreaker("h")
+    for _ in range(3):
+        breaker.record(False, probe=False)
+    clock.now += 31
+    for _ in range(3):
+        breaker.record(True, probe=False)
+    breaker.record(False, probe=False)
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.snapshot()["window_requests"] == 4
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("h")
+    _open(breaker)
+    clock.now += 15
+    breaker.check()
+    assert breaker.admit() is True
+    assert breaker.state == BREAKER_HALF_OPEN
+    # 探测名额用尽时其他请求继续快速失败
+    with pytest.raises(UpstreamRejected):
+        breaker.admit()
+    breaker.record(True, probe=True)
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.admit() is False
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("h")
+    _open(breaker)
+    clock.now += 15
+    assert breaker.admit() is True
+    breaker.record(False, probe=True)
+    assert breaker.state == BREAKER_OPEN
+    with pytest.raises(UpstreamRejected):
+        breaker.check()
+
+
+class _CancelledTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        raise asyncio.CancelledError()
+
+
+class _FailingTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        raise httpx.ConnectError("refused", request=request)
+
+
+class _StatusTransport(httpx.AsyncBaseTransport):
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+    async def handle_async_request(self, request):
+        return httpx.Response(self.status_code, request=request)
+
+
+def test_cancelled_probe_releases_slot(clock, monkeypatch):
+    governor = UpstreamGovernor()
+    monkeypatch.setattr(core, "traceint_governor", governor)
+    breaker = governor._breaker("wechat.v2.traceint.com")
+    _open(breaker)
+    clock.now += 15
+    request = httpx.Request("POST", "https://wechat.v2.traceint.com/index.php/graphql/")
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(core._GovernedTransport(_CancelledTransport()).handle_async_request(request))
+    # 被取消的探测既不算成功也不算失败，只归还名额，下一个请求可以立即探测
+    assert breaker.state == BREAKER_HALF_OPEN
+    assert breaker._probes == 0
+
+    response = asyncio.run(core._GovernedTransport(_StatusTransport(200)).handle_async_request(request))
+    assert response.status_code == 200
+    assert breaker.state == BREAKER_CLOSED
+
+
+def test_only_upstream_failures_open_the_breaker(clock, monkeypatch):
+    governor = UpstreamGovernor()
+    monkeypatch.setattr(core, "traceint_governor", governor)
+    breaker = governor._breaker("wechat.v2.traceint.com")
+    request = httpx.Request("POST", "https://wechat.v2.traceint.com/index.php/graphql/")
+
+    # 本地取消（路由截止时间、客户端断开）不计入统计
+    for _ in range(10):
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(core._GovernedTransport(_CancelledTransport()).handle_async_request(request))
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.snapshot()["window_requests"] == 0
+
+    asyncio.run(core._GovernedTransport(_StatusTransport(200)).handle_async_request(request))
+    asyncio.run(core._GovernedTransport(_StatusTransport(503)).handle_async_request(request))
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(core._GovernedTransport(_FailingTransport()).handle_async_request(request))
+    assert breaker.state == BREAKER_OPEN
+
+
+def test_governor_counts_rejections(clock):
+    governor = UpstreamGovernor()
+    _open(governor._breaker("wechat.v2.traceint.com"))
+    with pytest.raises(UpstreamRejected):
+        governor.acquire("https://wechat.v2.traceint.com/index.php/graphql/")
+    # 非 Traceint 主机不受管控
+    assert governor.acquire("https://example.com/") is None
+    assert governor.snapshot()["rejected"]["circuit"] == 1
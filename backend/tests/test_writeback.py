@@ -0,0 +1,83 @@
+from datetime import datetime
+
+from sqlmodel import Session, select
+
+from app.database import ActivityEvent, Config, User, engine
+from app.writeback import ConfigOutcome, ResultWriter
+
+
+def test_merge_keeps_latest_values_and_first_rotation():
+    first = ConfigOutcome(config_id=1, owner_id=7, last_log="first", rotate_from="s0", rotate_to="s1")
+    first.merge(ConfigOutcome(config_id=1, last_keepalive=datetime(2026, 1, 1), rotate_from="s1", rotate_to="s2"))
+    first.merge(ConfigOutcome(config_id=2, last_log="second"))
+    assert first.config_id == 1
+    assert first.owner_id == 7
+    assert first.last_log == "second"
+    assert first.last_keepalive == datetime(2026, 1, 1)
+    # 两次轮换合并为 s0 -> s2，仍以库中最初的值为前提
+    assert (first.rotate_from, first.rotate_to) == ("s0", "s2")
+
+
+def _config(session, session_id="s0"):
+    session.add(User(id=1, username="u", password_hash="x"))
+    config = Config(owner_id=1, session_id=session_id, major=1, minor=1)
+    session.add(config)
+    session.commit()
+    session.refresh(config)
+    return config.id
+
+
+def _reload(config_id):
+    with Session(engine) as fresh:
+        return fresh.get(Config, config_id)
+
+
+def test_flush_merges_outcomes_and_rotates(session):
+    config_id = _config(session)
+    writer = ResultWriter(batch_size=100, flush_interval=60)
+    writer.submit(ConfigOutcome(config_id=config_id, last_log="a", rotate_from="s0", rotate_to="s1"))
+    writer.submit(ConfigOutcome(config_id=config_id, last_checkin_result="ok", rotate_from="s1", rotate_to="s2"))
+    writer.submit_event(1, "keepalive", True, "ok")
+    assert writer.flush() == 1
+    writer.stop()
+
+    config = _reload(config_id)
+    assert (config.session_id, config.last_log, config.last_checkin_result) == ("s2", "a", "ok")
+    assert config.version > 0
+    assert len(session.exec(select(ActivityEvent)).all()) == 1
+
+
+def test_rotation_skipped_when_user_saved_new_session(session):
+    config_id = _config(session)
+    # 用户在结果写回前保存了新的 session_id
+    config = session.get(Config, config_id)
+    config.session_id = "user-new"
+    session.add(config)
+    session.commit()
+
+    writer = ResultWriter(batch_size=100, flush_interval=60)
+    writer._write({config_id: ConfigOutcome(config_id=config_id, last_log="kept", rotate_from="s0", rotate_to="s1")}, [])
+    config = _reload(config_id)
+    assert (config.session_id, config.last_log) == ("user-new", "kept")
+
+
+def test_failed_flush_keeps_results_and_caps_events(monkeypatch):
+    writer = ResultWriter(batch_size=100, flush_interval=60, max_events=3)
+
+    def failing_write(batch, events):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(writer, "_write", failing_write)
+    writer.submit(ConfigOutcome(config_id=1, last_log="old"))
+    for index in range(5):
+        writer.submit_event(1, "keepalive", True, str(index))
+    assert writer.flush() == 0
+    writer.submit(ConfigOutcome(config_id=1, last_log="new"))
+    writer.submit_event(1, "keepalive", True, "5")
+    writer._stopping.set()
+    writer._wake.set()
+
+    assert writer._pending[1].last_log == "new"
+    assert [event["message"] for event in writer._events] == ["3", "4", "5"]
+    assert writer._failures == 1
+    assert writer._retry_at > 0
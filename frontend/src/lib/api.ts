@@ -92,6 +92,26 @@ export interface AdminUserConfig {
   wechat_avatar?: string | null;
 }
 
+export type AdminUserStatusFilter = 'active' | 'logged_out' | 'unconfigured';
+
+export interface AdminUserListParams {
+  limit?: number;
+  cursor?: string | null;
+  status?: AdminUserStatusFilter;
+  school?: string;
+  configured?: boolean;
+  sort?: 'id' | 'username' | 'created_at' | 'last_checkin';
+  order?: 'asc' | 'desc';
+  with_total?: boolean;
+}
+
+export interface AdminUserListResponse {
+  items: AdminUserConfig[];
+  next_cursor: string | null;
+  // 仅首页返回总数，翻页时为 null
+  total: number | null;
+}
+
 export interface WechatProfilePayload {
   traceint_user_id?: number | null;
   nick?: string | null;
@@ -204,8 +224,8 @@ export const disableAutoCheckIn = async () => {
 
 // ============ Admin API ============
 
-export const getAdminUsers = async () => {
-  const res = await api.get<AdminUserConfig[]>('/admin/users');
+export const getAdminUsers = async (params: AdminUserListParams = {}) => {
+  const res = await api.get<AdminUserListResponse>('/admin/users', { params });
   return res.data;
 };
 
@@ -9,7 +9,7 @@ import {
   publishAdminAnnouncement,
   unpublishAdminAnnouncement,
 } from '../../lib/api';
-import type { AdminUserConfig, AdminAnnouncementData } from '../../lib/api';
+import type { AdminUserConfig, AdminAnnouncementData, AdminUserStatusFilter } from '../../lib/api';
 import {
   Trash2,
   LogOut,
@@ -27,8 +27,14 @@ import {
 import { useNavigate } from 'react-router-dom';
 import { AnnouncementMarkdown } from '../../components/AnnouncementMarkdown';
 
+const USERS_PAGE_SIZE = 50;
+
 export default function AdminDashboard() {
   const [users, setUsers] = useState<AdminUserConfig[]>([]);
+  const [usersTotal, setUsersTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [statusFilter, setStatusFilter] = useState<AdminUserStatusFilter | ''>('');
+  const [loadingMore, setLoadingMore] = useState(false);
   const [announcement, setAnnouncement] = useState<AdminAnnouncementData | null>(null);
   const [draftContent, setDraftContent] = useState('');
   const [loading, setLoading] = useState(true);
@@ -52,9 +58,38 @@ export default function AdminDashboard() {
     window.setTimeout(() => setMessage(null), 3000);
   };
 
-  const fetchUsers = async () => {
-    const data = await getAdminUsers();
-    setUsers(data);
+  const fetchUsers = async (status: AdminUserStatusFilter | '' = statusFilter) => {
+    const data = await getAdminUsers({ limit: USERS_PAGE_SIZE, status: status || undefined });
+    setUsers(data.items);
+    setUsersTotal(data.total ?? 0);
+    setNextCursor(data.next_cursor);
+  };
+
+  const handleLoadMoreUsers = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const data = await getAdminUsers({
+        limit: USERS_PAGE_SIZE,
+        cursor: nextCursor,
+        status: statusFilter || undefined,
+      });
+      setUsers((prev) => [...prev, ...data.items]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      showMessage({ type: 'error', text: getErrorMessage(error, '加载用户失败') });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleStatusFilterChange = async (status: AdminUserStatusFilter | '') => {
+    setStatusFilter(status);
+    try {
+      await fetchUsers(status);
+    } catch (error) {
+      showMessage({ type: 'error', text: getErrorMessage(error, '加载用户失败') });
+    }
   };
 
   const fetchAnnouncement = async () => {
@@ -82,6 +117,7 @@ export default function AdminDashboard() {
     try {
       await deleteAdminUser(userId);
       setUsers((prev) => prev.filter((user) => user.user_id !== userId));
+      setUsersTotal((prev) => Math.max(0, prev - 1));
       showMessage({ type: 'success', text: '用户已删除' });
     } catch (error) {
       showMessage({ type: 'error', text: getErrorMessage(error, '删除失败') });
@@ -153,7 +189,7 @@ export default function AdminDashboard() {
             <h1 className="text-2xl font-bold text-slate-800">管理员后台</h1>
           </div>
           <div className="text-sm text-slate-500">
-            共 {users.length} 位用户
+            共 {usersTotal} 位用户
           </div>
         </div>
 
@@ -297,7 +333,20 @@ export default function AdminDashboard() {
             <section className="bg-white rounded-xl shadow-sm overflow-hidden border border-slate-100">
               <div className="px-6 py-5 border-b border-slate-100 flex items-center justify-between gap-4">
                 <h2 className="text-lg font-semibold text-slate-800">用户管理</h2>
-                <div className="text-sm text-slate-500">共 {users.length} 位用户</div>
+                <div className="flex items-center gap-3">
+                  <select
+                    value={statusFilter}
+                    onChange={(event) => handleStatusFilterChange(event.target.value as AdminUserStatusFilter | '')}
+                    className="text-sm border border-slate-200 rounded-lg px-2 py-1 text-slate-600 bg-white"
+                    aria-label="按运行状态筛选"
+                  >
+                    <option value="">全部状态</option>
+                    <option value="active">活跃</option>
+                    <option value="logged_out">已登出</option>
+                    <option value="unconfigured">未配置</option>
+                  </select>
+                  <div className="text-sm text-slate-500">共 {usersTotal} 位用户</div>
+                </div>
               </div>
               <div className="overflow-x-auto">
                 <table className="w-full text-left">
@@ -394,6 +443,17 @@ export default function AdminDashboard() {
                   </tbody>
                 </table>
               </div>
+              {nextCursor && (
+                <div className="px-6 py-4 border-t border-slate-100 text-center">
+                  <button
+                    onClick={handleLoadMoreUsers}
+                    disabled={loadingMore}
+                    className="text-sm text-slate-600 hover:text-slate-800 disabled:opacity-50"
+                  >
+                    {loadingMore ? '加载中…' : `加载更多（已显示 ${users.length} / ${usersTotal}）`}
+                  </button>
+                </div>
+              )}
             </section>
           </>
         )}